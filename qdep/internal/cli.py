@@ -1,9 +1,15 @@
 import argparse
+import os
+import sys
+import time
+from os import path
+from collections import OrderedDict
 
-import argcomplete
+from qdep.qdep import version
 
-from qdep.qdep import *
-from qdep.internal.private import *
+
+# commands that are forwarded to a running qdep daemon - see qdep.internal.daemon
+forwarded_operations = ["dephash", "pkgresolve", "resolve-tree"]
 
 
 def complete_path(prefix, filter_fn):
@@ -67,69 +73,175 @@ def pri_completer(prefix, **kwargs):
 	return complete_suffix(prefix, ".pri")
 
 
-def main():
-	parser = argparse.ArgumentParser(description="A very basic yet simple to use dependency management tool for qmake based projects.")
-	parser.add_argument("--version", action="version", version=version)
-	parser.add_argument("--trace", action="store_true", help="In case of an exception, print the whole stack trace")
+def lock_completer(prefix, **kwargs):
+	return complete_suffix(prefix, ".lock")
 
-	sub_args = parser.add_subparsers(dest="operation", title="Operations", metavar="{operation}")
 
+# global options that take a value - needed to find the operation without parsing the command line
+global_value_options = ["--ref-ttl"]
+
+
+def find_operation(argv):
+	skip_value = False
+	for arg in argv:
+		if skip_value:
+			skip_value = False
+		elif arg in global_value_options:
+			skip_value = True
+		elif not arg.startswith("-"):
+			return arg
+	return None
+
+
+def add_prfgen_parser(sub_args):
 	prfgen_parser = sub_args.add_parser("prfgen", help="Generate a qmake project feature (prf) for the given qmake.")
 	prfgen_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to place the prf file for.").completer = qmake_completer
 	prfgen_parser.add_argument("-d", "--dir", dest="dir", action="store", help="The directory containing the mkspec folder where to place the prf file. If not specified, qmake is queried form the location.").completer = dir_completer
 
+
+def add_init_parser(sub_args):
 	init_parser = sub_args.add_parser("init", help="Initialize a pro file to use qdep by adding the required lines.")
 	init_parser.add_argument("profile", help="The path to the pro file to add the qdep code to.").completer = pro_completer
 
+
+def add_lupdate_parser(sub_args):
 	lupdate_parser = sub_args.add_parser("lupdate", help="Run lupdate for the QDEP_TRANSLATION variable in a given pri file.")
 	lupdate_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to find the corresponding lupdate for.").completer = qmake_completer
 	lupdate_parser.add_argument("--pri-file", dest="pri_path", action="store", required=True, help="The path to the pri-file that contains a QDEP_TRANSLATIONS variable, to generate translations for.").completer = pri_completer
 	lupdate_parser.add_argument("largs", action="store", nargs="*", metavar="lupdate-argument", help="Additionals arguments to be passed to lupdate. MUST be proceeded by '--'!")
 
+
+def add_clear_parser(sub_args):
 	clear_parser = sub_args.add_parser("clear", help="Remove all sources from the users global cache.")
 	clear_parser.add_argument("-y", "--yes", dest="yes", action="store_true", help="Immediatly remove the caches, without asking for confirmation first.")
 
-	versions_parser = sub_args.add_parser("versions", help="List all known versions/tags of the given package")
+
+def add_cache_parser(sub_args):
+	cache_parser = sub_args.add_parser("cache", help="Manage the users global source cache.")
+	cache_args = cache_parser.add_subparsers(dest="cache_operation", title="Cache operations", metavar="{cache-operation}")
+	cache_args.required = True
+
+	migrate_parser = cache_args.add_parser("migrate", help="Move sources cached by older qdep versions into the current cache layout, which shares the git objects of all versions of a package.")
+	migrate_parser.add_argument("--no-fetch", dest="fetch", action="store_false", help="Only remove the old sources instead of downloading them into the new layout.")
+
+	gc_parser = cache_args.add_parser("gc", help="Remove the least recently used sources from the cache. Sources that are currently used by other qdep instances are kept.")
+	gc_parser.add_argument("--max-size", dest="max_size", action="store", help="The size the cache should be reduced to, like 500M or 10G. Defaults to the QDEP_CACHE_MAX_SIZE environment variable if neither this nor --max-age are given.")
+	gc_parser.add_argument("--max-age", dest="max_age", action="store", type=float, metavar="DAYS", help="Remove all sources that were not used for the given number of days.")
+	gc_parser.add_argument("-n", "--dry-run", dest="dry_run", action="store_true", help="Only print what would be removed.")
+
+	list_parser = cache_args.add_parser("list", help="List all cached package versions with their commit, size and usage times.")
+	list_parser.add_argument("--rebuild", action="store_true", help="Scan the cache directories again instead of answering from the cache index.")
+	list_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of cache entries to scan in parallel when rebuilding the index.")
+
+	stats_parser = cache_args.add_parser("stats", help="Print the number of cached packages and versions and their sizes.")
+	stats_parser.add_argument("--rebuild", action="store_true", help="Scan the cache directories again instead of answering from the cache index.")
+	stats_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of cache entries to scan in parallel when rebuilding the index.")
+
+
+def add_trace_parser(sub_args):
+	trace_parser = sub_args.add_parser("trace", help="Evaluate traces recorded by setting the QDEP_TRACE environment variable to a file path.")
+	trace_args = trace_parser.add_subparsers(dest="trace_operation", title="Trace operations", metavar="{trace-operation}")
+	trace_args.required = True
+
+	report_parser = trace_args.add_parser("report", help="Print the number of calls and the time spent per qdep command and per process started by qdep.")
+	report_parser.add_argument("--chrome", action="store", metavar="FILE", help="Also export the trace as chrome trace event json, which can be opened in chrome://tracing or perfetto.")
+	report_parser.add_argument("trace_file", action="store", nargs="?", help="The trace file to evaluate. Defaults to the QDEP_TRACE environment variable.")
+
+
+def add_versions_parser(sub_args):
+	versions_parser = sub_args.add_parser("versions", help="List all known versions/tags of the given packages")
 	versions_parser.add_argument("-b", "--branches", dest="branches", action="store_true", help="Include branches into the output.")
 	versions_parser.add_argument("--no-tags", dest="tags", action="store_false", help="Exclude tags from the output.")
 	versions_parser.add_argument("-s", "--short", dest="short", action="store_true", help="Print output as a single, uncommented line")
 	versions_parser.add_argument("--limit", action="store", type=int, help="Limit the returned lists to the LIMIT newest entries per type.")
-	versions_parser.add_argument("package", help="The package to list the versions for. Specify without a version of pro/pri file path!")
+	versions_parser.add_argument("--json", dest="json_output", action="store_true", help="Print one json object per package instead, as soon as its versions are known.")
+	versions_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of remotes to query in parallel. Defaults to the QDEP_JOBS environment variable or a value based on the CPU count.")
+	versions_parser.add_argument("packages", metavar="package", nargs="+", help="The packages to list the versions for. Specify without a version of pro/pri file path! Packages are printed in the order their remotes reply.")
+
 
-	query_parser = sub_args.add_parser("query", help="Query details about a given package identifier")
+def add_query_parser(sub_args):
+	query_parser = sub_args.add_parser("query", help="Query details about the given package identifiers")
 	query_parser.add_argument("--expand", action="store_true", help="Only expand the package name, don't output anything else.")
 	query_parser.add_argument("--no-check", dest="check", action="store_false", help="Do not check if the package actually exists.")
 	query_parser.add_argument("--versions", action="store_true", help="Also query and display all available tags and branches. See 'qdep.py versions' for alternative formats.")
-	query_parser.add_argument("package", help="The package to query information for.")
+	query_parser.add_argument("--json", dest="json_output", action="store_true", help="Print one json object per package instead, as soon as its details are known.")
+	query_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of remotes to query in parallel. Defaults to the QDEP_JOBS environment variable or a value based on the CPU count.")
+	query_parser.add_argument("packages", metavar="package", nargs="+", help="The packages to query information for. Packages are printed in the order their remotes reply.")
+
 
+def add_get_parser(sub_args):
 	get_parser = sub_args.add_parser("get", help="Download the sources of one ore more packages into the source cache.")
 	get_parser.add_argument("--extract", action="store_true", help="Run in pro-file mode. Arguments are interpreted as pro files and are scanned for dependencies")
 	get_parser.add_argument("--eval", action="store_true", help="Fully evaluate all pro files by running qmake on them. Implies '--extract'.")
 	get_parser.add_argument("--no-recurse", dest="recurse", action="store_false", help="Do not scan downloaded packages for further dependencies.")
 	get_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to use for evaluation if '--eval' was specified.").completer = qmake_completer
 	get_parser.add_argument("--make", action="store", default="make", help="The path to a make executable to use for evaluation if '--eval' was specified.").completer = make_completer
+	get_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of packages to download and scan for dependencies in parallel. With '--eval', the number of pro files to evaluate in parallel, which is also passed to make. Defaults to the QDEP_JOBS environment variable or a value based on the CPU count.")
+	get_parser.add_argument("--lock-file", dest="lock_file", action="store", help="A qdep.lock file to download locked packages from, instead of querying their remotes.").completer = lock_completer
+	get_parser.add_argument("--frozen", action="store_true", help="Fail if a package is not in the lock file or its locked commit is not in the cache, instead of accessing the network.")
 	get_parser.add_argument("-d", "--dir", "--cache-dir", dest="dir", action="store", help="Specify the directory where to download the sources to. Shorthand for using the QDEP_CACHE_DIR environment variable.").completer = dir_completer
 	get_parser.add_argument("args", nargs="+", help="The packages (or pro files if using '--extract') to download the sources for.").completer = pro_completer
 
+
+def add_update_parser(sub_args):
 	update_parser = sub_args.add_parser("update", help="Check for newer versions of used packages and optionally update them.")
 	update_parser.add_argument("--eval", action="store_true", help="Fully evaluate all pro files by running qmake on them.")
 	update_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to use for evaluation if '--eval' was specified.").completer = qmake_completer
 	update_parser.add_argument("--make", action="store", default="make", help="The path to a make executable to use for evaluation if '--eval' was specified.").completer = make_completer
+	update_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of remotes to check for new versions in parallel. With '--eval', also passed to make to evaluate sub projects in parallel. Defaults to the QDEP_JOBS environment variable or a value based on the CPU count.")
 	update_parser.add_argument("--replace", action="store_true", help="Automatically replace newer packages in the evaluated project files instead of printing to the console.")
 	update_parser.add_argument("profile", metavar="pro-file", help="The qmake pro-file to update dependencies for.").completer = pro_completer
 
+
+def add_lock_parser(sub_args):
+	lock_parser = sub_args.add_parser("lock", help="Record the exact commits of all dependencies of a project in a lock file.")
+	lock_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to extract dependencies from files that cannot be read without qmake.").completer = qmake_completer
+	lock_parser.add_argument("-o", "--output", action="store", help="The lock file to write. Defaults to qdep.lock next to the pro-file.").completer = lock_completer
+	lock_parser.add_argument("profile", metavar="pro-file", help="The qmake pro-file to lock the dependencies of.").completer = pro_completer
+
+
+def add_serve_parser(sub_args):
+	serve_parser = sub_args.add_parser("serve", help="Run a daemon that answers the internal qmake-time commands, instead of starting a new process for each.")
+	serve_parser.add_argument("--socket", action="store", help="The path of the unix socket to listen on. Defaults to the QDEP_DAEMON_SOCKET environment variable or 'qdep.sock' in the cache directory.")
+	serve_parser.add_argument("--ttl", action="store", type=int, default=60, help="The number of seconds remote ref listings are kept in memory before being queried again.")
+
+
+def add_dephash_parser(sub_args):
 	dephash_parser = sub_args.add_parser("dephash", help="[INTERNAL] Generated unique identifying hashes for qdep packages.")
 	dephash_parser.add_argument("--project", action="store_true", help="Interpret input as a project dependency, not a normal pri dependency.")
 	dephash_parser.add_argument("--pkgpath", action="store_true", help="Return the hash and the pro/pri subpath as tuple, seperated by a ';'.")
 	dephash_parser.add_argument("input", action="store", nargs="*", metavar="package", help="The packages to generate hashes for.")
 
+
+def add_pkgresolve_parser(sub_args):
 	pkgresolve_parser = sub_args.add_parser("pkgresolve", help="[INTERNAL] Download the given qdep package and extract relevant information from it.")
 	pkgresolve_parser.add_argument("--no-pull", dest="pull", action="store_false", help="Do not update existing packages that are based on branches instead of tags.")
+	pkgresolve_parser.add_argument("--pull-interval", dest="pull_interval", action="store", type=int, metavar="SECONDS", help="Do not check branch based packages for updates if they were last fetched less than SECONDS ago. Defaults to the QDEP_PULL_INTERVAL environment variable or 0.")
 	pkgresolve_parser.add_argument("--no-clone", dest="clone", action="store_false", help="Do not allow installation of new packages. Trying so will lead to an error. Updating existing packages is still possible.")
+	pkgresolve_parser.add_argument("--lock-file", dest="lock_file", action="store", help="A qdep.lock file to resolve locked packages from, instead of querying their remotes.")
+	pkgresolve_parser.add_argument("--frozen", action="store_true", help="Fail if a package is not in the lock file or its locked commit is not in the cache, instead of accessing the network.")
 	pkgresolve_parser.add_argument("--project", dest="project", action="store_true", help="Interpret input as a project dependency, not a normal pri dependency")
-	pkgresolve_parser.add_argument("package", action="store", metavar="package", help="The package identifier of the package to be downloaded and resolved.")
-	pkgresolve_parser.add_argument("version", action="store", nargs="?", metavar="latest-version", help="The previously cached version for packages with no version identifier.")
-
+	pkgresolve_parser.add_argument("--batch", action="store_true", help="Resolve many packages at once. Arguments are interpreted as pairs of package and latest-version, with an empty latest-version for packages that have none cached. One block of results is printed per pair.")
+	pkgresolve_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of packages to download in parallel in batch mode. Defaults to the QDEP_JOBS environment variable or a value based on the CPU count.")
+	pkgresolve_parser.add_argument("args", action="store", nargs="+", metavar="package [latest-version]", help="The package identifier of the package to be downloaded and resolved, optionally followed by the previously cached version for packages with no version identifier.")
+
+
+def add_resolvetree_parser(sub_args):
+	resolvetree_parser = sub_args.add_parser("resolve-tree", help="[INTERNAL] Download the given qdep packages and all their dependencies and generate a pri file that describes the resolved tree.")
+	resolvetree_parser.add_argument("--qmake", action="store", default="qmake", help="The path to a qmake executable to read package files with, if they cannot be read without qmake.").completer = qmake_completer
+	resolvetree_parser.add_argument("--no-pull", dest="pull", action="store_false", help="Do not update existing packages that are based on branches instead of tags.")
+	resolvetree_parser.add_argument("--pull-interval", dest="pull_interval", action="store", type=int, metavar="SECONDS", help="Do not check branch based packages for updates if they were last fetched less than SECONDS ago. Defaults to the QDEP_PULL_INTERVAL environment variable or 0.")
+	resolvetree_parser.add_argument("--no-clone", dest="clone", action="store_false", help="Do not allow installation of new packages. Trying so will lead to an error. Updating existing packages is still possible.")
+	resolvetree_parser.add_argument("--lock-file", dest="lock_file", action="store", help="A qdep.lock file to resolve locked packages from, instead of querying their remotes.")
+	resolvetree_parser.add_argument("--frozen", action="store_true", help="Fail if a package is not in the lock file or its locked commit is not in the cache, instead of accessing the network.")
+	resolvetree_parser.add_argument("--included", action="append", nargs=2, metavar=("hash", "package"), help="A package that has already been included, by its hash and the package identifier it was included as. Can be specified multiple times.")
+	resolvetree_parser.add_argument("--cache-file", dest="cache_files", action="append", metavar="file", help="A qmake cache file to read the previously cached versions of packages with no version identifier from. Can be specified multiple times, later files take precedence.")
+	resolvetree_parser.add_argument("--known", action="append", metavar="hash=version", help="The version of a package with no version identifier that is already set in the project, by the package hash. Takes precedence over the cache files. Can be specified multiple times.")
+	resolvetree_parser.add_argument("outfile", action="store", help="The path to the pri file to be generated.")
+	resolvetree_parser.add_argument("packages", action="store", nargs="*", metavar="package", help="The package identifiers of the direct dependencies to be resolved.")
+
+
+def add_hookgen_parser(sub_args):
 	hookgen_parser = sub_args.add_parser("hookgen", help="[INTERNAL] Generate a header file with a method to load all resource hooks.")
 	hookgen_parser.add_argument("--hooks", action="store", nargs="*", help="The names of additional hook functions to be referenced.")
 	hookgen_parser.add_argument("prefix", action="store", help="The target name to use as part of the generated hook method.")
@@ -137,55 +249,193 @@ def main():
 	hookgen_parser.add_argument("dummy", action="store", metavar="pro-file", help="The path to the current pro file - needed for Makefile rules.")
 	hookgen_parser.add_argument("resources", action="store", nargs="*", metavar="resource", help="Paths to the resource-files to generate the hooks for.")
 
+
+def add_hookimp_parser(sub_args):
 	hookimp_parser = sub_args.add_parser("hookimp", help="[INTERNAL] Generate a source file that includes and runs all qdep hooks as normal startup hook.")
 	hookimp_parser.add_argument("--hooks", action="store", nargs="*", help="The names of additional hook functions to be referenced.")
 	hookimp_parser.add_argument("outfile", action="store", help="The path to the cpp-file to be generated.")
 	hookimp_parser.add_argument("dummy", action="store", metavar="pro-file", help="The path to the current pro file - needed for Makefile rules.")
 	hookimp_parser.add_argument("headers", action="store", nargs="*", metavar="header", help="Paths to the header-files that contain hooks to be run.")
 
+
+def add_lconvert_parser(sub_args):
 	lconvert_parser = sub_args.add_parser("lconvert", help="[INTERNAL] Combine ts files with translations from qdep packages.")
 	lconvert_parser.add_argument("--combine", action="store", nargs="*", help="The qdep ts files that should be combined into the real ones.")
-	lconvert_parser.add_argument("tsfile", action="store", help="The path to the ts file to combine with the qdep ts files.")
-	lconvert_parser.add_argument("outfile", action="store", help="The path to the ts file to be generated.")
-	lconvert_parser.add_argument("largs", action="store", nargs="+", metavar="lconvert-tool", help="Path to the lconvert tool as well as additional arguments to it.")
+	lconvert_parser.add_argument("--outdir", action="store", help="Combine all ts files given via --ts-files at once and generate the results into this directory, instead of combining a single tsfile into outfile.")
+	lconvert_parser.add_argument("--ts-files", dest="ts_files", action="store", nargs="+", default=[], metavar="tsfile", help="The paths to the ts files to combine with the qdep ts files, if --outdir is used.")
+	lconvert_parser.add_argument("--stamp", action="store", help="A file that is updated whenever any of the ts files was generated again, if --outdir is used.")
+	lconvert_parser.add_argument("-j", "--jobs", action="store", type=int, help="The number of lconvert processes to run in parallel, if --outdir is used. Defaults to the number of CPU cores.")
+	lconvert_parser.add_argument("--builtin", action="store_true", help="Merge the files within qdep instead of running the lconvert tool, if only -sort-contexts is passed to it. Files the builtin merge does not support are still combined by lconvert.")
+	lconvert_parser.add_argument("args", action="store", nargs="+", metavar="tsfile outfile lconvert-tool", help="The path to the ts file to combine with the qdep ts files and the path to the ts file to be generated, followed by the path to the lconvert tool as well as additional arguments to it. With --outdir, only the lconvert tool and its arguments are given.")
+
 
+def add_prolink_parser(sub_args):
 	prolink_parser = sub_args.add_parser("prolink", help="[INTERNAL] Resolve the path a linked project dependency would be at.")
 	prolink_parser.add_argument("prodir", action="store", help="The directory of the pro file that includes the other one.")
 	prolink_parser.add_argument("pkghash", action="store", help="The hash identifier of the project to link.")
 	prolink_parser.add_argument("pkgpath", action="store", help="The path to the pro file within the dependency.")
 	prolink_parser.add_argument("--link", action="store", help="Perform the link operation and create the symlink/dirtree, based on the given path to the dependency sources.")
 
-	argcomplete.autocomplete(parser)
-	res = parser.parse_args()
 
+operation_parsers = OrderedDict([
+	("prfgen", add_prfgen_parser),
+	("init", add_init_parser),
+	("lupdate", add_lupdate_parser),
+	("clear", add_clear_parser),
+	("cache", add_cache_parser),
+	("trace", add_trace_parser),
+	("versions", add_versions_parser),
+	("query", add_query_parser),
+	("get", add_get_parser),
+	("update", add_update_parser),
+	("lock", add_lock_parser),
+	("serve", add_serve_parser),
+	("dephash", add_dephash_parser),
+	("pkgresolve", add_pkgresolve_parser),
+	("resolve-tree", add_resolvetree_parser),
+	("hookgen", add_hookgen_parser),
+	("hookimp", add_hookimp_parser),
+	("lconvert", add_lconvert_parser),
+	("prolink", add_prolink_parser)
+])
+
+
+def create_parser(operation=None):
+	parser = argparse.ArgumentParser(description="A very basic yet simple to use dependency management tool for qmake based projects.")
+	parser.add_argument("--version", action="version", version=version)
+	parser.add_argument("--trace", action="store_true", help="In case of an exception, print the whole stack trace")
+	parser.add_argument("--ref-ttl", dest="ref_ttl", action="store", type=int, metavar="SECONDS", help="The number of seconds cached tag and branch listings of remotes are used before they are queried again. Shorthand for using the QDEP_REF_CACHE_TTL environment variable. Use 0 to disable the cache.")
+	parser.add_argument("--refresh", action="store_true", help="Query tag and branch listings of all remotes again instead of using cached ones. Listings fetched during this run are reused.")
+
+	# only build the parser of the operation that is run - all of them are needed for the help and completion
+	sub_args = parser.add_subparsers(dest="operation", title="Operations", metavar="{operation}")
+	if operation in operation_parsers:
+		operation_parsers[operation](sub_args)
+	else:
+		for add_parser in operation_parsers.values():
+			add_parser(sub_args)
+	return parser
+
+
+def main():
+	operation = find_operation(sys.argv[1:])
+
+	# hot internal commands are answered by a running qdep daemon if possible
+	if operation in forwarded_operations:
+		from qdep.internal.daemon import daemon_forward
+		forward_res = daemon_forward(sys.argv[1:], version)
+		if forward_res is not None:
+			return forward_res
+	return run(sys.argv[1:], operation)
+
+
+def run(argv, operation=None):
+	if "_ARGCOMPLETE" in os.environ:
+		import argcomplete
+		parser = create_parser()
+		argcomplete.autocomplete(parser)
+	else:
+		parser = create_parser(operation if operation is not None else find_operation(argv))
+	res = parser.parse_args(argv)
+
+	# passed via the environment so qdep instances run by qmake use the same settings
+	if res.ref_ttl is not None:
+		os.environ["QDEP_REF_CACHE_TTL"] = str(res.ref_ttl)
+	if res.refresh:
+		os.environ["QDEP_REF_CACHE_NOT_BEFORE"] = str(time.time())
+	if os.getenv("QDEP_TRACE"):
+		os.environ["QDEP_TRACE"] = path.abspath(os.environ["QDEP_TRACE"])
+
+	from qdep.internal.trace import trace_command
+	with trace_command(res.operation or "qdep", argv) as span:
+		span["code"] = run_operation(parser, res)
+		return span["code"]
+
+
+def run_operation(parser, res):
 	try:
 		if res.operation == "prfgen":
+			from qdep.qdep import prfgen
 			prfgen(path.abspath(sys.argv[0]), res.qmake, res.dir)
 		elif res.operation == "init":
+			from qdep.qdep import init
 			init(res.profile)
 		elif res.operation == "lupdate":
+			from qdep.qdep import lupdate
 			lupdate(res.pri_path, res.qmake, res.largs)
 		elif res.operation == "clear":
+			from qdep.qdep import clear
 			clear(res.yes)
+		elif res.operation == "cache":
+			if res.cache_operation == "migrate":
+				from qdep.qdep import cache_migrate
+				cache_migrate(res.fetch)
+			elif res.cache_operation == "gc":
+				from qdep.qdep import cache_gc
+				cache_gc(res.max_size, res.max_age, res.dry_run)
+			elif res.cache_operation == "list":
+				from qdep.qdep import cache_list
+				cache_list(res.rebuild, res.jobs)
+			elif res.cache_operation == "stats":
+				from qdep.qdep import cache_stats
+				cache_stats(res.rebuild, res.jobs)
+		elif res.operation == "trace":
+			if res.trace_operation == "report":
+				from qdep.qdep import trace_report
+				trace_report(res.trace_file, res.chrome)
 		elif res.operation == "versions":
-			versions(res.package, res.tags, res.branches, res.short, res.limit)
+			from qdep.qdep import versions
+			versions(*res.packages, tags=res.tags, branches=res.branches, short=res.short, limit=res.limit, json_output=res.json_output, jobs=res.jobs)
 		elif res.operation == "query":
-			query(res.package, res.check, res.versions, res.expand)
+			from qdep.qdep import query
+			query(*res.packages, check=res.check, print_versions=res.versions, expand=res.expand, json_output=res.json_output, jobs=res.jobs)
 		elif res.operation == "get":
-			get(*res.args, extract=res.extract, evaluate=res.eval, recurse=res.recurse, qmake=res.qmake, make=res.make, cache_dir=res.dir)
+			from qdep.qdep import get
+			get(*res.args, extract=res.extract, evaluate=res.eval, recurse=res.recurse, qmake=res.qmake, make=res.make, cache_dir=res.dir, jobs=res.jobs, lock_file=res.lock_file, frozen=res.frozen)
 		elif res.operation == "update":
-			update(res.profile, res.eval, res.replace, res.qmake, res.make)
+			from qdep.qdep import update
+			update(res.profile, res.eval, res.replace, res.qmake, res.make, res.jobs)
+		elif res.operation == "lock":
+			from qdep.qdep import lock
+			lock(res.profile, res.qmake, res.output)
+		elif res.operation == "serve":
+			from qdep.internal.server import serve
+			serve(version, run, res.socket, res.ttl)
 		elif res.operation == "dephash":
+			from qdep.internal.private import dephash
 			dephash(*res.input, project=res.project, pkgpath=res.pkgpath)
 		elif res.operation == "pkgresolve":
-			pkgresolve(res.package, res.version, res.project, res.pull, res.clone)
+			from qdep.internal.private import pkgresolve
+			if res.batch:
+				if len(res.args) % 2 != 0:
+					raise Exception("pkgresolve --batch expects pairs of package and latest-version")
+				pkg_args = [(res.args[i], res.args[i + 1] if len(res.args[i + 1]) > 0 else None) for i in range(0, len(res.args), 2)]
+			elif len(res.args) <= 2:
+				pkg_args = [(res.args[0], res.args[1] if len(res.args) == 2 and len(res.args[1]) > 0 else None)]
+			else:
+				raise Exception("pkgresolve expects a single package and an optional latest-version. Use --batch to resolve multiple packages")
+			pkgresolve(*pkg_args, project=res.project, pull=res.pull, clone=res.clone, pull_interval=res.pull_interval, lock_file=res.lock_file, frozen=res.frozen)
+		elif res.operation == "resolve-tree":
+			from qdep.internal.private import resolvetree
+			resolvetree(res.outfile, *res.packages, included=res.included, cache_files=res.cache_files, known=res.known, qmake=res.qmake, pull=res.pull, clone=res.clone, pull_interval=res.pull_interval, lock_file=res.lock_file, frozen=res.frozen)
 		elif res.operation == "hookgen":
+			from qdep.internal.private import hookgen
 			hookgen(res.prefix, res.header, res.resources, res.hooks)
 		elif res.operation == "hookimp":
+			from qdep.internal.private import hookimp
 			hookimp(res.outfile, res.headers, res.hooks)
 		elif res.operation == "lconvert":
-			lconvert(res.tsfile, res.outfile, *res.combine, lconvert_args=res.largs)
+			combine = res.combine if res.combine is not None else []
+			if res.outdir is not None:
+				from qdep.internal.private import lconvert_multi
+				lconvert_multi(res.outdir, res.ts_files, *combine, lconvert_args=res.args, stamp=res.stamp, jobs=res.jobs, builtin=res.builtin)
+			elif len(res.args) >= 3:
+				from qdep.internal.private import lconvert
+				lconvert(res.args[0], res.args[1], *combine, lconvert_args=res.args[2:], builtin=res.builtin)
+			else:
+				raise Exception("lconvert expects a tsfile, an outfile and the lconvert tool. Use --outdir to combine multiple ts files")
 		elif res.operation == "prolink":
+			from qdep.internal.private import prolink
 			prolink(res.prodir, res.pkghash, res.pkgpath, res.link)
 		else:
 			parser.print_help()
@@ -1,39 +1,101 @@
 import hashlib
+import json
 import os
 import re
-import shutil
 import stat
 import subprocess
 import sys
-import tempfile
+import time
 from os import path
 from collections import OrderedDict
+from contextlib import contextmanager
 
-import appdirs
-from lockfile import LockFile
+from qdep.internal.trace import get_trace_file, trace_span, trace_cache, command_name
+
+
+# in-memory cache for long running processes, like the qdep daemon. Stays disabled (None) for normal runs
+warm_cache = None
+warm_cache_ttl = 0
+
+
+def enable_warm_cache(ttl):
+	global warm_cache, warm_cache_ttl
+	warm_cache = {}
+	warm_cache_ttl = ttl
+
+
+def warm_cache_get(key, expires=True):
+	if warm_cache is None or key not in warm_cache:
+		return None
+	stamp, value = warm_cache[key]
+	if expires and time.monotonic() - stamp > warm_cache_ttl:
+		warm_cache.pop(key)
+		return None
+	return value
+
+
+def warm_cache_set(key, value):
+	if warm_cache is not None:
+		warm_cache[key] = (time.monotonic(), value)
 
 
 def get_cache_dir_default():
+	import appdirs
+
 	return appdirs.user_cache_dir("qdep")
 
 
+def get_cache_root():
+	return os.getenv("QDEP_CACHE_DIR", get_cache_dir_default())
+
+
+def get_repo_dir(pkg_url):
+	return path.join(get_cache_root(), "src", hashlib.sha3_256(pkg_url.encode("UTF-8")).hexdigest())
+
+
+def get_mirror_dir(pkg_url):
+	return get_mirror_dir_of(get_repo_dir(pkg_url))
+
+
+def get_mirror_dir_of(repo_dir):
+	return path.join(repo_dir, ".mirror")
+
+
 def get_cache_dir(pkg_url, pkg_branch):
-	cache_dir = os.getenv("QDEP_CACHE_DIR", get_cache_dir_default())
-	cache_dir = path.join(cache_dir, hashlib.sha3_256(pkg_url.encode("UTF-8")).hexdigest(), pkg_branch)
+	cache_dir = path.join(get_repo_dir(pkg_url), pkg_branch)
 	os.makedirs(cache_dir, exist_ok=True)
+	# the directory names are hashes, so the url is stored to be able to tell what is in the cache
+	url_file = path.join(get_repo_dir(pkg_url), ".qdep_url")
+	if not path.exists(url_file):
+		write_file_atomic(url_file, pkg_url + "\n")
 	return cache_dir
 
 
+def folder_size(dir_path):
+	total = 0
+	for entry in os.scandir(dir_path):
+		if entry.is_file(follow_symlinks=False):
+			total += entry.stat(follow_symlinks=False).st_size
+		elif entry.is_dir(follow_symlinks=False):
+			total += folder_size(entry.path)
+	return total
+
+
 def get_override_map():
 	or_env = os.getenv("QDEP_SOURCE_OVERRIDE")
 	if or_env is None:
 		return {}
 
+	or_map = warm_cache_get(("override", or_env), expires=False)
+	if or_map is not None:
+		return or_map
+
 	or_map = {}
 	for env_info in or_env.split(";"):
 		env_pair = env_info.split("^")
 		if len(env_pair) == 2:
 			or_map[env_pair[0]] = env_pair[1]
+	warm_cache_set(("override", or_env), or_map)
 	return or_map
 
 
@@ -53,10 +115,29 @@ def declare_hook(hook):
 		return "void {}();\n".format(hook)
 
 
+def get_job_count(jobs=None):
+	if jobs is None:
+		jobs = int(os.getenv("QDEP_JOBS", "0"))
+	if jobs <= 0:
+		jobs = min(32, (os.cpu_count() or 1) + 4)  # mostly waiting for git and the network, so use more jobs than cores
+	return jobs
+
+
 def sub_run(*args, **kwargs):
 	sys.stdout.flush()
 	sys.stderr.flush()
-	return subprocess.run(*args, **kwargs)
+	if get_trace_file() is None:
+		return subprocess.run(*args, **kwargs)
+
+	cmd = args[0] if len(args) > 0 else kwargs["args"]
+	with trace_span("subprocess", command_name(cmd), argv=[str(arg) for arg in cmd], cwd=str(kwargs.get("cwd") or os.getcwd())) as span:
+		try:
+			run_res = subprocess.run(*args, **kwargs)
+		except subprocess.CalledProcessError as error:
+			span["code"] = error.returncode
+			raise
+		span["code"] = run_res.returncode
+		return run_res
 
 
 def package_resolve(package, pkg_version=None, project=False, expand=True):
@@ -97,112 +178,954 @@ def package_resolve(package, pkg_version=None, project=False, expand=True):
 	return pkg_url, pkg_branch, pkg_path
 
 
+def get_ref_cache_file(pkg_url):
+	return path.join(get_cache_root(), "refs", hashlib.sha3_256(pkg_url.encode("UTF-8")).hexdigest() + ".json")
+
+
+def is_ref_listing_fresh(fetch_time):
+	ttl = int(os.getenv("QDEP_REF_CACHE_TTL", "300"))
+	not_before = float(os.getenv("QDEP_REF_CACHE_NOT_BEFORE", "0"))
+	return fetch_time >= not_before and time.time() - fetch_time < ttl
+
+
+def write_file_atomic(file_path, data, mode="w"):
+	import threading
+
+	# the temporary file is unique per thread and created like any other file, so it gets the usual permissions
+	file_dir = path.dirname(path.abspath(file_path))
+	os.makedirs(file_dir, exist_ok=True)
+	tmp_path = path.join(file_dir, ".qdep_tmp_{}_{}_{}".format(path.basename(file_path), os.getpid(), threading.get_ident()))
+	try:
+		with open(tmp_path, mode) as tmp_file:
+			tmp_file.write(data)
+		os.replace(tmp_path, file_path)
+	except:
+		if path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+
+def write_file_if_changed(file_path, data):
+	# generated files are only replaced if their content changed, so their mtime does not trigger needless rebuilds
+	data = data.encode("UTF-8")
+	try:
+		with open(file_path, "rb") as old_file:
+			if old_file.read() == data:
+				return False
+	except OSError:
+		pass  # no readable file yet - create it
+	write_file_atomic(file_path, data, mode="wb")
+	return True
+
+
+def get_tag_prefix():
+	return os.getenv("QDEP_TAG_PREFIX", "[vV]")
+
+
+def version_key(tag, prefix):
+	# semver ordering: numeric components, then prereleases before the release, then the prerelease identifiers
+	match = re.match(r'^(?:' + prefix + r')?(\d+(?:\.\d+)*)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$', tag)
+	if not match:
+		return None
+	numbers = tuple(int(number) for number in match.group(1).split("."))
+	if match.group(2) is None:
+		return numbers, 1, ()
+	pre_ids = tuple((0, int(pre_id), "") if pre_id.isdigit() else (1, 0, pre_id) for pre_id in match.group(2).split("."))
+	return numbers, 0, pre_ids
+
+
+def build_version_index(refs, prefix):
+	# tags that are no versions come first, in the order git lists them, followed by all versions from oldest to newest
+	others = []
+	versions = []
+	for kind, name, _sha in refs:
+		if kind == "tags":
+			key = version_key(name, prefix)
+			if key is None:
+				others.append(name)
+			else:
+				versions.append((key, name))
+	versions.sort(key=lambda version: version[0])
+
+	stable = [name for key, name in versions if key[1] == 1]
+	if len(stable) > 0:
+		latest = stable[-1]
+	elif len(versions) > 0:
+		latest = versions[-1][1]
+	elif len(others) > 0:
+		latest = others[-1]
+	else:
+		latest = None
+	return {"prefix": prefix, "tags": others + [name for _key, name in versions], "latest": latest}
+
+
+def cached_ref_listing(pkg_url, prefix):
+	listing = warm_cache_get(("refs", pkg_url))
+	if listing is not None and is_ref_listing_fresh(listing["time"]) and listing["index"]["prefix"] == prefix:
+		trace_cache("refs", True)
+		return listing
+
+	listing = None
+	try:
+		with open(get_ref_cache_file(pkg_url), "r") as ref_file:
+			cached = json.load(ref_file)
+		if cached["url"] == pkg_url and is_ref_listing_fresh(cached["time"]):
+			listing = cached
+			listing["refs"] = [tuple(ref) for ref in cached["refs"]]
+	except (OSError, ValueError, KeyError):
+		pass  # no usable cache entry - query the remote
+	trace_cache("refs", listing is not None)
+	return listing
+
+
+def parse_ref_listing(pkg_url, fetch_time, ls_output):
+	ref_pattern = re.compile(r'^([a-fA-F0-9]+)\s+refs\/(tags|heads)\/(\S+)$', re.MULTILINE)
+	refs = [(match.group(2), match.group(3), match.group(1)) for match in re.finditer(ref_pattern, ls_output)]
+	return {"url": pkg_url, "time": fetch_time, "refs": refs}
+
+
+def store_ref_listing(listing, prefix):
+	# the index is parsed once per listing and stored with it - it only has to be rebuilt if the prefix changes
+	if listing.get("index", {}).get("prefix") != prefix:
+		listing["index"] = build_version_index(listing["refs"], prefix)
+		write_file_atomic(get_ref_cache_file(listing["url"]), json.dumps(listing))
+	warm_cache_set(("refs", listing["url"]), listing)
+	return listing
+
+
+def ref_listing(pkg_url, allow_error=False):
+	# returns the cached listing of the remote, with the refs as (kind, name, sha) tuples and the parsed version index
+	prefix = get_tag_prefix()
+	listing = cached_ref_listing(pkg_url, prefix)
+	if listing is None:
+		fetch_time = time.time()
+		ls_res = sub_run(["git", "ls-remote", "--refs", pkg_url], check=not allow_error, stdout=subprocess.PIPE, encoding="UTF-8")
+		if ls_res.returncode != 0:
+			return {"url": pkg_url, "time": fetch_time, "refs": [], "index": build_version_index([], prefix)}  # errors are never cached
+		listing = parse_ref_listing(pkg_url, fetch_time, ls_res.stdout)
+	return store_ref_listing(listing, prefix)
+
+
+def ls_remote_live(pkg_url, *refs):
+	# lists only the given refs, bypassing the ref cache - for checks that must see the current state of the remote
+	ls_res = sub_run(["git", "ls-remote", pkg_url] + list(refs), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+	if ls_res.returncode != 0:
+		return None
+	return {ref: sha for sha, ref in (line.split("\t", 1) for line in ls_res.stdout.splitlines() if "\t" in line)}
+
+
+async def ref_listing_async(pkg_url, semaphore):
+	import asyncio
+
+	prefix = get_tag_prefix()
+	listing = cached_ref_listing(pkg_url, prefix)
+	if listing is None:
+		async with semaphore:
+			fetch_time = time.time()
+			with trace_span("subprocess", "git ls-remote", argv=["git", "ls-remote", "--refs", pkg_url], cwd=os.getcwd()) as span:
+				ls_proc = await asyncio.create_subprocess_exec("git", "ls-remote", "--refs", pkg_url, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+				ls_out, ls_err = await ls_proc.communicate()
+				span["code"] = ls_proc.returncode
+		if ls_proc.returncode != 0:
+			raise Exception("Failed to list the refs of {}: {}".format(pkg_url, ls_err.decode("UTF-8", "replace").strip()))
+		listing = parse_ref_listing(pkg_url, fetch_time, ls_out.decode("UTF-8"))
+	return store_ref_listing(listing, prefix)
+
+
+def fetch_ref_listings(pkg_urls, on_listing, jobs=None):
+	# queries all remotes concurrently, each only once. on_listing(url, listing, error) is called as soon as one completes
+	import asyncio
+
+	async def fetch_all():
+		semaphore = asyncio.Semaphore(get_job_count(jobs))
+
+		async def fetch_one(pkg_url):
+			try:
+				return pkg_url, await ref_listing_async(pkg_url, semaphore), None
+			except Exception as error:
+				return pkg_url, None, error
+
+		for next_result in asyncio.as_completed([fetch_one(pkg_url) for pkg_url in OrderedDict.fromkeys(pkg_urls)]):
+			on_listing(*(await next_result))
+
+	asyncio.run(fetch_all())
+
+
+def listing_tags(listing, branches=False, tags=True):
+	all_tags = [name for kind, name, _sha in listing["refs"] if kind == "heads"] if branches else []
+	if tags:
+		all_tags += listing["index"]["tags"]
+	return all_tags
+
+
+def ls_remote(pkg_url, allow_error=False):
+	# returns all heads and tags of the remote as (kind, name, sha) tuples, in the order git lists them
+	return ref_listing(pkg_url, allow_error=allow_error)["refs"]
+
+
 def get_all_tags(pkg_url, branches=False, tags=True, allow_empty=False, allow_error=False):
-	ls_args = ["git", "ls-remote", "--refs"]
-	if not branches and tags:
-		ls_args.append("--tags")
-	elif not tags and branches:
-		ls_args.append("--heads")
-	if not allow_empty:
-		ls_args.append("--exit-code")
-	elif not tags and not branches:
+	kinds = []
+	if branches:
+		kinds.append("heads")
+	if tags:
+		kinds.append("tags")
+	if len(kinds) == 0:
 		return []  # Nothing to check for
-	ls_args.append(pkg_url)
 
-	ls_res = sub_run(ls_args, check=not allow_error, stdout=subprocess.PIPE, encoding="UTF-8")
-	ref_pattern = re.compile(r'[a-fA-F0-9]+\s+refs\/(?:tags|heads)\/([^\s]+)')
-	tags = []
-	for match in re.finditer(ref_pattern, ls_res.stdout):
-		tags.append(match.group(1))
-	return tags
+	all_tags = listing_tags(ref_listing(pkg_url, allow_error=allow_error), branches=branches, tags=tags)
+	if len(all_tags) == 0 and not allow_empty and not allow_error:
+		raise Exception("Unable to find any {} for package {}".format(" or ".join(kinds), pkg_url))
+	return all_tags
 
 
 def get_latest_tag(pkg_url, allow_empty=False, allow_error=False):
-	all_tags = get_all_tags(pkg_url, allow_empty=allow_empty, allow_error=allow_error)
-	if len(all_tags) > 0:
-		return all_tags[-1]
+	latest_tag = ref_listing(pkg_url, allow_error=allow_error)["index"]["latest"]
+	if latest_tag is None and not allow_empty and not allow_error:
+		raise Exception("Unable to find any tags for package {}".format(pkg_url))
+	return latest_tag
+
+
+def is_cached(pkg_url, pkg_branch):
+	return is_complete_checkout(get_cache_dir(pkg_url, pkg_branch))
+
+
+class CacheLockTimeout(Exception):
+	pass
+
+
+@contextmanager
+def cache_lock(lock_dir, exclusive=True, timeout=None):
+	# advisory OS locks are released by the kernel when the holding process dies, so stale locks cannot exist
+	if timeout is None:
+		timeout = int(os.getenv("QDEP_LOCK_TIMEOUT", "600"))
+
+	lock_file = lock_dir + ".lock"
+	start_time = time.monotonic()
+	while True:
+		lock_fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o666)
+		try:
+			while not try_lock_fd(lock_fd, exclusive):
+				if time.monotonic() - start_time >= timeout:
+					raise CacheLockTimeout("Timed out after {} seconds waiting for the lock on {}".format(timeout, lock_dir))
+				time.sleep(0.05)
+			# removing a package deletes its lock files - a lock on a deleted file protects nothing, so the new one is locked
+			if is_lock_file_of(lock_fd, lock_file):
+				break
+			unlock_fd(lock_fd)
+		except:
+			os.close(lock_fd)
+			raise
+		os.close(lock_fd)
+
+	try:
+		yield
+	finally:
+		unlock_fd(lock_fd)
+		os.close(lock_fd)
+
+
+def is_lock_file_of(lock_fd, lock_file):
+	try:
+		return path.samestat(os.fstat(lock_fd), os.stat(lock_file))
+	except FileNotFoundError:
+		return False
+
+
+def try_lock_fd(lock_fd, exclusive):
+	try:
+		import fcntl
+		fcntl.flock(lock_fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+		return True
+	except ImportError:
+		import msvcrt  # no shared locks on windows - readers are exclusive as well
+		try:
+			msvcrt.locking(lock_fd, msvcrt.LK_NBLCK, 1)
+			return True
+		except OSError:
+			return False
+	except BlockingIOError:
+		return False
+
+
+def unlock_fd(lock_fd):
+	try:
+		import fcntl
+		fcntl.flock(lock_fd, fcntl.LOCK_UN)
+	except ImportError:
+		import msvcrt
+		os.lseek(lock_fd, 0, os.SEEK_SET)
+		msvcrt.locking(lock_fd, msvcrt.LK_UNLCK, 1)
+
+
+def git_head(repo_dir):
+	return sub_run(["git", "rev-parse", "HEAD"], cwd=repo_dir, stdout=subprocess.PIPE, check=True, encoding="UTF-8").stdout.strip()
+
+
+def get_checkout_commit(pkg_url, pkg_branch, cache_dir):
+	if path.exists(path.join(cache_dir, ".git")):
+		return git_head(cache_dir)
+	# archive checkouts have no repository, so the remote is asked. Annotated tags are listed twice, and only the peeled
+	# entry is the commit - the cached listing has no peeled entries, so the tag is listed live
+	tag_ref = "refs/tags/" + pkg_branch
+	remote_refs = ls_remote_live(pkg_url, tag_ref, tag_ref + "^{}")
+	if remote_refs is None or tag_ref not in remote_refs:
+		raise Exception("Unable to determine the commit of {}@{}".format(pkg_url, pkg_branch))
+	return remote_refs.get(tag_ref + "^{}", remote_refs[tag_ref])
+
+
+def make_read_only(root_dir, rel_paths=None, jobs=None):
+	# marks the given files (or the whole tree, if None) read only. Directories in rel_paths are submodules and marked completely
+	from concurrent.futures import ThreadPoolExecutor
+
+	walk_dirs = [root_dir] if rel_paths is None else []
+	files = []
+	for rel_path in (rel_paths if rel_paths is not None else []):
+		f_path = path.join(root_dir, rel_path)
+		if path.isdir(f_path) and not path.islink(f_path):
+			walk_dirs.append(f_path)
+		elif path.lexists(f_path):
+			files.append(f_path)
+	for walk_dir in walk_dirs:
+		for root, dirs, dir_files in os.walk(walk_dir, topdown=True):
+			dirs[:] = [d for d in dirs if d != ".git"]
+			files.extend(path.join(root, file) for file in dir_files)
+
+	NO_WRITE_MASK = ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH
+
+	def chmod_files(chunk):
+		for f_path in chunk:
+			cur_perm = stat.S_IMODE(os.lstat(f_path).st_mode)
+			if cur_perm & NO_WRITE_MASK != cur_perm:
+				os.chmod(f_path, cur_perm & NO_WRITE_MASK)
+
+	# the syscalls release the GIL, so large trees are split across threads - but more threads than cores do not help here
+	job_count = min(get_job_count(jobs), os.cpu_count() or 1)
+	chunk_size = 512
+	if job_count == 1 or len(files) <= chunk_size:
+		chmod_files(files)
 	else:
+		with ThreadPoolExecutor(max_workers=job_count) as executor:
+			for _r in executor.map(chmod_files, [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]):
+				pass
+
+
+def get_fetch_stamp_file(cache_dir):
+	return path.join(cache_dir, ".git", "qdep_last_fetch.json")
+
+
+def write_fetch_stamp(cache_dir, commit):
+	write_file_atomic(get_fetch_stamp_file(cache_dir), json.dumps({"time": time.time(), "commit": commit}))
+
+
+def is_pull_needed(pkg_url, pkg_branch, cache_dir, pull_interval=None):
+	if pull_interval is None:
+		pull_interval = int(os.getenv("QDEP_PULL_INTERVAL", "0"))
+
+	try:
+		with open(get_fetch_stamp_file(cache_dir), "r") as stamp_file:
+			stamp = json.load(stamp_file)
+		fetch_time, fetch_commit = stamp["time"], stamp["commit"]
+	except (OSError, ValueError, KeyError):
+		return True  # unknown state - always pull
+	if time.time() - fetch_time < pull_interval:
+		return False
+
+	# the ref listing is far cheaper than a pull, so only pull if the remote head moved. The cached listing could miss a
+	# push, so only this one branch is listed live
+	remote_refs = ls_remote_live(pkg_url, "refs/heads/" + pkg_branch)
+	if remote_refs is not None and remote_refs.get("refs/heads/" + pkg_branch) == fetch_commit:
+		write_fetch_stamp(cache_dir, fetch_commit)
+		return False
+	return True
+
+
+def pin_mirror_commit(mirror_dir, rev):
+	# checkouts borrow their objects from the mirror, so every fetched commit keeps a ref - otherwise a gc of the mirror
+	# could prune commits that are no longer reachable from a moved branch or tag, but still checked out
+	rev_res = sub_run(["git", "rev-parse", "--verify", rev + "^{commit}"], cwd=mirror_dir, stdout=subprocess.PIPE, check=True, encoding="UTF-8")
+	commit = rev_res.stdout.strip()
+	sub_run(["git", "update-ref", "refs/qdep/" + commit, commit], cwd=mirror_dir, check=True)
+	return commit
+
+
+def update_mirror(pkg_url, pkg_branch):
+	# the mirror is a bare repository that holds the objects of all versions, so new versions only fetch the delta
+	mirror_dir = get_mirror_dir(pkg_url)
+	os.makedirs(mirror_dir, exist_ok=True)
+	with cache_lock(mirror_dir, exclusive=True):
+		if not path.exists(path.join(mirror_dir, "HEAD")):
+			sub_run(["git", "init", "--quiet", "--bare"], cwd=mirror_dir, check=True)
+		kinds = [kind for kind, name, _sha in ls_remote(pkg_url, allow_error=True) if name == pkg_branch]
+		if len(kinds) == 0:
+			kinds = ["tags", "heads"]  # not in the (possibly outdated) listing - let git decide
+		for kind in kinds:
+			# only the fetched commit is needed to check it out, so the history is not downloaded
+			refspec = "+refs/{0}/{1}:refs/{0}/{1}".format(kind, pkg_branch)
+			fetch_res = sub_run(["git", "fetch", "--quiet", "--force", "--no-tags", "--depth", "1", pkg_url, refspec], cwd=mirror_dir, stderr=subprocess.PIPE, encoding="UTF-8")
+			if fetch_res.returncode == 0:
+				commit = pin_mirror_commit(mirror_dir, "refs/{}/{}".format(kind, pkg_branch))
+				break
+		else:
+			raise Exception("Failed to fetch {} of package {}: {}".format(pkg_branch, pkg_url, fetch_res.stderr.strip()))
+
+	from qdep.internal.index import index_record
+	index_record(pkg_url, None, mirror_dir, kind="mirror")
+	return mirror_dir, kind, commit
+
+
+def share_mirror(mirror_dir, cache_dir):
+	import shutil
+
+	# git refuses to clone --shared from a shallow repository, so the checkout is linked to the objects and shallow
+	# boundaries of the mirror by hand. Called again after every fetch, as the boundaries grow with each fetched version
+	git_dir = path.join(cache_dir, ".git")
+	if not path.exists(git_dir):
+		sub_run(["git", "init", "--quiet", cache_dir], check=True)
+		with open(path.join(git_dir, "objects", "info", "alternates"), "w") as alt_file:
+			alt_file.write(path.join(path.abspath(mirror_dir), "objects") + "\n")
+	mirror_shallow = path.join(mirror_dir, "shallow")
+	if path.exists(mirror_shallow):
+		shutil.copyfile(mirror_shallow, path.join(git_dir, "shallow"))
+
+
+def get_archive_url(pkg_url, pkg_tag):
+	url_match = re.match(r'^(?:\w+:\/\/(?:[^@\/]+@)?|[^@:]+@)?([^\/:]+)[\/:](.+?)(?:\.git)?\/?$', pkg_url)
+	if not url_match:
 		return None
+	host, repo_path = url_match.group(1), url_match.group(2)
+
+	url_fn = os.getenv("QDEP_ARCHIVE_URL_FN")
+	if url_fn is None:
+		if host == "github.com":
+			url_fn = "https://github.com/{path}/archive/refs/tags/{tag}.tar.gz"
+		elif host == "gitlab.com":
+			url_fn = "https://gitlab.com/{path}/-/archive/{tag}/{name}-{tag}.tar.gz"
+		else:
+			return None
+	return url_fn.format(url=pkg_url, host=host, path=repo_path, name=repo_path.split("/")[-1], tag=pkg_tag)
+
+
+def fetch_archive(pkg_url, pkg_tag, cache_dir):
+	import tarfile
+	import urllib.error
+	import urllib.request
+
+	# returns False if the package cannot be fetched as archive, so git has to be used instead
+	archive_url = get_archive_url(pkg_url, pkg_tag)
+	if archive_url is None or pkg_tag not in [name for kind, name, _sha in ls_remote(pkg_url, allow_error=True) if kind == "tags"]:
+		return False
+
+	try:
+		response = urllib.request.urlopen(archive_url)
+	except urllib.error.URLError:
+		return False  # no archive download for this tag, e.g. a 404 - git can still fetch it
+
+	# the archive is extracted while downloading. All archive formats wrap the sources into one top level directory
+	with response:
+		with tarfile.open(fileobj=response, mode="r|*") as archive:
+			for member in archive:
+				name_parts = member.name.split("/", 1)
+				if len(name_parts) < 2 or len(name_parts[1].strip("/")) == 0:
+					continue
+				member.name = name_parts[1]
+				if member.islnk():
+					member.linkname = member.linkname.split("/", 1)[-1]
+				if hasattr(tarfile, "data_filter"):
+					archive.extract(member, cache_dir, filter="data")
+				elif path.isabs(member.name) or ".." in member.name.split("/") or path.isabs(member.linkname) or ".." in member.linkname.split("/"):
+					raise Exception("Archive {} contains the invalid path {}".format(archive_url, member.name))
+				else:
+					archive.extract(member, cache_dir)
+
+	# archives do not contain submodules - those packages are fetched with git instead
+	return not path.exists(path.join(cache_dir, ".gitmodules"))
+
+
+def is_static_checkout(cache_dir):
+	# the marker is written last, so it also means the checkout is complete
+	return path.exists(path.join(cache_dir, ".qdep_static_branch"))
+
+
+def is_complete_checkout(cache_dir):
+	return is_static_checkout(cache_dir) or path.exists(get_fetch_stamp_file(cache_dir))
 
 
-def get_sources(pkg_url, pkg_branch, pull=True, clone=True):
+def get_sources(pkg_url, pkg_branch, pull=True, clone=True, pull_interval=None):
+	import shutil
 
 	if pkg_branch is None:
 		pkg_branch = get_latest_tag(pkg_url)
 
+	# static checkouts never change, so the daemon can serve them without touching the cache at all
+	cache_dir = warm_cache_get(("sources", get_cache_root(), pkg_url, pkg_branch), expires=False)
+	if cache_dir is not None and is_static_checkout(cache_dir):
+		trace_cache("sources", True)
+		return touch_cache_entry(cache_dir), pkg_branch
+
+	# complete static checkouts are never modified again, so no lock is needed to use them
 	cache_dir = get_cache_dir(pkg_url, pkg_branch)
+	if is_static_checkout(cache_dir):
+		warm_cache_set(("sources", get_cache_root(), pkg_url, pkg_branch), cache_dir)
+		trace_cache("sources", True)
+		return touch_cache_entry(cache_dir), pkg_branch
 
-	locker = LockFile(cache_dir)
-	locker.acquire()
-	try:
-		needs_ro = False
-		if path.isdir(path.join(cache_dir, ".git")):
-			if pull and not path.exists(path.join(cache_dir, ".qdep_static_branch")):
-				sub_run(["git", "pull", "--force", "--ff-only", "--update-shallow", "--recurse-submodules"], cwd=cache_dir, stdout=subprocess.DEVNULL, check=True)
-				needs_ro = True
-		elif clone:
-			sub_run(["git", "clone", "--recurse-submodules", "--depth", "1", "--branch", pkg_branch, pkg_url, cache_dir], check=True)
-			head_ref_res = sub_run(["git", "symbolic-ref", "HEAD"], cwd=cache_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-			if head_ref_res.returncode != 0:
-				open(path.join(cache_dir, ".qdep_static_branch"), 'a').close()
-			needs_ro = True
+	# readers share the lock, only cloning and pulling needs it exclusively
+	cloned = False
+	fetched = False
+	with cache_lock(cache_dir, exclusive=False):
+		if is_complete_checkout(cache_dir) and (not pull or is_static_checkout(cache_dir) or not is_pull_needed(pkg_url, pkg_branch, cache_dir, pull_interval)):
+			trace_cache("sources", True)
+			return touch_cache_entry(cache_dir), pkg_branch
+
+	with cache_lock(cache_dir, exclusive=True):
+		try:
+			if is_complete_checkout(cache_dir):
+				# checked again, as another process might have updated the sources while waiting for the lock
+				if pull and not is_static_checkout(cache_dir) and is_pull_needed(pkg_url, pkg_branch, cache_dir, pull_interval):
+					old_head = git_head(cache_dir)
+					mirror_dir, _kind, commit = update_mirror(pkg_url, pkg_branch)
+					# the mirror is shallow, so there is no history to fast forward along - the checkout is moved to the new head instead
+					share_mirror(mirror_dir, cache_dir)
+					sub_run(["git", "reset", "--quiet", "--hard", commit], cwd=cache_dir, stdout=subprocess.DEVNULL, check=True)
+					sub_run(["git", "submodule", "update", "--init", "--recursive"], cwd=cache_dir, stdout=subprocess.DEVNULL, check=True)
+					new_head = git_head(cache_dir)
+					if new_head != old_head:
+						diff_res = sub_run(["git", "diff", "--name-only", "-z", old_head, new_head], cwd=cache_dir, stdout=subprocess.PIPE, check=True, encoding="UTF-8")
+						make_read_only(cache_dir, [f for f in diff_res.stdout.split("\0") if len(f) > 0])
+					write_fetch_stamp(cache_dir, new_head)
+					fetched = True
+			elif clone:
+				cloned = True
+				fetched = True
+				# leftovers of a crashed clone are removed first
+				if len(os.listdir(cache_dir)) > 0:
+					shutil.rmtree(cache_dir)
+					os.makedirs(cache_dir)
+				fetch_backend = os.getenv("QDEP_FETCH_BACKEND", "git")
+				if fetch_backend not in ["git", "archive"]:
+					raise Exception("Unknown fetch backend {} - must be git or archive".format(fetch_backend))
+
+				if fetch_backend == "archive" and fetch_archive(pkg_url, pkg_branch, cache_dir):
+					make_read_only(cache_dir)
+					open(path.join(cache_dir, ".qdep_static_branch"), 'a').close()
+				else:
+					if len(os.listdir(cache_dir)) > 0:
+						shutil.rmtree(cache_dir)
+						os.makedirs(cache_dir)
+					# versions are checkouts that borrow all objects from the mirror. The origin is the real url, so relative submodule urls work
+					mirror_dir, kind, commit = update_mirror(pkg_url, pkg_branch)
+					share_mirror(mirror_dir, cache_dir)
+					if kind == "heads":
+						sub_run(["git", "checkout", "--quiet", "-B", pkg_branch, commit], cwd=cache_dir, check=True)
+					else:
+						sub_run(["git", "-c", "advice.detachedHead=false", "checkout", "--quiet", "--detach", commit], cwd=cache_dir, check=True)
+					sub_run(["git", "remote", "add", "origin", pkg_url], cwd=cache_dir, check=True)
+					sub_run(["git", "submodule", "update", "--init", "--recursive"], cwd=cache_dir, stdout=subprocess.DEVNULL, check=True)
+					make_read_only(cache_dir)
+					head_ref_res = sub_run(["git", "symbolic-ref", "HEAD"], cwd=cache_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+					if head_ref_res.returncode != 0:
+						open(path.join(cache_dir, ".qdep_static_branch"), 'a').close()
+					else:
+						write_fetch_stamp(cache_dir, git_head(cache_dir))
+			else:
+				raise Exception("The --no-clone flag was specified - cannot install new packages with pulling disabled")
+		except:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+			raise
+
+	trace_cache("sources", not fetched)
+	if fetched:
+		from qdep.internal.index import index_record
+		index_record(pkg_url, pkg_branch, cache_dir)
+	if cloned:
+		auto_collect_garbage(cache_dir)
+	if is_static_checkout(cache_dir):
+		warm_cache_set(("sources", get_cache_root(), pkg_url, pkg_branch), cache_dir)
+	return touch_cache_entry(cache_dir), pkg_branch
+
+
+def read_lock_file(lock_file):
+	# maps (url, requested version) to the locked entry. Unversioned packages are stored with an empty version
+	if lock_file is None:
+		return None
+	cached = warm_cache_get(("lock", lock_file))
+	if cached is not None:
+		return cached
+	with open(lock_file, "r") as lock_fd:
+		lock_data = json.load(lock_fd)
+	lock = {(entry["url"], entry["requested"] if len(entry["requested"]) > 0 else None): entry for entry in lock_data["packages"]}
+	warm_cache_set(("lock", lock_file), lock)
+	return lock
+
+
+def get_locked_entry(lock, pkg_url, pkg_branch, frozen=False):
+	if lock is not None and (pkg_url, pkg_branch) in lock:
+		return lock[(pkg_url, pkg_branch)]
+	elif frozen:
+		raise Exception("Package {}@{} is not part of the lock file, but frozen mode does not allow to resolve it from the remote".format(pkg_url, pkg_branch if pkg_branch is not None else "<latest>"))
+	else:
+		return None
+
+
+def has_commit(repo_dir, commit):
+	cat_res = sub_run(["git", "cat-file", "-e", commit + "^{commit}"], cwd=repo_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	return cat_res.returncode == 0
+
+
+def get_locked_sources(pkg_url, pkg_branch, commit, frozen=False):
+	import shutil
+
+	# checkouts of exact commits never change, so they are static checkouts shared by all projects that lock that commit
+	cache_dir = path.join(get_repo_dir(pkg_url), ".commit", commit)
+	if is_static_checkout(cache_dir):
+		trace_cache("sources", True)
+		return touch_cache_entry(cache_dir), pkg_branch
+
+	mirror_dir = get_mirror_dir(pkg_url)
+	mirror_ok = path.exists(path.join(mirror_dir, "HEAD")) and has_commit(mirror_dir, commit)
+	if frozen and not mirror_ok:
+		raise Exception("Commit {} of package {} is not in the cache, but frozen mode does not allow to download it".format(commit, pkg_url))
+
+	os.makedirs(cache_dir, exist_ok=True)
+	with cache_lock(cache_dir, exclusive=True):
+		if is_static_checkout(cache_dir):
+			trace_cache("sources", True)
+			return touch_cache_entry(cache_dir), pkg_branch
+		try:
+			if len(os.listdir(cache_dir)) > 0:
+				shutil.rmtree(cache_dir)
+				os.makedirs(cache_dir)
+			if not mirror_ok:
+				update_mirror(pkg_url, pkg_branch)
+			with cache_lock(mirror_dir, exclusive=True):
+				if not has_commit(mirror_dir, commit):
+					sub_run(["git", "fetch", "--quiet", "--no-tags", "--depth", "1", pkg_url, commit], cwd=mirror_dir, check=True)
+				pin_mirror_commit(mirror_dir, commit)
+			share_mirror(mirror_dir, cache_dir)
+			sub_run(["git", "-c", "advice.detachedHead=false", "checkout", "--quiet", "--detach", commit], cwd=cache_dir, check=True)
+			sub_run(["git", "remote", "add", "origin", pkg_url], cwd=cache_dir, check=True)
+			if frozen and path.exists(path.join(cache_dir, ".gitmodules")):
+				# submodules are not mirrored, so they would have to be cloned. An empty protocol whitelist makes git fail instead
+				# of accessing the network, which also overrides any protocol.<name>.allow configuration of the user
+				try:
+					sub_run(["git", "submodule", "update", "--init", "--recursive"], cwd=cache_dir, env=dict(os.environ, GIT_ALLOW_PROTOCOL=""), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+				except subprocess.CalledProcessError:
+					raise Exception("The submodules of package {} at commit {} are not in the cache, but frozen mode does not allow to download them".format(pkg_url, commit))
+			else:
+				sub_run(["git", "submodule", "update", "--init", "--recursive"], cwd=cache_dir, stdout=subprocess.DEVNULL, check=True)
+			make_read_only(cache_dir)
+			open(path.join(cache_dir, ".qdep_static_branch"), 'a').close()
+		except:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+			raise
+	trace_cache("sources", False)
+	from qdep.internal.index import index_record
+	index_record(pkg_url, commit, cache_dir, kind="commit")
+	auto_collect_garbage(cache_dir)
+	return touch_cache_entry(cache_dir), pkg_branch
+
+
+def link_file(src_file, dst_file, methods):
+	# tries the remaining link methods in order and drops those that are not supported, so they are not tried for every file
+	import shutil
+
+	while len(methods) > 1:
+		try:
+			if methods[0] == "reflink":
+				import fcntl
+				with open(src_file, "rb") as src_fd, open(dst_file, "wb") as dst_fd:
+					fcntl.ioctl(dst_fd.fileno(), 0x40049409, src_fd.fileno())  # FICLONE
+				shutil.copystat(src_file, dst_file)
+			elif methods[0] == "hardlink":
+				os.link(src_file, dst_file)
+			return
+		except (ImportError, OSError):
+			if path.lexists(dst_file):
+				os.remove(dst_file)
+			methods.pop(0)
+	shutil.copy2(src_file, dst_file)
+
+
+def sync_tree(src_dir, dst_dir, methods=None):
+	# makes dst_dir a copy of src_dir, but only touches files that differ. Returns the number of updated files
+	if methods is None:
+		methods = ["reflink", "hardlink", "copy"]
+	else:
+		methods = list(methods)
+
+	os.makedirs(dst_dir, exist_ok=True)
+	updated = 0
+	src_entries = {entry.name: entry for entry in os.scandir(src_dir) if entry.name != ".git"}
+	for dst_entry in os.scandir(dst_dir):
+		src_entry = src_entries.get(dst_entry.name)
+		if src_entry is None or src_entry.is_dir(follow_symlinks=False) != dst_entry.is_dir(follow_symlinks=False) or src_entry.is_symlink() != dst_entry.is_symlink():
+			if dst_entry.is_dir(follow_symlinks=False):
+				import shutil
+				shutil.rmtree(dst_entry.path)
+			else:
+				os.remove(dst_entry.path)
+
+	for name, src_entry in src_entries.items():
+		dst_path = path.join(dst_dir, name)
+		if src_entry.is_symlink():
+			link_target = os.readlink(src_entry.path)
+			if path.lexists(dst_path):
+				if os.readlink(dst_path) == link_target:
+					continue
+				os.remove(dst_path)
+			os.symlink(link_target, dst_path)
+			updated += 1
+		elif src_entry.is_dir():
+			updated += sync_tree(src_entry.path, dst_path, methods)
 		else:
-			raise Exception("The --no-clone flag was specified - cannot install new packages with pulling disabled")
-
-		if needs_ro:
-			NO_WRITE_MASK = ~stat.S_IWUSR & ~stat.S_IWGRP & ~stat.S_IWOTH
-			for root, dirs, files in os.walk(cache_dir, topdown=True):
-				dirs[:] = [d for d in dirs if d != ".git"]
-				for file in files:
-					f_path = path.join(root, file)
-					cur_perm = stat.S_IMODE(os.lstat(f_path).st_mode)
-					os.chmod(f_path, cur_perm & NO_WRITE_MASK)
-	except:
-		shutil.rmtree(cache_dir, ignore_errors=True)
-		raise
-	finally:
-		locker.release()
+			if path.lexists(dst_path):
+				src_stat = src_entry.stat()
+				dst_stat = os.lstat(dst_path)
+				if (src_stat.st_ino == dst_stat.st_ino and src_stat.st_dev == dst_stat.st_dev) or \
+					(src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns):
+					continue
+				os.remove(dst_path)
+			link_file(src_entry.path, dst_path, methods)
+			updated += 1
+	return updated
+
+
+def touch_cache_entry(cache_dir):
+	# the modification time of the lock file next to each cached version is its last access time. It is only updated once
+	# a minute, so parallel builds do not write to the cache index all the time
+	try:
+		if time.time() - os.stat(cache_dir + ".lock").st_mtime < 60:
+			return cache_dir
+		os.utime(cache_dir + ".lock")
+	except FileNotFoundError:
+		open(cache_dir + ".lock", "a").close()
+
+	from qdep.internal.index import index_touch
+	index_touch(cache_dir, time.time())
+	return cache_dir
+
+
+def parse_size(size):
+	size_match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([kKmMgGtT]?)[bB]?\s*$', str(size))
+	if not size_match:
+		raise Exception("Invalid size: {}".format(size))
+	return int(float(size_match.group(1)) * 1024 ** " KMGT".index(size_match.group(2).upper() or " "))
+
+
+def list_repo_entries(repo_dir):
+	# returns (repo_dir, entry_dir, last_access) for every cached version of a package. Each of them has a lock file next to it
+	entries = []
+	for root, dirs, files in os.walk(repo_dir, topdown=True):
+		entry_dirs = [d for d in dirs if d + ".lock" in files and d != ".mirror"]
+		dirs[:] = [d for d in dirs if d not in entry_dirs and d != ".mirror"]
+		for entry_dir in entry_dirs:
+			entries.append((repo_dir, path.join(root, entry_dir), os.stat(path.join(root, entry_dir + ".lock")).st_mtime))
+	return entries
+
+
+def list_cache_entries():
+	src_dir = path.join(get_cache_root(), "src")
+	if not path.isdir(src_dir):
+		return []
+	return [entry for repo_entry in os.scandir(src_dir) if repo_entry.is_dir(follow_symlinks=False) for entry in list_repo_entries(repo_entry.path)]
+
+
+def collect_garbage(max_size=None, max_age=None, dry_run=False, keep=None):
+	# evicts the least recently used versions until the cache is small enough. Returns the removed directories and the freed bytes
+	import shutil
+
+	entries = sorted(list_cache_entries(), key=lambda entry: entry[2])
+	sizes = {entry_dir: folder_size(entry_dir) for _r, entry_dir, _a in entries}
+	repo_dirs = set(repo_dir for repo_dir, _e, _a in entries)
+	mirror_sizes = {repo_dir: folder_size(get_mirror_dir_of(repo_dir)) if path.isdir(get_mirror_dir_of(repo_dir)) else 0 for repo_dir in repo_dirs}
+	total_size = sum(sizes.values()) + sum(mirror_sizes.values())
+	remaining = {repo_dir: sum(1 for r, _e, _a in entries if r == repo_dir) for repo_dir in repo_dirs}
+
+	removed = []
+	freed = 0
+	now = time.time()
+	for repo_dir, entry_dir, last_access in entries:
+		if keep is not None and entry_dir in keep:
+			continue
+		too_old = max_age is not None and now - last_access > max_age
+		too_big = max_size is not None and total_size - freed > max_size
+		if not too_old and not too_big:
+			continue
+
+		# entries that are in use right now are skipped. The marker goes first, so lock free readers stop using the entry
+		entry_commit = None
+		try:
+			with cache_lock(entry_dir, exclusive=True, timeout=0):
+				if not dry_run:
+					if path.exists(path.join(entry_dir, ".git")):
+						entry_commit = git_head(entry_dir)
+					if path.exists(path.join(entry_dir, ".qdep_static_branch")):
+						os.remove(path.join(entry_dir, ".qdep_static_branch"))
+					shutil.rmtree(entry_dir)
+		except CacheLockTimeout:
+			continue
+		# the lock file stays - deleting it would let a waiting process lock the old file while another one creates a new
+		removed.append(entry_dir)
+		freed += sizes[entry_dir]
+
+		# the mirror is only needed as long as any version of the package is cached
+		remaining[repo_dir] -= 1
+		if remaining[repo_dir] == 0:
+			mirror_dir = get_mirror_dir_of(repo_dir)
+			try:
+				with cache_lock(mirror_dir, exclusive=True, timeout=0):
+					if not dry_run:
+						if len(list_repo_entries(repo_dir)) > 0:
+							continue  # another process started to download a version in the meantime
+						shutil.rmtree(repo_dir)
+			except CacheLockTimeout:
+				continue
+			removed.append(mirror_dir)
+			freed += mirror_sizes[repo_dir]
+		elif not dry_run and path.isdir(get_mirror_dir_of(repo_dir)):
+			# the mirror keeps the objects of the evicted version as long as they are referenced
+			try:
+				mirror_size = prune_mirror(repo_dir, entry_dir, entry_commit)
+			except CacheLockTimeout:
+				continue
+			freed += mirror_sizes[repo_dir] - mirror_size
+			mirror_sizes[repo_dir] = mirror_size
+	if not dry_run:
+		from qdep.internal.index import index_remove
+		index_remove(*removed)
+	return removed, freed
 
-	return cache_dir, pkg_branch
+
+def prune_mirror(repo_dir, entry_dir, entry_commit):
+	# removes the refs of an evicted version from the mirror and prunes its objects. The pin of the commit stays if another
+	# cached version still uses it. Returns the new size of the mirror
+	mirror_dir = get_mirror_dir_of(repo_dir)
+	with cache_lock(mirror_dir, exclusive=True, timeout=0):
+		entry_name = path.relpath(entry_dir, repo_dir).replace(os.sep, "/")
+		refs = [] if entry_name.startswith(".commit/") else ["refs/heads/" + entry_name, "refs/tags/" + entry_name]
+		if entry_commit is not None:
+			# the commit of versions that are checked out right now is not known yet, so the pin stays while there are any
+			other_dirs = [other_dir for _r, other_dir, _a in list_repo_entries(repo_dir)]
+			if all(is_complete_checkout(other_dir) for other_dir in other_dirs) and \
+					entry_commit not in [git_head(other_dir) for other_dir in other_dirs if path.exists(path.join(other_dir, ".git"))]:
+				refs.append("refs/qdep/" + entry_commit)
+		for ref in refs:
+			sub_run(["git", "update-ref", "-d", ref], cwd=mirror_dir, stderr=subprocess.DEVNULL)
+		sub_run(["git", "gc", "--quiet", "--prune=now"], cwd=mirror_dir, check=True)
+		return folder_size(mirror_dir)
+
+
+def auto_collect_garbage(cache_dir):
+	# automatic garbage collection after downloads, at most once per hour. The new download is always kept
+	max_size = os.getenv("QDEP_CACHE_MAX_SIZE")
+	if max_size is None:
+		return
+	stamp_file = path.join(get_cache_root(), "src", ".qdep_last_gc")
+	if path.exists(stamp_file) and time.time() - os.stat(stamp_file).st_mtime < 3600:
+		return
+	open(stamp_file, "a").close()
+	os.utime(stamp_file)
+	collect_garbage(max_size=parse_size(max_size), keep=[cache_dir])
+
+
+def find_legacy_sources():
+	# sources of qdep versions before the mirror layout: <cache>/<sha3(url)>/<branch>, each being an independent clone
+	legacy_pattern = re.compile(r'^[a-f0-9]{64}$')
+	cache_root = get_cache_root()
+	if not path.isdir(cache_root):
+		return []
+
+	legacy_sources = []
+	for repo_entry in os.scandir(cache_root):
+		if not repo_entry.is_dir() or not re.match(legacy_pattern, repo_entry.name):
+			continue
+		for branch_entry in os.scandir(repo_entry.path):
+			if branch_entry.is_dir() and path.isdir(path.join(branch_entry.path, ".git")):
+				url_res = sub_run(["git", "remote", "get-url", "origin"], cwd=branch_entry.path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+				legacy_sources.append((repo_entry.path, branch_entry.path, url_res.stdout.strip() if url_res.returncode == 0 else None, branch_entry.name))
+	return legacy_sources
+
+
+depends_variables = ["QDEP_DEPENDS", "QDEP_PROJECT_SUBDIRS", "QDEP_PROJECT_LINK_DEPENDS", "QDEP_PROJECT_DEPENDS"]
 
 
 def extract_pro_depends(pro_file, qmake):
-	packages = []
+	values = read_pro_variables(pro_file, depends_variables, qmake)
+	return [value for var in depends_variables for value in values[var]]
+
+
+def extract_pro_depends_native(pro_file):
+	from qdep.internal.proparser import read_variables
+
+	values = read_variables(pro_file, depends_variables)
+	return [value for var in depends_variables for value in values[var]]
+
+
+def extract_pro_depends_qmake(pro_file, qmake):
+	values = read_pro_variables_qmake(pro_file, depends_variables, qmake)
+	return [value for var in depends_variables for value in values[var]]
 
+
+def read_pro_variables(pro_file, variables, qmake):
+	from qdep.internal.proparser import UnsupportedSyntaxError, read_variables
+
+	# most package files only contain plain assignments, which can be read without starting qmake
+	try:
+		return read_variables(pro_file, variables)
+	except UnsupportedSyntaxError:
+		return read_pro_variables_qmake(pro_file, variables, qmake)
+
+
+def read_pro_variables_qmake(pro_file, variables, qmake):
+	import tempfile
+
+	values = {}
 	with tempfile.TemporaryDirectory() as tmp_dir:
 		dump_name = path.join(tmp_dir, "qdep_dummy.pro")
 		with open(dump_name, "w") as dump_file:
-			dump_file.write("depends += $$fromfile($$quote({}), QDEP_DEPENDS)\n".format(pro_file))
-			dump_file.write("depends += $$fromfile($$quote({}), QDEP_PROJECT_SUBDIRS)\n".format(pro_file))
-			dump_file.write("depends += $$fromfile($$quote({}), QDEP_PROJECT_LINK_DEPENDS)\n".format(pro_file))
-			dump_file.write("depends += $$fromfile($$quote({}), QDEP_PROJECT_DEPENDS)\n".format(pro_file))
-			dump_file.write("!write_file($$PWD/qdep_depends.txt, depends):error(\"write error\")\n")
+			for index, var in enumerate(variables):
+				dump_file.write("qdep_var_{} = $$fromfile($$quote({}), {})\n".format(index, pro_file, var))
+				dump_file.write("!write_file($$PWD/qdep_var_{}.txt, qdep_var_{}):error(\"write error\")\n".format(index, index))
 		sub_run([qmake, dump_name], cwd=tmp_dir, check=True, stdout=subprocess.DEVNULL)
-		with open(path.join(tmp_dir, "qdep_depends.txt"), "r") as dep_file:
-			for line in dep_file.readlines():
-				packages.append(line.strip())
+		for index, var in enumerate(variables):
+			with open(path.join(tmp_dir, "qdep_var_{}.txt".format(index)), "r") as var_file:
+				values[var] = [line.strip() for line in var_file.readlines() if len(line.strip()) > 0]
+
+	return values
 
-	return packages
 
+def get_make_args(make, jobs=None):
+	# nmake cannot build in parallel, all other makes (including jom) understand -j
+	if path.splitext(path.basename(make))[0].lower() == "nmake":
+		return [make]
+	return [make, "-j", str(get_job_count(jobs))]
+
+
+def eval_pro_depends(pro_file, qmake, make, dump_depends=False, jobs=None):
+	import tempfile
 
-def eval_pro_depends(pro_file, qmake, make, dump_depends=False):
 	with tempfile.TemporaryDirectory() as tmp_dir:
+		# the dumps of all sub projects are written into one directory, named by the hash of their pro file
+		dump_dir = path.join(tmp_dir, ".qdep_dumps")
+		os.makedirs(dump_dir)
+		eval_env = os.environ.copy()
+		eval_env["QDEP_DUMP_DIR"] = dump_dir
+		build_dir = path.join(tmp_dir, "build")
+		os.makedirs(build_dir)
+
 		print("Running {} on {}...".format(qmake, pro_file))
-		sub_run([qmake] + (["CONFIG+=__qdep_dump_dependencies"] if dump_depends else []) + [pro_file], cwd=tmp_dir, check=True, stdout=subprocess.DEVNULL)
+		sub_run([qmake] + (["CONFIG+=__qdep_dump_dependencies"] if dump_depends else []) + [pro_file], cwd=build_dir, env=eval_env, check=True, stdout=subprocess.DEVNULL)
 		print("Running {} qmake_all...".format(make))
-		sub_run([make, "qmake_all"], cwd=tmp_dir, check=True, stdout=subprocess.DEVNULL)
+		sub_run(get_make_args(make, jobs) + ["qmake_all"], cwd=build_dir, env=eval_env, check=True, stdout=subprocess.DEVNULL)
 
 		if dump_depends:
 			all_deps = {}
-			for root, dirs, files in os.walk(tmp_dir, topdown=True):
-				for file in files:
-					if file == "qdep_depends.txt":
-						with open(path.join(root, file), "r") as dep_list:
-							dep_name = dep_list.readline().strip()
-							all_deps[dep_name] = []
-							for dep in dep_list:
-								all_deps[dep_name].append(dep.strip())
-
+			for dump_name in sorted(os.listdir(dump_dir)):
+				with open(path.join(dump_dir, dump_name), "r") as dep_list:
+					dep_name = dep_list.readline().strip()
+					all_deps[dep_name] = []
+					for dep in dep_list:
+						all_deps[dep_name].append(dep.strip())
 			return all_deps
 		else:
 			return None
@@ -219,31 +1142,40 @@ def invert_map(original):
 	return inverted
 
 
-def check_for_updates(packages):
+def check_for_updates(packages, jobs=None):
+	from concurrent.futures import ThreadPoolExecutor
+
+	# query the refs of every remote only once, and all of them in parallel
+	pkg_infos = [(package, package_resolve(package)) for package in packages]
+	pkg_urls = list(OrderedDict.fromkeys(pkg_url for _pkg, (pkg_url, pkg_version, _p) in pkg_infos if pkg_version is not None))
+	with ThreadPoolExecutor(max_workers=min(get_job_count(jobs), max(len(pkg_urls), 1))) as executor:
+		futures = {pkg_url: executor.submit(ref_listing, pkg_url) for pkg_url in pkg_urls}
+		all_listings = {pkg_url: future.result() for pkg_url, future in futures.items()}
+
 	pkg_all = []
 	pkg_new = {}
-	for package in packages:
-		pkg_url, pkg_version, _p = package_resolve(package)
+	for package, (pkg_url, pkg_version, _p) in pkg_infos:
 		if pkg_version is None:
 			pkg_all.append(package)
 			continue
 
 		# check if the package actually has any tags
-		all_tags = get_all_tags(pkg_url, allow_empty=True)
+		all_tags = all_listings[pkg_url]["index"]["tags"]
+		latest_tag = all_listings[pkg_url]["index"]["latest"]
 		if len(all_tags) == 0:
 			pkg_all.append(package)
 			continue
 
 		# check if actually a tag and not a branch
-		if pkg_version not in all_tags and pkg_version in get_all_tags(pkg_url, branches=True, tags=False, allow_empty=True):
+		if pkg_version not in all_tags and pkg_version in [name for kind, name, _sha in all_listings[pkg_url]["refs"] if kind == "heads"]:
 			pkg_all.append(package)
 			continue
 
-		# check if latest tag has changed
-		if all_tags[-1] != pkg_version:
+		# check if latest tag is newer - a prerelease newer than the latest release is kept
+		if pkg_version not in all_tags or all_tags.index(latest_tag) > all_tags.index(pkg_version):
 			pkg_name, _v, pkg_path = package_resolve(package, expand=False)
-			print("Found a new version for package {}: {} -> {}".format(pkg_name, pkg_version, all_tags[-1]))
-			new_pkg = "{}@{}{}".format(pkg_name, all_tags[-1], pkg_path)
+			print("Found a new version for package {}: {} -> {}".format(pkg_name, pkg_version, latest_tag))
+			new_pkg = "{}@{}{}".format(pkg_name, latest_tag, pkg_path)
 			pkg_all.append(new_pkg)
 			pkg_new[package] = new_pkg
 		else:
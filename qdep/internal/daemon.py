@@ -0,0 +1,57 @@
+import json
+import os
+import socket
+import sys
+from os import path
+
+from qdep.internal.common import get_cache_root
+
+
+def get_socket_path():
+	sock_path = os.getenv("QDEP_DAEMON_SOCKET")
+	if sock_path is None:
+		sock_path = path.join(get_cache_root(), "qdep.sock")
+	return sock_path
+
+
+def collect_env():
+	return {key: value for key, value in os.environ.items() if key.startswith("QDEP_")}
+
+
+def recv_all(conn):
+	data = b""
+	while True:
+		chunk = conn.recv(65536)
+		if not chunk:
+			return data
+		data += chunk
+
+
+def daemon_forward(argv, version):
+	if "-h" in argv or "--help" in argv or not hasattr(socket, "AF_UNIX"):
+		return None
+
+	sock_path = get_socket_path()
+	if not path.exists(sock_path):
+		return None
+
+	request = {
+		"version": version,
+		"argv": argv,
+		"cwd": os.getcwd(),
+		"env": collect_env()
+	}
+	try:
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+			conn.connect(sock_path)
+			conn.sendall(json.dumps(request).encode("UTF-8"))
+			conn.shutdown(socket.SHUT_WR)
+			reply = json.loads(recv_all(conn).decode("UTF-8"))
+	except (OSError, ValueError):
+		return None  # no (working) daemon - run in process instead
+
+	if reply.get("code") is None:
+		return None
+	sys.stdout.write(reply["stdout"])
+	sys.stderr.write(reply["stderr"])
+	return reply["code"]
@@ -0,0 +1,142 @@
+import sqlite3
+
+from qdep.internal.common import *
+
+
+# inventory of the source cache, so it can be inspected without walking the whole tree. It is only a view on the
+# cache - if it gets lost or out of sync, it is rebuilt from the cache directories
+def get_index_file():
+	return path.join(get_cache_root(), "index.sqlite")
+
+
+def open_index():
+	os.makedirs(get_cache_root(), exist_ok=True)
+	conn = sqlite3.connect(get_index_file(), timeout=30)
+	conn.execute("CREATE TABLE IF NOT EXISTS entries (dir TEXT PRIMARY KEY, kind TEXT, url TEXT, ref TEXT, sha TEXT, size INTEGER, fetch_time REAL, last_use REAL)")
+	return conn
+
+
+def index_update(entry_dir, kind, pkg_url, pkg_ref, commit, size, fetch_time, last_use=None):
+	try:
+		with open_index() as conn:
+			conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (entry_dir, kind, pkg_url, pkg_ref, commit, size, fetch_time, last_use if last_use is not None else fetch_time))
+		conn.close()
+	except sqlite3.Error:
+		pass  # the index is optional and rebuilt when needed, so it must never break resolving packages
+
+
+def index_touch(entry_dir, last_use):
+	try:
+		with open_index() as conn:
+			conn.execute("UPDATE entries SET last_use = ? WHERE dir = ?", (last_use, entry_dir))
+		conn.close()
+	except sqlite3.Error:
+		pass
+
+
+def index_remove(*entry_dirs):
+	try:
+		with open_index() as conn:
+			conn.executemany("DELETE FROM entries WHERE dir = ?", [(entry_dir,) for entry_dir in entry_dirs])
+		conn.close()
+	except sqlite3.Error:
+		pass
+
+
+def index_record(pkg_url, pkg_ref, entry_dir, kind="version"):
+	commit = None
+	if kind != "mirror":
+		try:
+			commit = get_checkout_commit(pkg_url, pkg_ref, entry_dir)
+		except Exception:
+			pass
+	# this runs after every fetch, so the size is only computed when the index is read
+	index_update(entry_dir, kind, pkg_url, pkg_ref, commit, None, time.time())
+
+
+def scan_entry(repo_dir, entry_dir, last_use):
+	try:
+		with open(path.join(repo_dir, ".qdep_url"), "r") as url_file:
+			pkg_url = url_file.read().strip()
+	except OSError:
+		url_res = sub_run(["git", "remote", "get-url", "origin"], cwd=entry_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+		pkg_url = url_res.stdout.strip() if url_res.returncode == 0 else None
+
+	rel_dir = path.relpath(entry_dir, repo_dir).replace(os.sep, "/")
+	if rel_dir.startswith(".commit/"):
+		kind, pkg_ref = "commit", rel_dir[len(".commit/"):]
+	else:
+		kind, pkg_ref = "version", rel_dir
+
+	if path.exists(path.join(entry_dir, ".git")):
+		head_res = sub_run(["git", "rev-parse", "HEAD"], cwd=entry_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+		commit = head_res.stdout.strip() if head_res.returncode == 0 else None
+	else:
+		commit = None
+	if path.exists(get_fetch_stamp_file(entry_dir)):
+		fetch_time = os.stat(get_fetch_stamp_file(entry_dir)).st_mtime
+	elif path.exists(path.join(entry_dir, ".qdep_static_branch")):
+		fetch_time = os.stat(path.join(entry_dir, ".qdep_static_branch")).st_mtime
+	else:
+		fetch_time = None
+	return entry_dir, kind, pkg_url, pkg_ref, commit, folder_size(entry_dir), fetch_time, last_use
+
+
+def scan_mirror(repo_dir):
+	try:
+		with open(path.join(repo_dir, ".qdep_url"), "r") as url_file:
+			pkg_url = url_file.read().strip()
+	except OSError:
+		pkg_url = None
+	mirror_dir = get_mirror_dir_of(repo_dir)
+	fetch_time = os.stat(mirror_dir).st_mtime
+	return mirror_dir, "mirror", pkg_url, None, None, folder_size(mirror_dir), fetch_time, fetch_time
+
+
+def index_rebuild(jobs=None):
+	# sizes are the expensive part, so all entries are scanned in parallel
+	from concurrent.futures import ThreadPoolExecutor
+
+	entries = list_cache_entries()
+	repo_dirs = sorted(set(repo_dir for repo_dir, _e, _l in entries if path.isdir(get_mirror_dir_of(repo_dir))))
+	with ThreadPoolExecutor(max_workers=get_job_count(jobs)) as executor:
+		rows = list(executor.map(lambda entry: scan_entry(*entry), entries))
+		rows += list(executor.map(scan_mirror, repo_dirs))
+
+	with open_index() as conn:
+		conn.execute("DELETE FROM entries")
+		conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+	conn.close()
+
+
+def index_entries(rebuild=False, jobs=None):
+	# returns all entries as (dir, kind, url, ref, sha, size, fetch_time, last_use) rows, sorted by url and ref
+	if rebuild or not path.exists(get_index_file()):
+		index_rebuild(jobs)
+
+	conn = open_index()
+	try:
+		rows = conn.execute("SELECT * FROM entries ORDER BY url, kind, ref").fetchall()
+	finally:
+		conn.close()
+	if not rebuild and any(not path.isdir(row[0]) for row in rows):
+		return index_entries(rebuild=True, jobs=jobs)  # stale - entries were removed by other means, like clear
+	return index_sizes(rows, jobs)
+
+
+def index_sizes(rows, jobs=None):
+	# computes the sizes of entries that were recorded or fetched since the index was last read
+	from concurrent.futures import ThreadPoolExecutor
+
+	missing = [row for row in rows if row[5] is None]
+	if len(missing) == 0:
+		return rows
+	with ThreadPoolExecutor(max_workers=get_job_count(jobs)) as executor:
+		sizes = dict(zip([row[0] for row in missing], executor.map(lambda row: folder_size(row[0]), missing)))
+	try:
+		with open_index() as conn:
+			conn.executemany("UPDATE entries SET size = ? WHERE dir = ?", [(size, entry_dir) for entry_dir, size in sizes.items()])
+		conn.close()
+	except sqlite3.Error:
+		pass
+	return [row[:5] + (sizes[row[0]],) + row[6:] if row[0] in sizes else row for row in rows]
@@ -6,6 +6,7 @@ __qdep_script_version = $$system($$QDEP_TOOL --version)
 
 # set some variables
 isEmpty(QDEP_CACHE_SCOPE): QDEP_CACHE_SCOPE = stash
+isEmpty(QDEP_LOCK_FILE):exists($$_PRO_FILE_PWD_/qdep.lock): QDEP_LOCK_FILE = $$_PRO_FILE_PWD_/qdep.lock
 
 isEmpty(QDEP_GENERATED_DIR): QDEP_GENERATED_DIR = $$OUT_PWD
 debug_and_release:CONFIG(release, debug|release): QDEP_GENERATED_SOURCES_DIR = $${QDEP_GENERATED_DIR}/release
@@ -38,77 +39,66 @@ isEmpty(__QDEP_TUPLE_SEPERATOR): __QDEP_TUPLE_SEPERATOR = "---"
 CONFIG += qdep_build
 DEFINES += QDEP_BUILD
 
-# The primary dependecy collector function
+# The primary dependecy collector function - resolves the whole dependency tree in a single qdep call and includes the result
 defineTest(qdepCollectDependencies) {
-	# transform all dependencies into unique hashes
 	qdep_dependencies = 
 	for(arg, ARGS): qdep_dependencies += $$system_quote($$arg)
+
+	# packages that are already included, e.g. by linked libraries, are passed with the package they were included as
+	qdep_included_args = 
+	for(dep_hash, __QDEP_INCLUDE_CACHE): qdep_included_args += --included $$dep_hash $$system_quote($$first($${dep_hash}.package))
+	qdep_cache_args = 
+	for(cache_file, _QMAKE_SUPER_CACHE_ _QMAKE_CACHE_ _QMAKE_STASH_): !isEmpty($$cache_file): qdep_cache_args += --cache-file $$system_quote($$eval($$cache_file))
+	# package versions set in this scope, e.g. in the pro file or .qmake.conf, are used instead of the cached ones
+	qdep_scope_vars = $$enumerate_vars()
+	for(qdep_var, qdep_scope_vars): contains(qdep_var, "^__QDEP_PKG_[0-9a-f]+\\\\.version$"):!isEmpty($$qdep_var): \\
+		qdep_cache_args += --known $$system_quote($$section(qdep_var, ., 0, 0)=$$first($$qdep_var))
+
+	dep_extra_args = 
+	qdep_no_pull: dep_extra_args += --no-pull
+	!isEmpty(QDEP_PULL_INTERVAL): dep_extra_args += --pull-interval $$QDEP_PULL_INTERVAL
+	!isEmpty(QDEP_LOCK_FILE): dep_extra_args += --lock-file $$system_quote($$QDEP_LOCK_FILE)
+	qdep_frozen: dep_extra_args += --frozen
+	qdep_no_clone: dep_extra_args += --no-clone
 	qdep_ok = 
-	qdep_hashes = $$system($$QDEP_TOOL dephash $$qdep_dependencies, lines, qdep_ok)
+	qdep_pro_name = $$basename(_PRO_FILE_)
+	qdep_tree_pri = $$QDEP_GENERATED_DIR/$$replace(qdep_pro_name, "\\\\.[^\\\\.]*$", "_qdep_tree.pri")
+	qdep_tree_log = $$system($$QDEP_TOOL resolve-tree --qmake $$system_quote($$QMAKE_QMAKE) $$dep_extra_args $$qdep_included_args $$qdep_cache_args $$system_quote($$qdep_tree_pri) $$qdep_dependencies, lines, qdep_ok)
 	!equals(qdep_ok, 0):return(false)
 
-	for(dep_hash, qdep_hashes) {
-		# handle each dependency, but each package only once
-		dep_pkg = $$take_first(ARGS)
-		!contains(__QDEP_INCLUDE_CACHE, $$dep_hash) {
-			# Install the sources and extract some parameters
-			dep_extra_args = 
-			qdep_no_pull: dep_extra_args += --no-pull
-			qdep_no_clone: dep_extra_args += --no-clone
-			!isEmpty($${dep_hash}.version): dep_vers_arg = $$system_quote($$first($${dep_hash}.version))
-			else: dep_vers_arg =
-			qdep_ok = 
-			dep_data = $$system($$QDEP_TOOL pkgresolve $$dep_extra_args $$system_quote($$dep_pkg) $$dep_vers_arg, lines, qdep_ok)
-			!equals(qdep_ok, 0):return(false)
-			!equals(dep_hash, $$take_first(dep_data)):error("Critical internal error: dependencies out of sync"):return(false)
-
-			dep_version = $$take_first(dep_data)
-			dep_base = $$take_first(dep_data)
-			dep_path = $$take_first(dep_data)
-			dep_needs_cache = $$take_first(dep_data)
-
-			$${dep_hash}.package = $$dep_pkg
-			$${dep_hash}.version = $$dep_version
-			$${dep_hash}.path = $${dep_base}$${dep_path}
-			$${dep_hash}.exports = 
-			$${dep_hash}.local = 1
-			export($${dep_hash}.package)
-			export($${dep_hash}.version)
-			export($${dep_hash}.path)
-			export($${dep_hash}.local)
-
-			# Cache the package version for dependencies with undetermined versions
-			!qdep_no_cache:equals(dep_needs_cache, True):!cache($${dep_hash}.version, set $$QDEP_CACHE_SCOPE):warning("Failed to cache package version for $$dep_pkg")
-
-			# Find all dependencies that package depends on and call this method recursively for those
-			sub_deps = $$fromfile($$eval($${dep_hash}.path), QDEP_DEPENDS)
-			__QDEP_REAL_DEPS_STACK += $$dep_hash			
-			!isEmpty(sub_deps):!qdepCollectDependencies($$sub_deps):return(false)			
-			__QDEP_INCLUDE_CACHE *= $$take_last(__QDEP_REAL_DEPS_STACK)
-			export(__QDEP_INCLUDE_CACHE)
-
-			# Handle all defines for symbol exports, if specified
-			sub_exports = $$fromfile($$eval($${dep_hash}.path), QDEP_PACKAGE_EXPORTS)
-
-			qdep_export_all|contains(QDEP_EXPORTS, $$dep_pkg) {
-				!static:!staticlib:for(sub_export, sub_exports) {
-					DEFINES += "$${sub_export}=Q_DECL_EXPORT"
-					QDEP_EXPORTED_DEFINES += "$${sub_export}=Q_DECL_IMPORT"
-					$${dep_hash}.exports += $$sub_export
-				} else:for(sub_export, sub_exports) {
-					DEFINES += "$${sub_export}="
-					QDEP_EXPORTED_DEFINES += "$${sub_export}="
-				}
-			} else:for(sub_export, sub_exports): \\
-				DEFINES += "$${sub_export}="
-			export(DEFINES)
-			export(QDEP_EXPORTED_DEFINES)
-			export($${dep_hash}.exports)
-		} else: \\
-			!equals($${dep_hash}.package, $$dep_pkg): \\
-			warning("Detected includes of multiple different versions of the same dependency. Package \\"$$first($${dep_hash}.package)\\" is used, and package \\"$$dep_pkg\\" was detected.")
+	!include($$qdep_tree_pri):return(false)
+	for(dep_hash, __QDEP_INCLUDE_CACHE) {
+		export($${dep_hash}.package)
+		export($${dep_hash}.version)
+		export($${dep_hash}.path)
+		export($${dep_hash}.exports)
+		export($${dep_hash}.local)
 	}
+	export(__QDEP_INCLUDE_CACHE)
+	export(DEFINES)
+	export(QDEP_EXPORTED_DEFINES)
+	return(true)
+}
 
+# Handle all defines for symbol exports of a package, if specified
+defineTest(qdepPackageExports) {
+	dep_hash = $$1
+	dep_pkg = $$first($${dep_hash}.package)
+	sub_exports = $$2
+	qdep_export_all|contains(QDEP_EXPORTS, $$dep_pkg) {
+		!static:!staticlib:for(sub_export, sub_exports) {
+			DEFINES += "$${sub_export}=Q_DECL_EXPORT"
+			QDEP_EXPORTED_DEFINES += "$${sub_export}=Q_DECL_IMPORT"
+			$${dep_hash}.exports += $$sub_export
+		} else:for(sub_export, sub_exports) {
+			DEFINES += "$${sub_export}="
+			QDEP_EXPORTED_DEFINES += "$${sub_export}="
+		}
+	} else:for(sub_export, sub_exports): \\
+		DEFINES += "$${sub_export}="
+	export(DEFINES)
+	export(QDEP_EXPORTED_DEFINES)
+	export($${dep_hash}.exports)
 	return(true)
 }
 
@@ -121,26 +111,48 @@ defineTest(qdepCollectProjectDependencies) {
 	qdep_hashes = $$system($$QDEP_TOOL dephash --project $$qdep_dependencies, lines, qdep_ok)
 	!equals(qdep_ok, 0):return(false)
 
+	# Install the sources of all packages of this level that are not included yet in a single call
+	qdep_resolve_args = 
+	qdep_resolve_mask = 
+	qdep_resolve_pkgs = $$ARGS
+	qdep_resolve_hashes = 
 	for(dep_hash, qdep_hashes) {
-		# handle each dependency, but each package only once
-		dep_pkg = $$take_first(ARGS)
-		!contains(__QDEP_INCLUDE_CACHE, $$dep_hash) {
-			# Install the sources and extract some parameters
-			dep_extra_args = 
-			qdep_no_pull: dep_extra_args += --no-pull
-			qdep_no_clone: dep_extra_args += --no-clone
-			!isEmpty($${dep_hash}.version): dep_vers_arg = $$system_quote($$first($${dep_hash}.version))
-			else: dep_vers_arg =
-			qdep_ok = 
-			dep_data = $$system($$QDEP_TOOL pkgresolve --project $$dep_extra_args $$system_quote($$dep_pkg) $$dep_vers_arg, lines, qdep_ok)
-			!equals(qdep_ok, 0):return(false)
-			!equals(dep_hash, $$take_first(dep_data)):error("Critical internal error: project dependencies out of sync"):return(false)
+		# only the first package of every hash is used, the others only cause a warning below
+		dep_pkg = $$take_first(qdep_resolve_pkgs)
+		contains(__QDEP_INCLUDE_CACHE, $$dep_hash)|contains(qdep_resolve_hashes, $$dep_hash): qdep_resolve_mask += 0
+		else {
+			qdep_resolve_mask += 1
+			qdep_resolve_hashes += $$dep_hash
+			qdep_resolve_args += $$system_quote($$dep_pkg) $$system_quote($$first($${dep_hash}.version))
+		}
+	}
+	qdep_resolve_data = 
+	!isEmpty(qdep_resolve_args) {
+		dep_extra_args = 
+		qdep_no_pull: dep_extra_args += --no-pull
+		!isEmpty(QDEP_PULL_INTERVAL): dep_extra_args += --pull-interval $$QDEP_PULL_INTERVAL
+		!isEmpty(QDEP_LOCK_FILE): dep_extra_args += --lock-file $$system_quote($$QDEP_LOCK_FILE)
+		qdep_frozen: dep_extra_args += --frozen
+		qdep_no_clone: dep_extra_args += --no-clone
+		qdep_ok = 
+		qdep_resolve_data = $$system($$QDEP_TOOL pkgresolve --project --batch $$dep_extra_args $$qdep_resolve_args, lines, qdep_ok)
+		!equals(qdep_ok, 0):return(false)
+	}
 
-			dep_version = $$take_first(dep_data)
-			dep_base = $$take_first(dep_data)
-			dep_path = $$take_first(dep_data)
-			dep_needs_cache = $$take_first(dep_data)
+	for(dep_hash, qdep_hashes) {
+		# take the resolved data of the dependency, even if it was included by a previous dependency in the meantime
+		dep_pkg = $$take_first(ARGS)
+		dep_resolved = $$take_first(qdep_resolve_mask)
+		equals(dep_resolved, 1) {
+			!equals(dep_hash, $$take_first(qdep_resolve_data)):error("Critical internal error: project dependencies out of sync"):return(false)
+			dep_version = $$take_first(qdep_resolve_data)
+			dep_base = $$take_first(qdep_resolve_data)
+			dep_path = $$take_first(qdep_resolve_data)
+			dep_needs_cache = $$take_first(qdep_resolve_data)
+		}
 
+		# handle each dependency, but each package only once
+		!contains(__QDEP_INCLUDE_CACHE, $$dep_hash) {
 			$${dep_hash}.package = $$dep_pkg
 			$${dep_hash}.version = $$dep_version
 			$${dep_hash}.path = $${dep_base}$${dep_path}
@@ -398,7 +410,10 @@ defineTest(qdepDumpUpdateDeps) {
 	dump_data += $$QDEP_PROJECT_SUBDIRS
 	dump_data += $$QDEP_PROJECT_LINK_DEPENDS
 	dump_data += $$QDEP_PROJECT_DEPENDS
-	write_file($$OUT_PWD/qdep_depends.txt, dump_data):return(true)
+	dump_dir = $$(QDEP_DUMP_DIR)
+	isEmpty(dump_dir): dump_file = $$OUT_PWD/qdep_depends.txt
+	else: dump_file = $$dump_dir/$$sha1($$_PRO_FILE_).txt
+	write_file($$dump_file, dump_data):return(true)
 	else:return(false)
 }
 
@@ -510,14 +525,25 @@ qm_files.CONFIG += no_check_exist
 	__QDEP_ORIGINAL_TRANSLATIONS = $$TRANSLATIONS
 	TRANSLATIONS = 
 
+	qdep_builtin_lconvert: __qdep_lconvert_flags = --builtin
+
+	# combine all translations in parallel in one call first - the per file compiler then only verifies the results
+	__qdep_ts_combine_c.name = qdep lconvert
+	__qdep_ts_combine_c.input = __QDEP_ORIGINAL_TRANSLATIONS
+	__qdep_ts_combine_c.commands = $$QDEP_PATH lconvert $$__qdep_lconvert_flags --combine $$qdepShellQuote($$QDEP_TRANSLATIONS) --outdir $$qdepShellQuote($$QDEP_GENERATED_TS_DIR) --stamp ${QMAKE_FILE_OUT} --ts-files ${QMAKE_FILE_IN} -- $$QDEP_LCONVERT
+	__qdep_ts_combine_c.output = $$QDEP_GENERATED_TS_DIR/qdep_combine.stamp
+	__qdep_ts_combine_c.CONFIG += target_predeps combine no_link
+	__qdep_ts_combine_c.depends += $$QDEP_PATH $$QDEP_LCONVERT_EXE $$QDEP_TRANSLATIONS
+	QMAKE_EXTRA_COMPILERS += __qdep_ts_combine_c
+
 	# compiler for combined translations
 	__qdep_qm_combine_c.name = qdep lrelease ${QMAKE_FILE_IN}
 	__qdep_qm_combine_c.input = __QDEP_ORIGINAL_TRANSLATIONS 
 	__qdep_qm_combine_c.variable_out = TRANSLATIONS
-	__qdep_qm_combine_c.commands = $$QDEP_PATH lconvert --combine $$qdepShellQuote($$QDEP_TRANSLATIONS) -- ${QMAKE_FILE_IN} ${QMAKE_FILE_OUT} $$QDEP_LCONVERT
+	__qdep_qm_combine_c.commands = $$QDEP_PATH lconvert $$__qdep_lconvert_flags --combine $$qdepShellQuote($$QDEP_TRANSLATIONS) -- ${QMAKE_FILE_IN} ${QMAKE_FILE_OUT} $$QDEP_LCONVERT
 	__qdep_qm_combine_c.output = $$QDEP_GENERATED_TS_DIR/${QMAKE_FILE_BASE}.ts
 	__qdep_qm_combine_c.CONFIG += no_link
-	__qdep_qm_combine_c.depends += $$QDEP_PATH $$QDEP_LCONVERT_EXE $$QDEP_TRANSLATIONS
+	__qdep_qm_combine_c.depends += $$QDEP_PATH $$QDEP_LCONVERT_EXE $$QDEP_TRANSLATIONS $$QDEP_GENERATED_TS_DIR/qdep_combine.stamp
 	QMAKE_EXTRA_COMPILERS += __qdep_qm_combine_c
 
 	# copy from lrelease.prf - needed as TRANSLATIONS is now empty
@@ -10,20 +10,98 @@ def dephash(*packages, project=False, pkgpath=False):
 			print(pkg_hash(pkg_url, pkg_path))
 
 
-def pkgresolve(package, latest_version=None, project=False, pull=True, clone=True):
+def make_resolver(project=False, pull=True, clone=True, pull_interval=None, lock_file=None, frozen=False):
 	ov_map = get_override_map()
+	lock = read_lock_file(lock_file)
+
+	def resolve_one(package, latest_version):
+		pkg_url, pkg_branch, pkg_path = package_resolve(package, pkg_version=latest_version, project=project)
+		needs_cache = pkg_branch is None
+		if pkg_url in ov_map:
+			pkg_base = ov_map[pkg_url]
+		else:
+			# locked packages are resolved by the version they were requested with, not the cached latest version
+			_u, req_branch, _p = package_resolve(package, project=project)
+			locked = get_locked_entry(lock, pkg_url, req_branch, frozen=frozen)
+			if locked is not None:
+				pkg_base, pkg_branch = get_locked_sources(pkg_url, locked["ref"], locked["commit"], frozen=frozen)
+			else:
+				pkg_base, pkg_branch = get_sources(pkg_url, pkg_branch, pull=pull, clone=clone, pull_interval=pull_interval)
+		return [pkg_hash(pkg_url, pkg_path), pkg_branch, pkg_base, pkg_path, needs_cache]
+
+	return resolve_one
+
+
+def resolve_all(resolve_one, packages, jobs=None):
+	from concurrent.futures import ThreadPoolExecutor
+
+	# packages are (package, latest_version) tuples - resolve each distinct one once, all of them concurrently
+	unique_packages = list(OrderedDict.fromkeys(packages))
+	with ThreadPoolExecutor(max_workers=min(get_job_count(jobs), max(len(unique_packages), 1))) as executor:
+		futures = {package: executor.submit(resolve_one, *package) for package in unique_packages}
+		return {package: future.result() for package, future in futures.items()}
+
+
+def pkgresolve(*packages, project=False, pull=True, clone=True, jobs=None, pull_interval=None, lock_file=None, frozen=False):
+	resolve_one = make_resolver(project=project, pull=pull, clone=clone, pull_interval=pull_interval, lock_file=lock_file, frozen=frozen)
+	results = resolve_all(resolve_one, packages, jobs=jobs)
+	for package in packages:
+		for value in results[package]:
+			print(value)
+
+
+def pri_quote(value):
+	return "$$quote({})".format(value)
 
-	pkg_url, pkg_branch, pkg_path = package_resolve(package, pkg_version=latest_version, project=project)
-	needs_cache = pkg_branch is None
-	if pkg_url in ov_map:
-		pkg_base = ov_map[pkg_url]
-	else:
-		pkg_base, pkg_branch = get_sources(pkg_url, pkg_branch, pull=pull, clone=clone)
-	print(pkg_hash(pkg_url, pkg_path))
-	print(pkg_branch)
-	print(pkg_base)
-	print(pkg_path)
-	print(needs_cache)
+
+def resolvetree(outfile, *packages, included=None, cache_files=None, known=None, qmake="qmake", pull=True, clone=True, pull_interval=None, lock_file=None, frozen=False):
+	from qdep.internal.proparser import read_cache_file
+
+	# the same traversal as a recursive qdepCollectDependencies, but within one process. The result is a pri file the
+	# prf includes, with the assignments in the order the qmake recursion would have made them
+	resolve_one = make_resolver(pull=pull, clone=clone, pull_interval=pull_interval, lock_file=lock_file, frozen=frozen)
+
+	cached_values = {}
+	for cache_file in (cache_files if cache_files is not None else []):
+		if path.exists(cache_file):
+			cached_values.update(read_cache_file(cache_file))
+	# versions the project already knows, e.g. from its pro file - these override the cache, just like in qmake
+	for hash_version in (known if known is not None else []):
+		dep_hash, dep_version = hash_version.split("=", 1)
+		cached_values[dep_hash + ".version"] = [dep_version]
+
+	# packages that are already included, by hash. Packages are added as soon as they are visited, so cycles end there
+	known_packages = OrderedDict(included if included is not None else [])
+	out_lines = []
+
+	def collect(level_packages):
+		# packages are resolved one by one, in the order the qmake recursion would have - a package of this level may
+		# already be included by the subtree of a previous one, and must not be resolved then
+		for package in level_packages:
+			pkg_url, _b, pkg_path = package_resolve(package)
+			dep_hash = pkg_hash(pkg_url, pkg_path)
+			if dep_hash not in known_packages:
+				known_packages[dep_hash] = package
+				cached_version = cached_values.get(dep_hash + ".version", [])
+				_h, dep_version, dep_base, dep_path, dep_needs_cache = resolve_one(package, cached_version[0] if len(cached_version) > 0 else None)
+				dep_pri = dep_base + dep_path
+				out_lines.append("{}.package = {}".format(dep_hash, pri_quote(package)))
+				out_lines.append("{}.version = {}".format(dep_hash, pri_quote(dep_version)))
+				out_lines.append("{}.path = {}".format(dep_hash, pri_quote(dep_pri)))
+				out_lines.append("{}.exports =".format(dep_hash))
+				out_lines.append("{}.local = 1".format(dep_hash))
+				if dep_needs_cache:
+					out_lines.append("!qdep_no_cache:!cache({}.version, set $$QDEP_CACHE_SCOPE):warning(\"Failed to cache package version for {}\")".format(dep_hash, package))
+
+				pri_values = read_pro_variables(dep_pri, ["QDEP_DEPENDS", "QDEP_PACKAGE_EXPORTS"], qmake)
+				collect(pri_values["QDEP_DEPENDS"])
+				out_lines.append("__QDEP_INCLUDE_CACHE *= {}".format(dep_hash))
+				out_lines.append("!qdepPackageExports({}, {}):error(\"Failed to export symbols of {}\")".format(dep_hash, " ".join(pri_quote(sub_export) for sub_export in pri_values["QDEP_PACKAGE_EXPORTS"]), package))
+			elif known_packages[dep_hash] != package:
+				out_lines.append("warning(\"Detected includes of multiple different versions of the same dependency. Package \\\"{}\\\" is used, and package \\\"{}\\\" was detected.\")".format(known_packages[dep_hash], package))
+
+	collect(packages)
+	write_file_atomic(outfile, "".join(line + "\n" for line in out_lines))
 
 
 def hookgen(prefix, header, resources=None, hooks=None):
@@ -32,26 +110,30 @@ def hookgen(prefix, header, resources=None, hooks=None):
 	if hooks is None:
 		hooks = []
 
+	# hooks run in the order they were given, resources are independent of each other and therefore sorted
+	hooks = list(OrderedDict.fromkeys(hooks))
+	resource_names = sorted(set(cpp_escape(path.splitext(path.basename(resource))[0]) for resource in resources))
+
 	inc_guard = cpp_escape(path.basename(header)).upper()
-	with open(header, "w") as out_file:
-		out_file.write("#ifndef {}\n".format(inc_guard))
-		out_file.write("#define {}\n\n".format(inc_guard))
+	out_data = "#ifndef {}\n".format(inc_guard)
+	out_data += "#define {}\n\n".format(inc_guard)
 
-		out_file.write("#include <QtCore/qglobal.h>\n\n")
+	out_data += "#include <QtCore/qglobal.h>\n\n"
 
-		for hook in hooks:
-			out_file.write(declare_hook(hook))
+	for hook in hooks:
+		out_data += declare_hook(hook)
 
-		out_file.write("\ninline void qdep_{}_init() {{\n".format(cpp_escape(prefix)))
-		out_file.write("\t// resources\n")
-		for resource in resources:  # ignore the first argument, as it is always the current pro file (to ensure this rule is always run
-			out_file.write("\tQ_INIT_RESOURCE({});\n".format(cpp_escape(path.splitext(path.basename(resource))[0])))
-		out_file.write("\t// hooks\n")
-		for hook in hooks:
-			out_file.write("\t::{}();\n".format(hook))
-		out_file.write("}\n\n")
+	out_data += "\ninline void qdep_{}_init() {{\n".format(cpp_escape(prefix))
+	out_data += "\t// resources\n"
+	for resource_name in resource_names:
+		out_data += "\tQ_INIT_RESOURCE({});\n".format(resource_name)
+	out_data += "\t// hooks\n"
+	for hook in hooks:
+		out_data += "\t::{}();\n".format(hook)
+	out_data += "}\n\n"
 
-		out_file.write("#endif //{}\n".format(inc_guard))
+	out_data += "#endif //{}\n".format(inc_guard)
+	write_file_if_changed(header, out_data)
 
 
 def hookimp(outfile, headers=None, hooks=None):
@@ -60,35 +142,32 @@ def hookimp(outfile, headers=None, hooks=None):
 	if hooks is None:
 		hooks = []
 
-	with open(outfile, "w") as out_file:
-		targets = []
-		target_regex = re.compile(r".*qdep_(.*)_hooks\.h$")
-
-		out_file.write("#include <QtCore/QCoreApplication>\n")
-		for header in headers:
-			abs_path = path.abspath(header)
-			out_file.write("#include \"{}\"\n".format(abs_path))
-			targets.append(re.match(target_regex, header).group(1))
+	hooks = list(OrderedDict.fromkeys(hooks))
+	targets = []
+	target_regex = re.compile(r".*qdep_(.*)_hooks\.h$")
 
-		out_file.write("\n")
-		for hook in hooks:
-			out_file.write(declare_hook(hook))
+	out_data = "#include <QtCore/QCoreApplication>\n"
+	for header in OrderedDict.fromkeys(path.abspath(header) for header in headers):
+		out_data += "#include \"{}\"\n".format(header)
+		targets.append(re.match(target_regex, header).group(1))
 
-		out_file.write("\nnamespace {\n\n")
-		out_file.write("void __qdep_startup_hooks() {\n")
-		for target in targets:
-			out_file.write("\tqdep_{}_init();\n".format(cpp_escape(target)))
-		for hook in hooks:
-			out_file.write("\t::{}();\n".format(hook))
-		out_file.write("}\n\n")
-		out_file.write("}\n")
-		out_file.write("Q_COREAPP_STARTUP_FUNCTION(__qdep_startup_hooks)\n")
+	out_data += "\n"
+	for hook in hooks:
+		out_data += declare_hook(hook)
 
+	out_data += "\nnamespace {\n\n"
+	out_data += "void __qdep_startup_hooks() {\n"
+	for target in targets:
+		out_data += "\tqdep_{}_init();\n".format(cpp_escape(target))
+	for hook in hooks:
+		out_data += "\t::{}();\n".format(hook)
+	out_data += "}\n\n"
+	out_data += "}\n"
+	out_data += "Q_COREAPP_STARTUP_FUNCTION(__qdep_startup_hooks)\n"
+	write_file_if_changed(outfile, out_data)
 
-def lconvert(tsfile, outfile, *combine_files, lconvert_args=None):
-	if lconvert_args is None:
-		lconvert_args = ["lconvert"]
 
+def lconvert_suffix_map(combine_files):
 	# sort combine args into a map of the languages
 	sub_map = dict()
 	for sub_arg in combine_files:
@@ -99,7 +178,10 @@ def lconvert(tsfile, outfile, *combine_files, lconvert_args=None):
 			if suffix not in sub_map:
 				sub_map[suffix] = []
 			sub_map[suffix].append(sub_arg)
+	return sub_map
+
 
+def lconvert_combine_list(tsfile, sub_map):
 	# find the qm files to combine with the input
 	target_base = path.splitext(path.basename(tsfile))[0]
 	ts_args = target_base.split("_")[1:]
@@ -109,9 +191,83 @@ def lconvert(tsfile, outfile, *combine_files, lconvert_args=None):
 		if suffix in sub_map:
 			combine_list = combine_list + sub_map[suffix]
 	combine_list.append(tsfile)
+	return combine_list
 
-	# run lconvert
-	sub_run(lconvert_args + ["-if", "ts", "-i"] + combine_list + ["-of", "ts", "-o", outfile], check=True)
+
+def file_hash(file_path):
+	with open(file_path, "rb") as in_file:
+		return hashlib.sha256(in_file.read()).hexdigest()
+
+
+def get_lconvert_manifest_file(outfile):
+	return path.join(path.dirname(path.abspath(outfile)), "." + path.basename(outfile) + ".qdep_manifest")
+
+
+def lconvert_one(outfile, combine_list, lconvert_args, hash_fn=file_hash, builtin=False):
+	# the manifest records what the output was generated from - lconvert only runs if any of that changed
+	import shutil
+
+	tool_path = shutil.which(lconvert_args[0])
+	tool_stat = os.stat(tool_path) if tool_path is not None else None
+	manifest = {
+		"tool": lconvert_args,
+		"builtin": builtin,
+		"tool_stamp": [tool_stat.st_size, tool_stat.st_mtime] if tool_stat is not None else None,
+		"inputs": [[path.abspath(in_file), hash_fn(in_file)] for in_file in combine_list]
+	}
+
+	manifest_file = get_lconvert_manifest_file(outfile)
+	try:
+		with open(manifest_file, "r") as in_file:
+			old_manifest = json.load(in_file)
+		if old_manifest.pop("output") == file_hash(outfile) and old_manifest == manifest:
+			return False
+	except (OSError, ValueError, KeyError):
+		pass  # no or an outdated manifest - generate the output
+
+	# the builtin merge is opt-in and only knows the options qdep passes by default - anything else is left to lconvert
+	merged = False
+	if builtin and set(lconvert_args[1:]) == {"-sort-contexts"}:
+		from qdep.internal.tsmerge import merge_ts, UnsupportedTsError
+		try:
+			merge_ts(combine_list, outfile)
+			merged = True
+		except UnsupportedTsError:
+			pass
+	if not merged:
+		sub_run(lconvert_args + ["-if", "ts", "-i"] + combine_list + ["-of", "ts", "-o", outfile], check=True)
+	manifest["output"] = file_hash(outfile)
+	write_file_atomic(manifest_file, json.dumps(manifest))
+	return True
+
+
+def lconvert(tsfile, outfile, *combine_files, lconvert_args=None, builtin=False):
+	if lconvert_args is None:
+		lconvert_args = ["lconvert"]
+
+	combine_list = lconvert_combine_list(tsfile, lconvert_suffix_map(combine_files))
+	lconvert_one(outfile, combine_list, lconvert_args, builtin=builtin)
+
+
+def lconvert_multi(outdir, tsfiles, *combine_files, lconvert_args=None, stamp=None, jobs=None, builtin=False):
+	from concurrent.futures import ThreadPoolExecutor
+
+	if lconvert_args is None:
+		lconvert_args = ["lconvert"]
+	if jobs is None or jobs <= 0:
+		jobs = os.cpu_count() or 1  # lconvert is cpu bound, so more jobs than cores do not help
+
+	os.makedirs(outdir, exist_ok=True)
+	# the package translations are shared by many outputs, so every input is only hashed once
+	sub_map = lconvert_suffix_map(combine_files)
+	combine_lists = [(path.join(outdir, path.splitext(path.basename(tsfile))[0] + ".ts"), lconvert_combine_list(tsfile, sub_map)) for tsfile in tsfiles]
+	with ThreadPoolExecutor(max_workers=jobs) as executor:
+		all_inputs = list(OrderedDict.fromkeys(in_file for _o, combine_list in combine_lists for in_file in combine_list))
+		hashes = dict(zip(all_inputs, executor.map(file_hash, all_inputs)))
+		changed = list(executor.map(lambda entry: lconvert_one(entry[0], entry[1], lconvert_args, hash_fn=hashes.get, builtin=builtin), combine_lists))
+
+	if stamp is not None and (any(changed) or not path.exists(stamp)):
+		write_file_atomic(stamp, "".join(outfile + "\n" for outfile, _c in combine_lists))
 
 
 def prolink(prodir, pkghash, pkgpath, link=None):
@@ -123,24 +279,25 @@ def prolink(prodir, pkghash, pkgpath, link=None):
 		print(pro_target)
 		return
 
-	# normal mode -> first unlink any existing stuff
+	# normal mode -> first unlink any existing stuff. Synced copies are kept, so only changed files have to be updated
 	if path.islink(link_target):
 		if os.name == 'nt' and path.isdir(link_target):
 			os.rmdir(link_target)
 		else:
 			os.unlink(link_target)
-	elif path.isdir(link_target):
-		shutil.rmtree(link_target)
-	elif path.exists(link_target):
+	elif path.exists(link_target) and not path.isdir(link_target):
 		os.remove(link_target)
 
 	# then link the correct project again
-	try:
-		os.makedirs(path.dirname(link_target), exist_ok=True)
-		os.symlink(link, link_target, target_is_directory=True)
-	except OSError:
-		# symlink is not possible, copy instead
-		print("Project WARNING: Failed to symlink project dependecy. Performing deep copy instead", file=sys.stderr)
-		shutil.copytree(link, link_target, symlinks=True, ignore_dangling_symlinks=True)
+	os.makedirs(path.dirname(link_target), exist_ok=True)
+	if path.isdir(link_target):
+		sync_tree(link, link_target)  # was synced before, because symlinks are not possible
+	else:
+		try:
+			os.symlink(link, link_target, target_is_directory=True)
+		except OSError:
+			# symlink is not possible, sync via reflinks, hardlinks or copies instead
+			print("Project WARNING: Failed to symlink project dependecy. Performing incremental sync instead", file=sys.stderr)
+			sync_tree(link, link_target)
 
 	print(pro_target)
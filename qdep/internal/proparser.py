@@ -0,0 +1,71 @@
+import re
+
+
+# reads plain variable assignments from pro/pri files without running qmake. Only the subset of the qmake language that
+# can be evaluated without a qmake context is supported - anything else raises an UnsupportedSyntaxError
+class UnsupportedSyntaxError(Exception):
+	pass
+
+
+assign_pattern = re.compile(r'^([A-Za-z_][\w.]*)\s*(=|\+=|\*=|-=)\s*(.*)$')
+indirect_assign_pattern = re.compile(r'^[^=\s]*\$[^=\s]*\s*[-+*~]?=')
+dynamic_pattern = re.compile(r'\b(include|load|eval|cache|fromfile|for|defineTest|defineReplace|export|unset|requires)\s*\(')
+qdep_load_pattern = re.compile(r'^!?load\(\s*qdep\s*\)(\s*:.*)?$')
+unsafe_value_pattern = re.compile(r'[$"\'\\{}]')
+
+
+def logical_lines(pro_file):
+	with open(pro_file, "r", encoding="UTF-8") as file:
+		lines = file.read().splitlines()
+
+	statement = ""
+	for line_nr, line in enumerate(lines, start=1):
+		line = line.split("#", 1)[0].rstrip()
+		if line.endswith("\\"):
+			statement += line[:-1] + " "
+			continue
+		statement += line
+		if len(statement.strip()) > 0:
+			yield line_nr, statement.strip()
+		statement = ""
+	if len(statement.strip()) > 0:
+		yield len(lines), statement.strip()
+
+
+def read_variables(pro_file, variables):
+	values = {var: [] for var in variables}
+	var_pattern = re.compile(r'\b(' + "|".join(re.escape(var) for var in variables) + r')\b')
+
+	depth = 0
+	for line_nr, statement in logical_lines(pro_file):
+		brace_statement = re.sub(r'\$\$\{[^}]*\}', "", statement)
+		if re.search(var_pattern, statement) or re.search(dynamic_pattern, statement) or re.match(indirect_assign_pattern, statement):
+			match = re.match(assign_pattern, statement)
+			if re.match(qdep_load_pattern, statement):
+				pass  # the qdep feature skips itself when evaluated without a context, like by $$fromfile
+			elif depth == 0 and match and match.group(1) in values and not re.search(unsafe_value_pattern, match.group(3)):
+				var, op, value_list = match.group(1), match.group(2), match.group(3).split()
+				if op == "=":
+					values[var] = value_list
+				elif op == "+=":
+					values[var] += value_list
+				elif op == "*=":
+					for value in value_list:
+						if value not in values[var]:
+							values[var].append(value)
+				elif op == "-=":
+					values[var] = [value for value in values[var] if value not in value_list]
+			else:
+				raise UnsupportedSyntaxError("{}:{}: Cannot evaluate '{}' without qmake".format(pro_file, line_nr, statement))
+		depth += brace_statement.count("{") - brace_statement.count("}")
+	return values
+
+
+def read_cache_file(cache_file):
+	# the files written by qmake's cache() function only contain plain assignments, one per variable
+	values = {}
+	for _l, statement in logical_lines(cache_file):
+		match = re.match(assign_pattern, statement)
+		if match and match.group(2) == "=":
+			values[match.group(1)] = [value.strip('"') for value in match.group(3).split()]
+	return values
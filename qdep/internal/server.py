@@ -0,0 +1,94 @@
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from os import path
+
+from qdep.internal.cli import find_operation, forwarded_operations
+from qdep.internal.common import enable_warm_cache
+from qdep.internal.daemon import get_socket_path, recv_all
+
+
+class DaemonRequestHandler(socketserver.BaseRequestHandler):
+	def handle(self):
+		request = json.loads(recv_all(self.request).decode("UTF-8"))
+		operation = find_operation(request.get("argv", []))
+		if request.get("version") != self.server.version:
+			reply = {"code": None, "error": "daemon runs qdep version {}".format(self.server.version)}
+		elif operation not in forwarded_operations:
+			# the daemon only answers the internal qmake-time commands - everything else must run in its own process
+			reply = {"code": None, "error": "operation {} is not served by the daemon".format(operation)}
+		else:
+			reply = self.server.run_request(request)
+		self.request.sendall(json.dumps(reply).encode("UTF-8"))
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, sock_path, version, run_fn):
+		super().__init__(sock_path, DaemonRequestHandler)
+		self.version = version
+		self.run_fn = run_fn
+		self.base_env = {key: value for key, value in os.environ.items() if not key.startswith("QDEP_")}
+		self.run_lock = threading.Lock()
+
+	def run_request(self, request):
+		# connections are handled in parallel, but the commands themselves run one at a time: they use the environment,
+		# working directory and stdout of the process, which cannot differ between threads
+		with self.run_lock:
+			os.environ.clear()
+			os.environ.update(self.base_env)
+			os.environ.update(request["env"])
+
+			out_buffer = io.StringIO()
+			err_buffer = io.StringIO()
+			with contextlib.redirect_stdout(out_buffer), contextlib.redirect_stderr(err_buffer):
+				try:
+					os.chdir(request["cwd"])
+					code = self.run_fn(request["argv"])
+				except SystemExit as exit_info:
+					code = exit_info.code if isinstance(exit_info.code, int) else 1
+				except Exception:
+					traceback.print_exc()
+					code = 1
+
+		return {
+			"code": code,
+			"stdout": out_buffer.getvalue(),
+			"stderr": err_buffer.getvalue()
+		}
+
+
+def serve(version, run_fn, sock_path=None, ttl=60):
+	if not hasattr(socket, "AF_UNIX"):
+		raise Exception("The qdep daemon requires unix domain sockets, which are not supported on this platform")
+	if sock_path is None:
+		sock_path = get_socket_path()
+
+	# remove stale sockets, but never steal the socket of a running daemon
+	if path.exists(sock_path):
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+			try:
+				conn.connect(sock_path)
+				raise Exception("A qdep daemon is already listening on " + sock_path)
+			except ConnectionRefusedError:
+				os.remove(sock_path)
+
+	enable_warm_cache(ttl)
+	os.makedirs(path.dirname(path.abspath(sock_path)), exist_ok=True)
+	server = DaemonServer(sock_path, version, run_fn)
+	print("qdep daemon listening on", sock_path)
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		os.remove(sock_path)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from os import path
+
+
+# spans of qdep commands and the processes they start are appended as json lines to the file given by QDEP_TRACE. Every
+# span is written with a single append, so all qdep processes of a qmake run can share one file
+cache_counters = {}
+cache_counters_lock = threading.Lock()
+
+
+def get_trace_file():
+	return os.getenv("QDEP_TRACE") or None
+
+
+def write_span(trace_file, span):
+	data = (json.dumps(span) + "\n").encode("UTF-8")
+	trace_fd = os.open(trace_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+	try:
+		os.write(trace_fd, data)
+	finally:
+		os.close(trace_fd)
+
+
+@contextmanager
+def trace_span(cat, name, **args):
+	# yields the args of the span, so results like the exit code can be added to them
+	trace_file = get_trace_file()
+	if trace_file is None:
+		yield args
+		return
+
+	start = time.time()
+	start_counter = time.perf_counter()
+	try:
+		yield args
+	except BaseException as exception:
+		args.setdefault("error", type(exception).__name__)
+		raise
+	finally:
+		write_span(trace_file, {
+			"cat": cat,
+			"name": name,
+			"start": start,
+			"dur": time.perf_counter() - start_counter,
+			"pid": os.getpid(),
+			"tid": threading.get_ident(),
+			"args": args
+		})
+
+
+def trace_cache(kind, hit):
+	if get_trace_file() is None:
+		return
+	with cache_counters_lock:
+		counter = cache_counters.setdefault(kind, {"hit": 0, "miss": 0})
+		counter["hit" if hit else "miss"] += 1
+
+
+@contextmanager
+def trace_command(operation, argv):
+	# the daemon runs many commands in one process, so the cache counters are reset for each of them
+	with cache_counters_lock:
+		cache_counters.clear()
+	with trace_span("command", operation, argv=list(argv), cwd=os.getcwd()) as span:
+		try:
+			yield span
+		finally:
+			with cache_counters_lock:
+				if len(cache_counters) > 0:
+					span["cache"] = {kind: dict(counter) for kind, counter in cache_counters.items()}
+
+
+def command_name(cmd):
+	# git is named by its subcommand, as that is what makes the difference
+	name = path.splitext(path.basename(str(cmd[0])))[0]
+	if name == "git":
+		for idx in range(1, len(cmd)):
+			if not str(cmd[idx]).startswith("-") and str(cmd[idx - 1]) not in ["-c", "-C"]:
+				return name + " " + str(cmd[idx])
+	return name
+
+
+def read_spans(trace_file):
+	spans = []
+	with open(trace_file, "r", encoding="UTF-8") as in_file:
+		for line in in_file:
+			try:
+				spans.append(json.loads(line))
+			except ValueError:
+				pass  # a process that was killed while writing - the rest of the trace is still valid
+	return spans
+
+
+def summarize_spans(spans):
+	# per (category, name) totals, sorted by the total time spent
+	totals = {}
+	for span in spans:
+		entry = totals.setdefault((span["cat"], span["name"]), {"count": 0, "total": 0.0, "max": 0.0, "failed": 0, "cache": {}})
+		entry["count"] += 1
+		entry["total"] += span["dur"]
+		entry["max"] = max(entry["max"], span["dur"])
+		if span["args"].get("code", 0) != 0 or "error" in span["args"]:
+			entry["failed"] += 1
+		for kind, counter in span["args"].get("cache", {}).items():
+			entry_counter = entry["cache"].setdefault(kind, {"hit": 0, "miss": 0})
+			entry_counter["hit"] += counter.get("hit", 0)
+			entry_counter["miss"] += counter.get("miss", 0)
+	return sorted(totals.items(), key=lambda item: item[1]["total"], reverse=True)
+
+
+def chrome_trace(spans):
+	# the trace event format of chrome://tracing and perfetto, with complete events in microseconds
+	events = []
+	for span in spans:
+		events.append({
+			"name": span["name"],
+			"cat": span["cat"],
+			"ph": "X",
+			"ts": int(span["start"] * 1000000),
+			"dur": int(span["dur"] * 1000000),
+			"pid": span["pid"],
+			"tid": span["tid"],
+			"args": span["args"]
+		})
+	events.sort(key=lambda event: event["ts"])
+	return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,358 @@
+import os
+import posixpath
+import xml.etree.ElementTree as ElementTree
+from os import path
+
+
+# merges ts files the way "lconvert -sort-contexts -if ts -i <files> -of ts -o <outfile>" does, without starting
+# lconvert for every translation. Only cases where the result is known to be identical to lconvert are supported - for
+# anything else an UnsupportedTsError is raised, so the caller can fall back to the real lconvert
+class UnsupportedTsError(Exception):
+	pass
+
+
+variant_separator = "\u009c"  # Translator::BinaryVariantSeparator
+
+# the number of numerus forms qt uses for a language, including the singular
+plural_counts = {
+	"C": 1,
+	"ja": 1, "ko": 1, "zh": 1, "vi": 1, "th": 1, "id": 1, "ms": 1,
+	"en": 2, "de": 2, "nl": 2, "sv": 2, "da": 2, "nb": 2, "nn": 2, "no": 2, "fi": 2, "es": 2, "it": 2, "el": 2, "fr": 2, "pt": 2,
+	"ru": 3, "uk": 3, "be": 3, "sr": 3, "hr": 3, "bs": 3, "pl": 3, "cs": 3, "sk": 3, "lt": 3, "lv": 3, "ro": 3,
+	"sl": 4,
+	"ar": 6
+}
+
+text_tags = ["source", "oldsource", "comment", "oldcomment", "extracomment", "translatorcomment", "userdata"]
+message_types = {None: "finished", "unfinished": "unfinished", "obsolete": "obsolete", "vanished": "vanished"}
+
+
+def read_contents(elem, variants=False):
+	# text of an element, with <byte> entities resolved. Length variants are joined like qt does internally
+	if variants and len(elem) > 0 and all(child.tag == "lengthvariant" for child in elem):
+		return variant_separator.join(read_contents(child) for child in elem)
+
+	result = elem.text or ""
+	for child in elem:
+		if child.tag != "byte":
+			raise UnsupportedTsError("Unexpected <{}> in <{}>".format(child.tag, elem.tag))
+		value = child.get("value", "")
+		code = int(value[1:], 16) if value.startswith("x") else int(value or "0")
+		if code != 0:
+			result += chr(code)
+		result += child.tail or ""
+	return result
+
+
+def message_key(msg):
+	if msg["id"]:
+		return "id", msg["id"]
+	else:
+		return "msg", msg["context"], msg["source"], msg["comment"]
+
+
+def read_message(elem, context, state):
+	msg = {
+		"context": context,
+		"id": elem.get("id", ""),
+		"numerus": elem.get("numerus") == "yes",
+		"refs": [],
+		"type": "finished",
+		"translations": [],
+		"extras": {}
+	}
+	for tag in text_tags:
+		msg[tag] = ""
+
+	msg_file = state["file"]
+	for child in elem:
+		if child.tag == "location":
+			state["absolute"] = True
+			file_name = child.get("filename", "")
+			if file_name == "":
+				file_name = msg_file
+				state["relative"] = True
+			else:
+				if len(msg["refs"]) == 0:
+					state["file"] = file_name
+				msg_file = file_name
+			line = child.get("line", "")
+			if line == "":
+				msg["refs"].append((file_name, -1))
+			else:
+				try:
+					line_nr = int(line)
+				except ValueError:
+					continue
+				if line.startswith("+") or line.startswith("-"):
+					line_nr = state["lines"].get(file_name, 0) + line_nr
+					state["lines"][file_name] = line_nr
+					state["relative"] = True
+				msg["refs"].append((file_name, line_nr))
+		elif child.tag in text_tags:
+			msg[child.tag] = read_contents(child)
+		elif child.tag == "translation":
+			if child.get("type") not in message_types:
+				raise UnsupportedTsError("Unknown translation type \"{}\"".format(child.get("type")))
+			msg["type"] = message_types[child.get("type")]
+			if msg["numerus"]:
+				msg["translations"] = [read_contents(form, variants=True) for form in child if form.tag == "numerusform"]
+			else:
+				msg["translations"] = [read_contents(child, variants=True)]
+		elif child.tag.startswith("extra-"):
+			msg["extras"][child.tag[6:]] = read_contents(child)
+		else:
+			raise UnsupportedTsError("Unexpected <{}> in message".format(child.tag))
+	return msg
+
+
+def read_ts(ts_file):
+	# parses the file incrementally - every message is converted and dropped from the tree as soon as it was read
+	header = {
+		"language": "",
+		"sourcelanguage": "",
+		"dependencies": [],
+		"extras": {}
+	}
+	messages = []
+	state = {"file": "", "lines": {}, "relative": False, "absolute": False}
+
+	context = None
+	stack = []
+	for event, elem in ElementTree.iterparse(ts_file, events=("start", "end")):
+		if event == "start":
+			stack.append(elem)
+			if len(stack) == 1:
+				if elem.tag != "TS":
+					raise UnsupportedTsError("{} is not a ts file".format(ts_file))
+				header["language"] = elem.get("language", "")
+				header["sourcelanguage"] = elem.get("sourcelanguage", "")
+			continue
+
+		stack.pop()
+		parent = stack[-1] if len(stack) > 0 else None
+		if len(stack) == 1:
+			if elem.tag == "context":
+				context = None
+			elif elem.tag == "dependencies":
+				header["dependencies"] = [dep.get("catalog", "") for dep in elem if dep.tag == "dependency"]
+			elif elem.tag.startswith("extra-"):
+				header["extras"][elem.tag[6:]] = read_contents(elem)
+			elif elem.tag != "defaultcodec":
+				raise UnsupportedTsError("Unexpected <{}> in {}".format(elem.tag, ts_file))
+			parent.remove(elem)
+		elif len(stack) == 2 and parent.tag == "context":
+			if elem.tag == "name":
+				context = read_contents(elem)
+			elif elem.tag == "message":
+				if context is None:
+					raise UnsupportedTsError("Message without context name in {}".format(ts_file))
+				messages.append(read_message(elem, context, state))
+			else:
+				raise UnsupportedTsError("Unexpected <{}> in context of {}".format(elem.tag, ts_file))
+			parent.remove(elem)
+
+	if len(messages) == 0:
+		state["absolute"] = True  # like qt, empty files adopt the default location type
+	header["locations"] = "relative" if state["relative"] else ("absolute" if state["absolute"] else "none")
+
+	keys = set()
+	for msg in messages:
+		key = message_key(msg)
+		if key in keys:
+			raise UnsupportedTsError("Duplicate message \"{}\" in {}".format(msg["source"], ts_file))
+		keys.add(key)
+	return header, messages
+
+
+def check_appended(appended, ts_file):
+	# lconvert inserts new messages next to those of the same source file, ordered by line. As long as every new
+	# context lists its source files one after another with ascending lines, that is the same as appending them
+	for context, msgs in appended.items():
+		seen_files = []
+		last_line = -1
+		unlocated = False
+		for msg in msgs:
+			if len(msg["refs"]) == 0 or msg["refs"][0][1] < 0:
+				unlocated = True
+				continue
+			file_name, line = msg["refs"][0]
+			if unlocated or (file_name in seen_files and seen_files[-1] != file_name) or (file_name in seen_files and line < last_line):
+				raise UnsupportedTsError("Cannot order the messages of context \"{}\" in {}".format(context, ts_file))
+			if file_name not in seen_files:
+				seen_files.append(file_name)
+			last_line = line
+
+
+def merge_messages(ts_files):
+	header, messages = read_ts(ts_files[0])
+	index = {message_key(msg): idx for idx, msg in enumerate(messages)}
+	contexts = set(msg["context"] for msg in messages)
+
+	for ts_file in ts_files[1:]:
+		_h, new_messages = read_ts(ts_file)
+		appended = {}
+		for msg in new_messages:
+			key = message_key(msg)
+			if key in index:
+				messages[index[key]] = msg
+				continue
+			if msg["context"] in contexts and len(msg["refs"]) > 0 and msg["refs"][0][1] >= 0:
+				raise UnsupportedTsError("Context \"{}\" of {} already exists".format(msg["context"], ts_file))
+			appended.setdefault(msg["context"], []).append(msg)
+			index[key] = len(messages)
+			messages.append(msg)
+		check_appended(appended, ts_file)
+		contexts.update(appended.keys())
+	return header, messages
+
+
+def get_plural_count(language):
+	lang = language.split("_")[0].split("-")[0] if language != "" else "C"
+	if lang not in plural_counts:
+		raise UnsupportedTsError("Unknown numerus forms of language \"{}\"".format(language))
+	return plural_counts[lang]
+
+
+def protect(text):
+	result = text.replace("&", "&amp;").replace("\"", "&quot;").replace(">", "&gt;").replace("<", "&lt;").replace("'", "&apos;")
+	if any(ord(c) < 0x20 and c not in "\r\n\t" for c in result):
+		result = "".join("<byte value=\"x{:x}\"/>".format(ord(c)) if ord(c) < 0x20 and c not in "\r\n\t" else c for c in result)
+	return result
+
+
+def write_variants(indent, text):
+	if variant_separator not in text:
+		return ">" + protect(text)
+	data = " variants=\"yes\">"
+	for variant in text.split(variant_separator):
+		data += "\n    " + indent + "<lengthvariant>" + protect(variant) + "</lengthvariant>"
+	return data + "\n" + indent
+
+
+def write_extras(indent, extras):
+	outs = sorted("<extra-" + key + ">" + protect(value) + "</extra-" + key + ">" for key, value in extras.items())
+	return "".join(indent + out + "\n" for out in outs)
+
+
+def clean_path(file_name):
+	file_name = file_name.replace("\\", "/")
+	if file_name == "":
+		return file_name
+	if posixpath.isabs(file_name) or (len(file_name) > 1 and file_name[1] == ":"):
+		raise UnsupportedTsError("Absolute location \"{}\"".format(file_name))
+	return posixpath.normpath(file_name)
+
+
+def write_message(out_file, msg, locations, state):
+	out_file.write("    <message")
+	if msg["id"]:
+		out_file.write(" id=\"" + msg["id"] + "\"")
+	if msg["numerus"]:
+		out_file.write(" numerus=\"yes\"")
+	out_file.write(">\n")
+
+	if locations != "none":
+		cur_file = state["file"]
+		first = True
+		for file_name, line in msg["refs"]:
+			file_name = clean_path(file_name)
+			line_data = ""
+			if locations == "relative":
+				if line != -1:
+					delta = line - state["lines"].get(file_name, 0)
+					line_data = ("+" if delta >= 0 else "") + str(delta)
+					state["lines"][file_name] = line
+				if file_name != cur_file:
+					if first:
+						state["file"] = file_name
+					cur_file = file_name
+				else:
+					file_name = ""
+				first = False
+			elif line != -1:
+				line_data = str(line)
+			out_file.write("        <location")
+			if file_name != "":
+				out_file.write(" filename=\"" + file_name + "\"")
+			if line_data != "":
+				out_file.write(" line=\"" + line_data + "\"")
+			out_file.write("/>\n")
+
+	out_file.write("        <source>" + protect(msg["source"]) + "</source>\n")
+	for tag in ["oldsource", "comment", "oldcomment", "extracomment", "translatorcomment"]:
+		if msg[tag]:
+			out_file.write("        <" + tag + ">" + protect(msg[tag]) + "</" + tag + ">\n")
+
+	out_file.write("        <translation")
+	if msg["type"] != "finished":
+		out_file.write(" type=\"" + msg["type"] + "\"")
+	if msg["numerus"]:
+		out_file.write(">")
+		for translation in msg["translations"]:
+			out_file.write("\n            <numerusform" + write_variants("            ", translation) + "</numerusform>")
+		out_file.write("\n        ")
+	else:
+		out_file.write(write_variants("        ", msg["translations"][0]))
+	out_file.write("</translation>\n")
+
+	out_file.write(write_extras("        ", msg["extras"]))
+	if msg["userdata"]:
+		out_file.write("        <userdata>" + msg["userdata"] + "</userdata>\n")
+	out_file.write("    </message>\n")
+
+
+def write_ts(out_file, header, messages, sort_contexts=True):
+	# group by context, keeping the message order within each context
+	context_map = {}
+	for msg in messages:
+		if msg["type"] == "obsolete" and (len(msg["translations"]) == 0 or msg["translations"][0] == ""):
+			continue
+		context_map.setdefault(msg["context"], []).append(msg)
+	context_order = list(context_map.keys())
+	if sort_contexts:
+		# qt compares strings by their UTF-16 code units
+		context_order.sort(key=lambda context: context.encode("UTF-16-BE"))
+
+	# the number of translations is normalized to what the language needs
+	plural_count = None
+	for msg in messages:
+		count = 1
+		if msg["numerus"]:
+			if plural_count is None:
+				plural_count = get_plural_count(header["language"])
+			count = plural_count
+		msg["translations"] = (msg["translations"] + [""] * count)[:count]
+
+	out_file.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE TS>\n<TS version=\"2.1\"")
+	for attrib in ["language", "sourcelanguage"]:
+		if header[attrib] not in ["", "C"]:
+			out_file.write(" " + attrib + "=\"" + header[attrib] + "\"")
+	out_file.write(">\n")
+	if len(header["dependencies"]) > 0:
+		out_file.write("<dependencies>\n")
+		for dep in header["dependencies"]:
+			out_file.write("<dependency catalog=\"" + dep + "\"/>\n")
+		out_file.write("</dependencies>\n")
+	out_file.write(write_extras("    ", header["extras"]))
+
+	state = {"file": "", "lines": {}}
+	for context in context_order:
+		out_file.write("<context>\n    <name>" + protect(context) + "</name>\n")
+		for msg in context_map[context]:
+			write_message(out_file, msg, header["locations"], state)
+		out_file.write("</context>\n")
+	out_file.write("</TS>\n")
+
+
+def merge_ts(ts_files, outfile, sort_contexts=True):
+	header, messages = merge_messages(ts_files)
+	tmp_file = path.join(path.dirname(path.abspath(outfile)), ".qdep_tmp_" + path.basename(outfile) + "_" + str(os.getpid()))
+	try:
+		with open(tmp_file, "w", encoding="UTF-8", newline="\n") as out_file:
+			write_ts(out_file, header, messages, sort_contexts)
+		os.replace(tmp_file, outfile)
+	except BaseException:
+		if path.exists(tmp_file):
+			os.remove(tmp_file)
+		raise
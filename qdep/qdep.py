@@ -1,11 +1,12 @@
 from qdep.internal.common import *
-from qdep.internal.prf import *
 
 
 version = "1.1.1"
 
 
 def prfgen(script_path, qmake="qmake", data_dir=None):
+	from qdep.internal.prf import qdep_prf
+
 	if data_dir is not None:
 		prf_path = data_dir
 	else:
@@ -33,6 +34,8 @@ def init(profile):
 
 
 def lupdate(pri_path, qmake="qmake", lupdate_args=None):
+	import tempfile
+
 	if lupdate_args is None:
 		lupdate_args = []
 
@@ -47,14 +50,7 @@ def lupdate(pri_path, qmake="qmake", lupdate_args=None):
 
 
 def clear(no_confirm=False):
-	def folder_size(path):
-		total = 0
-		for entry in os.scandir(path):
-			if entry.is_file():
-				total += entry.stat().st_size
-			elif entry.is_dir():
-				total += folder_size(entry.path)
-		return total
+	import shutil
 
 	if not no_confirm:
 		print("All caches sources will be removed and have to be downloaded again. Make sure no other qdep instance is currently running!")
@@ -64,33 +60,111 @@ def clear(no_confirm=False):
 		elif ok != "y" and ok != "yes":
 			return
 
-	cache_dir = os.getenv("QDEP_CACHE_DIR", get_cache_dir_default())
-	cache_dir = path.join(cache_dir, "src")
+	cache_dir = path.join(get_cache_root(), "src")
 	if path.exists(cache_dir):
 		rm_size = folder_size(cache_dir)
 		shutil.rmtree(cache_dir)
 	else:
 		rm_size = 0
+	for repo_dir in set(legacy[0] for legacy in find_legacy_sources()):
+		rm_size += folder_size(repo_dir)
+		shutil.rmtree(repo_dir)
+	index_file = path.join(get_cache_root(), "index.sqlite")
+	if path.exists(index_file):
+		os.remove(index_file)
 	print("Removed {} bytes".format(rm_size))
 
 
-def versions(package, tags=True, branches=False, short=False, limit=None):
-	package_url, _v, _p = package_resolve(package)
+def cache_migrate(fetch=True):
+	import shutil
 
-	if tags:
-		pkg_tags = get_all_tags(package_url, tags=True, branches=False, allow_empty=True)
-		if limit is not None:
-			pkg_tags = pkg_tags[-limit:]
-	else:
-		pkg_tags = []
+	legacy_sources = find_legacy_sources()
+	print("Found {} cached sources in the old cache layout".format(len(legacy_sources)))
+	rm_size = 0
+	for repo_dir, src_dir, pkg_url, pkg_branch in legacy_sources:
+		if fetch and pkg_url is not None:
+			print("Migrating {}@{}...".format(pkg_url, pkg_branch))
+			get_sources(pkg_url, pkg_branch)
+		else:
+			print("Removing {}...".format(src_dir))
+		rm_size += folder_size(src_dir)
+		shutil.rmtree(src_dir)
+		if len(os.listdir(repo_dir)) == 0:
+			os.rmdir(repo_dir)
+	print("Done! Removed {} bytes of old cached sources".format(rm_size))
 
-	if branches:
-		pkg_branches = get_all_tags(package_url, tags=False, branches=True, allow_empty=True)
-		if limit is not None:
-			pkg_branches = pkg_branches[-limit:]
-	else:
-		pkg_branches = []
 
+def cache_gc(max_size=None, max_age=None, dry_run=False):
+	if max_size is None and max_age is None:
+		max_size = os.getenv("QDEP_CACHE_MAX_SIZE")
+		if max_size is None:
+			raise Exception("Neither --max-size, --max-age nor the QDEP_CACHE_MAX_SIZE environment variable were specified")
+
+	removed, freed = collect_garbage(max_size=parse_size(max_size) if max_size is not None else None, max_age=max_age * 86400 if max_age is not None else None, dry_run=dry_run)
+	for entry_dir in removed:
+		print("{} {}".format("Would remove" if dry_run else "Removed", entry_dir))
+	# mirrors go with the last version of their package, so they are not counted as versions of their own
+	mirror_count = sum(1 for entry_dir in removed if entry_dir == get_mirror_dir_of(path.dirname(entry_dir)))
+	print("{} {} cache entries and {} package mirrors with {} bytes".format("Would remove" if dry_run else "Removed", len(removed) - mirror_count, mirror_count, freed))
+
+
+def cache_list(rebuild=False, jobs=None):
+	from qdep.internal.index import index_entries
+
+	def format_time(stamp):
+		return time.strftime("%Y-%m-%d %H:%M", time.localtime(stamp)) if stamp is not None else "-"
+
+	for _d, kind, pkg_url, pkg_ref, commit, size, fetch_time, last_use in index_entries(rebuild, jobs):
+		if kind == "mirror":
+			continue
+		print("{}@{}".format(pkg_url, pkg_ref))
+		print("\tcommit: {}, size: {} bytes, fetched: {}, last used: {}".format(commit if commit is not None else "-", size, format_time(fetch_time), format_time(last_use)))
+
+
+def cache_stats(rebuild=False, jobs=None):
+	from qdep.internal.index import index_entries
+
+	entries = index_entries(rebuild, jobs)
+	versions = [entry for entry in entries if entry[1] != "mirror"]
+	mirror_size = sum(entry[5] for entry in entries if entry[1] == "mirror")
+	version_size = sum(entry[5] for entry in versions)
+	print("Packages: {}".format(len(set(entry[2] for entry in entries))))
+	print("Cached versions: {}".format(len(versions)))
+	print("Total size: {} bytes ({} bytes checkouts, {} bytes mirrors)".format(mirror_size + version_size, version_size, mirror_size))
+	if len(versions) > 0:
+		oldest = min(versions, key=lambda entry: entry[7])
+		print("Least recently used: {}@{} ({})".format(oldest[2], oldest[3], time.strftime("%Y-%m-%d %H:%M", time.localtime(oldest[7]))))
+
+
+def trace_report(trace_file=None, chrome_file=None):
+	from qdep.internal.trace import read_spans, summarize_spans, chrome_trace
+
+	if trace_file is None:
+		trace_file = get_trace_file()
+		if trace_file is None:
+			raise Exception("No trace file given and QDEP_TRACE is not set")
+	spans = read_spans(trace_file)
+	if len(spans) == 0:
+		raise Exception("The trace file {} does not contain any spans".format(trace_file))
+
+	wall_time = max(span["start"] + span["dur"] for span in spans) - min(span["start"] for span in spans)
+	print("Traced {} spans of {} processes over {:.3f} s".format(len(spans), len(set(span["pid"] for span in spans)), wall_time))
+	for cat, title in [("command", "qdep commands"), ("subprocess", "Processes started by qdep")]:
+		totals = [(name, entry) for (entry_cat, name), entry in summarize_spans(spans) if entry_cat == cat]
+		if len(totals) == 0:
+			continue
+		print("\n{}:".format(title))
+		print("  {:<24} {:>6} {:>11} {:>10} {:>10} {:>6}  {}".format("Name", "Calls", "Total [ms]", "Mean [ms]", "Max [ms]", "Failed", "Cache hits/misses"))
+		for name, entry in totals:
+			cache_info = ", ".join("{} {}/{}".format(kind, counter["hit"], counter["miss"]) for kind, counter in sorted(entry["cache"].items()))
+			print("  {:<24} {:>6} {:>11.1f} {:>10.1f} {:>10.1f} {:>6}  {}".format(name, entry["count"], entry["total"] * 1000, entry["total"] * 1000 / entry["count"], entry["max"] * 1000, entry["failed"], cache_info).rstrip())
+
+	if chrome_file is not None:
+		write_file_atomic(chrome_file, json.dumps(chrome_trace(spans)))
+		print("\nChrome trace written to", chrome_file)
+
+
+def print_version_lists(pkg_branches, pkg_tags, tags=True, branches=False, short=False):
 	if short:
 		print(" ".join(pkg_branches + pkg_tags))
 	else:
@@ -114,49 +188,128 @@ def versions(package, tags=True, branches=False, short=False, limit=None):
 				print(" -- No tags found --")
 
 
-def query(package, check=True, print_versions=False, expand=False):
+def versions(*packages, tags=True, branches=False, short=False, limit=None, json_output=False, jobs=None):
+	pkg_map = OrderedDict()
+	for package in packages:
+		pkg_url, _v, _p = package_resolve(package)
+		pkg_map.setdefault(pkg_url, []).append(package)
+
+	failed = []
+
+	def print_listing(pkg_url, listing, error):
+		for package in pkg_map[pkg_url]:
+			if error is not None:
+				failed.append(package)
+				if json_output:
+					print(json.dumps({"package": package, "url": pkg_url, "error": str(error)}))
+				else:
+					print("Failed to query the versions of {}: {}".format(package, error), file=sys.stderr)
+				continue
+
+			pkg_tags = listing_tags(listing, tags=True) if tags else []
+			pkg_branches = listing_tags(listing, branches=True, tags=False) if branches else []
+			if limit is not None:
+				pkg_tags = pkg_tags[-limit:]
+				pkg_branches = pkg_branches[-limit:]
+
+			if json_output:
+				result = {"package": package, "url": pkg_url}
+				if branches:
+					result["branches"] = pkg_branches
+				if tags:
+					result["tags"] = pkg_tags
+				print(json.dumps(result))
+			elif len(packages) == 1:
+				print_version_lists(pkg_branches, pkg_tags, tags, branches, short)
+			elif short:
+				print("{}: {}".format(package, " ".join(pkg_branches + pkg_tags)))
+			else:
+				print("Package:", package)
+				print_version_lists(pkg_branches, pkg_tags, tags, branches)
+				print("")
+		sys.stdout.flush()
+
+	fetch_ref_listings(pkg_map.keys(), print_listing, jobs)
+	if len(failed) > 0:
+		raise Exception("Failed to query the versions of: {}".format(", ".join(failed)))
+
+
+def query_result(package, listing=None, check=True, print_versions=False):
 	pkg_url, pkg_version, pkg_path = package_resolve(package)
+	result = OrderedDict([("input", package), ("url", pkg_url), ("version", pkg_version), ("path", pkg_path)])
 	if check:
 		if pkg_version is None:
-			pkg_version = get_latest_tag(pkg_url, allow_empty=True, allow_error=True)
-			pkg_exists = pkg_version is not None
+			result["version"] = listing["index"]["latest"]
+			result["exists"] = result["version"] is not None
 		else:
-			pkg_exists = pkg_version in get_all_tags(pkg_url, branches=True, tags=True, allow_empty=True, allow_error=True)
-	else:
-		pkg_exists = False  # not knowing means false
-
-	if expand:
-		if pkg_version is None:
-			raise Exception("Unable to determine package version")
+			result["exists"] = pkg_version in listing_tags(listing, branches=True, tags=True)
+	result["expanded"] = "{}@{}{}".format(pkg_url, result["version"], pkg_path) if result["version"] is not None else None
+	if print_versions:
+		result["branches"] = listing_tags(listing, branches=True, tags=False)
+		result["tags"] = listing_tags(listing, tags=True)
+	return result
+
+
+def query(*packages, check=True, print_versions=False, expand=False, json_output=False, jobs=None):
+	failed = []
+
+	def print_result(result):
+		if json_output:
+			print(json.dumps(result))
+		elif expand:
+			if result["expanded"] is None:
+				failed.append(result["input"])
+				print("Unable to determine the version of package {}".format(result["input"]), file=sys.stderr)
+			else:
+				print(result["expanded"])
 		else:
-			print("{}@{}{}".format(pkg_url, pkg_version, pkg_path))
-	else:
-		print("Input:", package)
-		if pkg_version is not None:
-			print("Expanded Name: {}@{}{}".format(pkg_url, pkg_version, pkg_path))
+			print("Input:", result["input"])
+			print("Expanded Name:", result["expanded"])
+			print("URL:", result["url"])
+			print("Version:", result["version"])
+			print("Path:", result["path"])
+			if check:
+				print("Exists:", result["exists"])
+			if print_versions:
+				print("")
+				print_version_lists(result["branches"], result["tags"], branches=True)
+			if len(packages) > 1:
+				print("")
+		sys.stdout.flush()
+
+	# packages that do not need the remote are answered right away, all others as soon as their remote replied
+	pkg_map = OrderedDict()
+	for package in packages:
+		if check or print_versions:
+			pkg_map.setdefault(package_resolve(package)[0], []).append(package)
 		else:
-			print("Expanded Name:", None)
-		print("URL:", pkg_url)
-		print("Version:", pkg_version)
-		print("Path:", pkg_path)
-		if check:
-			print("Exists:", pkg_exists)
+			print_result(query_result(package, check=False))
+
+	def print_listing(pkg_url, listing, error):
+		if error is not None:
+			listing = {"url": pkg_url, "refs": [], "index": build_version_index([], get_tag_prefix())}  # like a package without any refs
+		for package in pkg_map[pkg_url]:
+			print_result(query_result(package, listing, check, print_versions))
+
+	fetch_ref_listings(pkg_map.keys(), print_listing, jobs)
+	if len(failed) > 0:
+		raise Exception("Unable to determine the version of: {}".format(", ".join(failed)))
 
-		if print_versions:
-			print("")
-			versions(package, branches=True)
 
+def get(*targets, extract=False, evaluate=False, recurse=True, qmake="qmake", make="make", cache_dir=None, jobs=None, lock_file=None, frozen=False):
+	from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def get(*targets, extract=False, evaluate=False, recurse=True, qmake="qmake", make="make", cache_dir=None):
 	if cache_dir is not None:
 		os.environ["QDEP_CACHE_DIR"] = cache_dir
+	start_time = time.monotonic()
 
 	# eval the pro files if needed
 	if evaluate:
 		# special case: since we only download sources, a simple qmake run is enough, no actual "evaluation" needed
-		for pro_file in targets:
-			eval_pro_depends(pro_file, qmake, make)
-			print("Done! qmake finished successfully, all qdep sources for the project tree have been downloaded.")
+		with ThreadPoolExecutor(max_workers=min(len(targets), get_job_count(jobs))) as executor:
+			for _r in executor.map(lambda pro_file: eval_pro_depends(pro_file, qmake, make, jobs=jobs), targets):
+				pass
+		print("Done! qmake finished successfully, all qdep sources for the project tree have been downloaded.")
 		return
 	elif extract:
 		packages = []
@@ -166,33 +319,111 @@ def get(*targets, extract=False, evaluate=False, recurse=True, qmake="qmake", ma
 	else:
 		packages = list(targets)
 
-	# download the actual sources
-	print("Found {} initial packages".format(len(packages)))
-	pkg_hashes = set()
-	for package in packages:
-		pkg_url, pkg_version, pkg_path = package_resolve(package)
-		p_hash = pkg_hash(pkg_url, pkg_path)
-		if p_hash in pkg_hashes:
-			continue
+	lock = read_lock_file(lock_file)
 
-		print("Downloading sources for {}...".format(package))
-		cache_dir, _b = get_sources(pkg_url, pkg_version)
+	# runs in a worker thread - the log is only printed by the scheduler, so outputs of parallel jobs do not mix
+	def fetch_package(package):
+		pkg_url, pkg_version, pkg_path = package_resolve(package)
+		locked = get_locked_entry(lock, pkg_url, pkg_version, frozen=frozen)
+		if locked is not None:
+			cache_hit = is_static_checkout(path.join(get_repo_dir(pkg_url), ".commit", locked["commit"]))
+			log = ["Downloading sources for {} (locked to {})...".format(package, locked["commit"])]
+			cache_dir, _b = get_locked_sources(pkg_url, locked["ref"], locked["commit"], frozen=frozen)
+		else:
+			if pkg_version is None:
+				pkg_version = get_latest_tag(pkg_url)
+			cache_hit = is_cached(pkg_url, pkg_version)
+			log = ["Downloading sources for {}...".format(package)]
+			cache_dir, _b = get_sources(pkg_url, pkg_version)
 
+		new_packages = []
 		if recurse:
-			print("Extracting dependencies from {}...".format(package))
+			log.append("Extracting dependencies from {}...".format(package))
 			new_packages = extract_pro_depends(path.join(cache_dir, pkg_path[1:]), qmake)
-			print("Found {} dependent packages".format(len(new_packages)))
-			for pkg in new_packages:
-				packages.append(pkg)
+			log.append("Found {} dependent packages".format(len(new_packages)))
+		return log, cache_hit, new_packages
 
-		pkg_hashes.add(p_hash)
-	print("Done!")
-
-
-def update(pro_file, evaluate=False, replace=False, qmake="qmake", make="make"):
+	# download the actual sources - every package is scheduled once, as soon as it was discovered
+	print("Found {} initial packages".format(len(packages)))
+	pkg_hashes = set()
+	pkg_count = 0
+	hit_count = 0
+	with ThreadPoolExecutor(max_workers=get_job_count(jobs)) as executor:
+		running = set()
+
+		def schedule(new_packages):
+			for package in new_packages:
+				pkg_url, _v, pkg_path = package_resolve(package)
+				p_hash = pkg_hash(pkg_url, pkg_path)
+				if p_hash not in pkg_hashes:
+					pkg_hashes.add(p_hash)
+					running.add(executor.submit(fetch_package, package))
+
+		try:
+			schedule(packages)
+			while len(running) > 0:
+				done, running = wait(running, return_when=FIRST_COMPLETED)
+				for future in done:
+					log, cache_hit, new_packages = future.result()
+					print("\n".join(log))
+					pkg_count += 1
+					if cache_hit:
+						hit_count += 1
+					schedule(new_packages)
+		except:
+			for future in running:
+				future.cancel()
+			raise
+
+	print("Fetched {} packages ({} downloaded, {} cache hits) in {:.2f} seconds".format(pkg_count, pkg_count - hit_count, hit_count, time.monotonic() - start_time))
+
+
+def lock(pro_file, qmake="qmake", lock_file=None):
+	if lock_file is None:
+		lock_file = path.join(path.dirname(path.abspath(pro_file)), "qdep.lock")
+
+	entries = OrderedDict()
+	known_hashes = set()
+
+	def collect(packages):
+		# the same depth first order as the qmake recursion - packages shadowed by an earlier one with the same hash are
+		# never used, so they are not locked either
+		for package in packages:
+			pkg_url, pkg_version, pkg_path = package_resolve(package)
+			p_hash = pkg_hash(pkg_url, pkg_path)
+			if p_hash in known_hashes:
+				continue
+			known_hashes.add(p_hash)
+
+			if (pkg_url, pkg_version) in entries:
+				cache_dir, _b = get_sources(pkg_url, entries[(pkg_url, pkg_version)]["ref"], pull=False)
+			else:
+				pkg_ref = pkg_version if pkg_version is not None else get_latest_tag(pkg_url)
+				print("Locking {}...".format(package))
+				cache_dir, _b = get_sources(pkg_url, pkg_ref)
+				entries[(pkg_url, pkg_version)] = OrderedDict([
+					("url", pkg_url),
+					("requested", pkg_version if pkg_version is not None else ""),
+					("ref", pkg_ref),
+					("commit", get_checkout_commit(pkg_url, pkg_ref, cache_dir))
+				])
+			collect(extract_pro_depends(path.join(cache_dir, pkg_path[1:]), qmake))
+
+	print("Extracting dependencies from {}...".format(pro_file))
+	collect(extract_pro_depends(pro_file, qmake))
+
+	lock_data = {
+		"version": 1,
+		"packages": sorted(entries.values(), key=lambda entry: (entry["url"], entry["requested"]))
+	}
+	write_file_atomic(lock_file, json.dumps(lock_data, indent=2) + "\n")
+	print("Locked {} packages in {}".format(len(entries), lock_file))
+
+
+def update(pro_file, evaluate=False, replace=False, qmake="qmake", make="make", jobs=None):
 	if evaluate:
-		all_deps = invert_map(eval_pro_depends(pro_file, qmake, make, dump_depends=True))
-		pkg_all, pkg_new = check_for_updates(all_deps.keys())
+		all_deps = invert_map(eval_pro_depends(pro_file, qmake, make, dump_depends=True, jobs=jobs))
+		pkg_all, pkg_new = check_for_updates(all_deps.keys(), jobs=jobs)
 		update_files = set()
 		for old_pkg, new_pkg in pkg_new.items():
 			for dep in all_deps[old_pkg]:
@@ -205,5 +436,5 @@ def update(pro_file, evaluate=False, replace=False, qmake="qmake", make="make"):
 	else:
 		print("Extracting dependencies from {}...".format(pro_file))
 		packages = extract_pro_depends(pro_file, qmake)
-		pkg_all, pkg_new = check_for_updates(packages)
+		pkg_all, pkg_new = check_for_updates(packages, jobs=jobs)
 		replace_or_print_update(pro_file, pkg_all, pkg_new, replace)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Measures the per-call latency of the qmake-time commands with and without a running qdep daemon
+# usage: bench-daemon.py [rounds] [json-output]
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import *
+
+
+def bench_calls(work_dir, env, rounds):
+	# resolve-tree is what the prf runs for every project, the others are used by project dependencies
+	tree_pri = os.path.join(work_dir, "tree.pri")
+	return {
+		"resolve-tree": time_call(lambda: run_qdep("resolve-tree", "--qmake", "qmake", tree_pri, "bench/app@1.0.0/app.pri", env=env), rounds),
+		"dephash": time_call(lambda: run_qdep("dephash", "bench/package", env=env), rounds),
+		"pkgresolve@tag": time_call(lambda: run_qdep("pkgresolve", "bench/package@1.1.0", env=env), rounds),
+		"pkgresolve@latest": time_call(lambda: run_qdep("pkgresolve", "bench/package", env=env), rounds),
+		"pkgresolve@branch": time_call(lambda: run_qdep("pkgresolve", "bench/package@master", env=env), rounds),
+		"pkgresolve@tag x8 parallel": time_call(lambda: run_parallel(8, "pkgresolve", "bench/package@1.1.0", env=env), rounds)
+	}
+
+
+def run_parallel(count, *args, env):
+	# like a parallel make running qmake for many subprojects at once - the daemon runs the commands one at a time
+	with ThreadPoolExecutor(max_workers=count) as executor:
+		for _r in executor.map(lambda _i: run_qdep(*args, env=env), range(count)):
+			pass
+
+
+def main():
+	rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	with tempfile.TemporaryDirectory() as work_dir:
+		create_repo(work_dir, "bench/package", files=100, tags=["1.0.0", "1.1.0"])
+		create_repo(work_dir, "bench/app", tags=["1.0.0"], depends=["bench/package@1.1.0/package.pri"])
+		sock_path = os.path.join(work_dir, "qdep.sock")
+		env = bench_env(work_dir, QDEP_DAEMON_SOCKET=sock_path)
+
+		# prefill the source cache, so only the resolve overhead is measured
+		for package in ["bench/package@1.1.0", "bench/package@master", "bench/app@1.0.0"]:
+			run_qdep("pkgresolve", package, env=env)
+
+		results = {}
+		for name, res in bench_calls(work_dir, env, rounds).items():
+			results["in-process " + name] = res
+
+		daemon = subprocess.Popen([sys.executable, qdep_entry, "serve"], env=env, stdout=subprocess.DEVNULL)
+		try:
+			while not os.path.exists(sock_path):
+				time.sleep(0.05)
+			for name, res in bench_calls(work_dir, env, rounds).items():
+				results["daemon " + name] = res
+		finally:
+			daemon.terminate()
+			daemon.wait()
+
+	print_results(results)
+	if len(sys.argv) > 2:
+		write_json(sys.argv[2], results, benchmark="daemon")
+
+
+if __name__ == '__main__':
+	main()
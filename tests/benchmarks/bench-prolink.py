@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# Compares the old deep copy of linked projects with the incremental sync, for a large synthetic tree
+# usage: bench-prolink.py [rounds] [json-output]
+
+import os
+import shutil
+import sys
+import tempfile
+
+from benchutil import *
+
+sys.path.insert(0, root_dir)
+from qdep.internal.common import sync_tree
+
+
+def create_tree(src_dir, files, file_size):
+	for index in range(files):
+		sub_dir = os.path.join(src_dir, "src", str(index // 100))
+		os.makedirs(sub_dir, exist_ok=True)
+		with open(os.path.join(sub_dir, "file{}.cpp".format(index)), "wb") as src_file:
+			src_file.write(os.urandom(file_size))
+
+
+def change_files(src_dir, count):
+	for index in range(count):
+		f_path = os.path.join(src_dir, "src", "0", "file{}.cpp".format(index))
+		os.remove(f_path)  # new inode, like git does when checking out a changed file
+		with open(f_path, "wb") as src_file:
+			src_file.write(os.urandom(1024))
+
+
+def main():
+	rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+	files = 5000
+	file_size = 16 * 1024
+	with tempfile.TemporaryDirectory() as work_dir:
+		src_dir = os.path.join(work_dir, "package")
+		create_tree(src_dir, files, file_size)
+
+		results = {}
+		dst_dir = os.path.join(work_dir, "copy")
+
+		def full_copy():
+			if os.path.exists(dst_dir):
+				shutil.rmtree(dst_dir)
+			shutil.copytree(src_dir, dst_dir, symlinks=True, ignore_dangling_symlinks=True)
+		results["deep copy"] = time_call(full_copy, rounds)
+
+		for methods in [["copy"], ["hardlink", "copy"], ["reflink", "hardlink", "copy"]]:
+			name = "+".join(methods)
+			dst_dir = os.path.join(work_dir, name)
+
+			def initial_sync():
+				if os.path.exists(dst_dir):
+					shutil.rmtree(dst_dir)
+				sync_tree(src_dir, dst_dir, methods)
+			results["initial sync, " + name] = time_call(initial_sync, rounds)
+			results["unchanged sync, " + name] = time_call(lambda: sync_tree(src_dir, dst_dir, methods), rounds)
+
+			def changed_sync():
+				change_files(src_dir, 20)
+				sync_tree(src_dir, dst_dir, methods)
+			results["20 changed files, " + name] = time_call(changed_sync, rounds)
+
+	print_results(results)
+	if len(sys.argv) > 2:
+		write_json(sys.argv[2], results, benchmark="prolink", files=files, file_size=file_size)
+
+
+if __name__ == '__main__':
+	main()
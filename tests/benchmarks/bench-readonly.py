@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Measures the read-only marking of cached sources for a synthetic package with 10k files
+# usage: bench-readonly.py [rounds] [json-output]
+
+import os
+import stat
+import sys
+import tempfile
+
+from benchutil import *
+
+sys.path.insert(0, root_dir)
+from qdep.internal.common import make_read_only
+
+
+def make_writable(root_dir):
+	for root, dirs, files in os.walk(root_dir):
+		dirs[:] = [d for d in dirs if d != ".git"]
+		for file in files:
+			f_path = os.path.join(root, file)
+			os.chmod(f_path, os.lstat(f_path).st_mode | stat.S_IWUSR)
+
+
+def main():
+	rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+	with tempfile.TemporaryDirectory() as work_dir:
+		repo_dir = create_repo(work_dir, "bench/package", files=10000)
+		env = bench_env(work_dir)
+
+		results = {}
+		results["clone"] = time_call(lambda: run_qdep("pkgresolve", "bench/package@master", env=env), 1)
+		src_dir = run_qdep("pkgresolve", "bench/package@master", env=env).stdout.splitlines()[2]
+
+		reset_res = time_call(lambda: make_writable(src_dir), rounds)
+		for jobs in [1, 0]:
+			def full_pass():
+				make_writable(src_dir)
+				make_read_only(src_dir, jobs=jobs)
+			res = time_call(full_pass, rounds)
+			for key in ["min_ms", "median_ms", "max_ms"]:
+				res[key] = max(0.0, res[key] - reset_res["median_ms"])
+			results["full pass, {} jobs".format(jobs if jobs > 0 else "default")] = res
+		make_read_only(src_dir)
+
+		results["pull, unchanged"] = time_call(lambda: run_qdep("pkgresolve", "bench/package@master", env=env), rounds)
+
+		def pull_changed():
+			for index in range(2):
+				src_path = os.path.join(repo_dir, "src", "0", "file{}.cpp".format(index))
+				with open(src_path, "a") as src_file:
+					src_file.write("// changed\n")
+			git("commit", "-q", "-a", "-m", "change", cwd=repo_dir)
+			run_qdep("pkgresolve", "bench/package@master", env=env)
+		results["pull, 2 files changed"] = time_call(pull_changed, rounds)
+
+	print_results(results)
+	if len(sys.argv) > 2:
+		write_json(sys.argv[2], results, benchmark="readonly", files=10000)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Measures how the package commands and a full qmake configure scale with the number of dependencies, with a cold and a
+# warm source cache. All packages are generated as local repositories, so no network access is needed
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchutil import *
+
+
+def create_tree(work_dir, fan_out, depth, files, tags):
+	# every package depends on fan_out packages of the next level, down to the given depth
+	versions = ["1.{}.0".format(index) for index in range(tags)]
+	packages = []
+	for level in range(depth - 1, -1, -1):
+		for index in range(fan_out ** (level + 1)):
+			depends = []
+			if level + 1 < depth:
+				depends = ["bench/pkg{}_{}@{}/pkg{}_{}.pri".format(level + 1, index * fan_out + child, versions[0], level + 1, index * fan_out + child) for child in range(fan_out)]
+			create_repo(work_dir, "bench/pkg{}_{}".format(level, index), files=files, tags=versions, depends=depends)
+			packages.append("bench/pkg{}_{}@{}".format(level, index, versions[0]))
+
+	pro_file = os.path.join(work_dir, "project", "project.pro")
+	os.makedirs(os.path.dirname(pro_file))
+	with open(pro_file, "w") as out_file:
+		out_file.write("TEMPLATE = aux\n")
+		for index in range(fan_out):
+			out_file.write("QDEP_DEPENDS += bench/pkg0_{}@{}/pkg0_{}.pri\n".format(index, versions[0], index))
+		out_file.write("!load(qdep):error(\"Failed to load qdep feature\")\n")
+	return packages, pro_file
+
+
+def command_list(work_dir, packages, pro_file, qmake):
+	direct = [package + "/" + package.split("/")[1].split("@")[0] + ".pri" for package in packages if "/pkg0_" in package]
+	commands = {
+		"dephash": ["dephash"] + direct,
+		"pkgresolve": ["pkgresolve", "--batch"] + [arg for package in packages for arg in [package, ""]],
+		"resolve-tree": ["resolve-tree", "--qmake", qmake or "qmake", os.path.join(work_dir, "tree.pri")] + direct,
+		"get": ["get", "--extract", pro_file],
+		"update": ["update", pro_file]
+	}
+	if qmake is not None:
+		commands["get --eval"] = ["get", "--eval", "--qmake", qmake, pro_file]
+	return commands
+
+
+def run_qmake(qmake, pro_file, build_dir, env):
+	shutil.rmtree(build_dir, ignore_errors=True)
+	os.makedirs(build_dir)
+	subprocess.run([qmake, pro_file], cwd=build_dir, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark qdep with a generated tree of local package repositories.")
+	parser.add_argument("--fan-out", dest="fan_out", type=int, default=2, help="The number of dependencies of the project and of every package.")
+	parser.add_argument("--depth", type=int, default=3, help="The number of dependency levels below the project.")
+	parser.add_argument("--files", type=int, default=50, help="The number of source files in every package.")
+	parser.add_argument("--tags", type=int, default=3, help="The number of version tags of every package. Dependencies use the oldest one, so update has something to find.")
+	parser.add_argument("--rounds", type=int, default=5, help="The number of runs per command and cache state.")
+	parser.add_argument("--qmake", help="A qmake to also benchmark a full configure of the generated project with.")
+	parser.add_argument("--json", help="Write the results to this file.")
+	parser.add_argument("--baseline", help="A previous json result to compare against. Exits with 1 if any median got slower than the tolerance allows.")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="The allowed relative slowdown compared to the baseline.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as work_dir:
+		packages, pro_file = create_tree(work_dir, args.fan_out, args.depth, args.files, args.tags)
+		env = bench_env(work_dir, QDEP_DAEMON_SOCKET=os.path.join(work_dir, "no-daemon.sock"), QMAKEPATH=work_dir)
+		run_qdep("prfgen", "-d", work_dir, env=env)
+		cache_dir = env["QDEP_CACHE_DIR"]
+
+		def clear_cache():
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+		results = {}
+		for name, cmd_args in command_list(work_dir, packages, pro_file, args.qmake).items():
+			results[name + " cold"] = time_call(lambda: run_qdep(*cmd_args, env=env), args.rounds, setup=clear_cache)
+			results[name + " warm"] = time_call(lambda: run_qdep(*cmd_args, env=env), args.rounds)
+		if args.qmake is not None:
+			build_dir = os.path.join(work_dir, "build")
+			results["qmake cold"] = time_call(lambda: run_qmake(args.qmake, pro_file, build_dir, env), args.rounds, setup=clear_cache)
+			results["qmake warm"] = time_call(lambda: run_qmake(args.qmake, pro_file, build_dir, env), args.rounds)
+
+	print("{} packages ({} levels with a fan-out of {}), {} files and {} tags each".format(len(packages), args.depth, args.fan_out, args.files, args.tags))
+	print_results(results)
+
+	if args.json is not None:
+		git_version = subprocess.run(["git", "--version"], stdout=subprocess.PIPE, encoding="UTF-8").stdout.strip()
+		write_json(args.json, results, benchmark="scale", python=sys.version.split()[0], git=git_version, packages=len(packages), fan_out=args.fan_out, depth=args.depth, files=args.files, tags=args.tags)
+
+	if args.baseline is not None:
+		regressions = compare_baseline(results, args.baseline, args.tolerance)
+		if len(regressions) > 0:
+			print("\nRegressions detected:\n\t" + "\n\t".join(regressions), file=sys.stderr)
+			sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Measures the startup time of qdep for each subcommand, as wall-clock time and as python -X importtime breakdown
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from benchutil import *
+
+
+def command_list(work_dir):
+	pro_file = os.path.join(work_dir, "dummy.pro")
+	return {
+		"--version": ["--version"],
+		"--help": ["--help"],
+		"dephash": ["dephash", "bench/package", "bench/package@1.0.0/other.pri"],
+		"prolink": ["prolink", work_dir, "__QDEP_PKG_0", "/package.pro"],
+		"hookgen": ["hookgen", "--hooks", "hook_fn", "--", "bench", os.path.join(work_dir, "qdep_bench_hooks.h"), pro_file, "res.qrc"],
+		"hookimp": ["hookimp", "--hooks", "hook_fn", "--", os.path.join(work_dir, "qdep_imported_hooks.cpp"), pro_file, os.path.join(work_dir, "qdep_bench_hooks.h")],
+		"pkgresolve": ["pkgresolve", "bench/package@1.0.0"],
+		"query": ["query", "--no-check", "bench/package"]
+	}
+
+
+def import_times(args, env):
+	res = subprocess.run([sys.executable, "-X", "importtime", qdep_entry] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, encoding="UTF-8", check=True)
+	line_pattern = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+	modules = []
+	for line in res.stderr.splitlines():
+		match = re.match(line_pattern, line)
+		if match:
+			modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3))))
+	total_us = sum(module[1] for module in modules)
+	top_level = sorted((module for module in modules if module[3] == 1), key=lambda module: module[2], reverse=True)
+	return {
+		"import_ms": total_us / 1000,
+		"module_count": len(modules),
+		"top_imports": [{"module": name, "cumulative_ms": cumulative / 1000} for name, _s, cumulative, _d in top_level[:5]]
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the startup time of all qdep subcommands.")
+	parser.add_argument("--rounds", type=int, default=20, help="The number of runs per subcommand.")
+	parser.add_argument("--json", help="Write the results to this file.")
+	parser.add_argument("--baseline", help="A previous json result to compare against. Exits with 1 if any median got slower than the tolerance allows.")
+	parser.add_argument("--tolerance", type=float, default=0.25, help="The allowed relative slowdown compared to the baseline.")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as work_dir:
+		create_repo(work_dir, "bench/package", tags=["1.0.0"])
+		env = bench_env(work_dir, QDEP_DAEMON_SOCKET=os.path.join(work_dir, "no-daemon.sock"))
+		run_qdep("pkgresolve", "bench/package@1.0.0", env=env)  # prefill the cache
+
+		results = {}
+		for name, cmd_args in command_list(work_dir).items():
+			results[name] = time_call(lambda: run_qdep(*cmd_args, env=env), args.rounds)
+			results[name].update(import_times(cmd_args, env))
+
+	print_results(results)
+	print("")
+	for name, res in results.items():
+		print("{}: {:.1f} ms in {} imports - {}".format(name, res["import_ms"], res["module_count"], ", ".join("{} {:.1f} ms".format(imp["module"], imp["cumulative_ms"]) for imp in res["top_imports"])))
+
+	if args.json is not None:
+		write_json(args.json, results, benchmark="startup", python=sys.version.split()[0])
+
+	if args.baseline is not None:
+		regressions = compare_baseline(results, args.baseline, args.tolerance)
+		if len(regressions) > 0:
+			print("\nStartup regressions detected:\n\t" + "\n\t".join(regressions), file=sys.stderr)
+			sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
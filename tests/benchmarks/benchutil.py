@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+qdep_entry = os.path.join(root_dir, "tests", "testentry.py")
+
+
+def bench_env(work_dir, **extra):
+	env = os.environ.copy()
+	env["PYTHONPATH"] = root_dir + os.pathsep + env.get("PYTHONPATH", "")
+	env["QDEP_CACHE_DIR"] = os.path.join(work_dir, "cache")
+	env["QDEP_DEFAULT_PKG_FN"] = "file://" + os.path.join(work_dir, "repos", "{}", ".git")
+	env.update(extra)
+	return env
+
+
+def git(*args, cwd):
+	subprocess.run(["git"] + list(args), cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def create_repo(work_dir, name, files=None, tags=None, depends=None):
+	repo_dir = os.path.join(work_dir, "repos", name)
+	os.makedirs(repo_dir)
+	git("init", "-q", cwd=repo_dir)
+	git("symbolic-ref", "HEAD", "refs/heads/master", cwd=repo_dir)
+	git("config", "user.email", "bench@qdep", cwd=repo_dir)
+	git("config", "user.name", "qdep bench", cwd=repo_dir)
+
+	pkg_name = os.path.basename(name).lower()
+	with open(os.path.join(repo_dir, pkg_name + ".pri"), "w") as pri_file:
+		pri_file.write("HEADERS += $$PWD/{}.h\n".format(pkg_name))
+		for dep in (depends if depends is not None else []):
+			pri_file.write("QDEP_DEPENDS += {}\n".format(dep))
+	with open(os.path.join(repo_dir, pkg_name + ".h"), "w") as hdr_file:
+		hdr_file.write("#pragma once\n")
+	for index in range(files if files is not None else 0):
+		sub_dir = os.path.join(repo_dir, "src", str(index // 100))
+		os.makedirs(sub_dir, exist_ok=True)
+		with open(os.path.join(sub_dir, "file{}.cpp".format(index)), "w") as src_file:
+			src_file.write("int value{} = {};\n".format(index, index))
+
+	git("add", "-A", cwd=repo_dir)
+	git("commit", "-q", "-m", "initial", cwd=repo_dir)
+	for tag in (tags if tags is not None else []):
+		git("tag", tag, cwd=repo_dir)
+	return repo_dir
+
+
+def run_qdep(*args, env, check=True):
+	return subprocess.run([sys.executable, qdep_entry] + list(args), env=env, check=check, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="UTF-8")
+
+
+def time_call(fn, rounds, setup=None):
+	timings = []
+	for _i in range(rounds):
+		if setup is not None:
+			setup()
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+	timings.sort()
+	return {
+		"rounds": rounds,
+		"min_ms": timings[0] * 1000,
+		"median_ms": timings[len(timings) // 2] * 1000,
+		"max_ms": timings[-1] * 1000
+	}
+
+
+def print_results(results):
+	name_width = max(len(name) for name in results.keys())
+	print("{}  {:>10}  {:>10}  {:>10}".format("benchmark".ljust(name_width), "min [ms]", "median", "max"))
+	for name, res in results.items():
+		print("{}  {:>10.1f}  {:>10.1f}  {:>10.1f}".format(name.ljust(name_width), res["min_ms"], res["median_ms"], res["max_ms"]))
+
+
+def write_json(json_path, results, **meta):
+	with open(json_path, "w") as json_file:
+		json.dump({"meta": meta, "results": results}, json_file, indent=2, sort_keys=True)
+
+
+def compare_baseline(results, baseline_path, tolerance):
+	# returns a description of every result whose median got slower than the tolerance allows
+	with open(baseline_path, "r") as baseline_file:
+		baseline = json.load(baseline_file)["results"]
+	regressions = []
+	for name, res in results.items():
+		if name in baseline and res["median_ms"] > baseline[name]["median_ms"] * (1 + tolerance):
+			regressions.append("{}: {:.1f} ms -> {:.1f} ms".format(name, baseline[name]["median_ms"], res["median_ms"]))
+	return regressions
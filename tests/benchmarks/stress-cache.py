@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Runs many concurrent resolvers against one cache, including resolvers that get killed while cloning
+# usage: stress-cache.py [processes] [rounds]
+
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchutil import *
+
+
+def start_resolver(env, *packages):
+	return subprocess.Popen([sys.executable, qdep_entry, "pkgresolve", "--batch"] + [arg for pkg in packages for arg in [pkg, ""]], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="UTF-8")
+
+
+def main():
+	processes = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+	rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+	failures = []
+	with tempfile.TemporaryDirectory() as work_dir:
+		repos = {}
+		for index in range(4):
+			repos["stress/package{}".format(index)] = create_repo(work_dir, "stress/package{}".format(index), files=200, tags=["1.0.0", "1.1.0"])
+		packages = [name + version for name in repos.keys() for version in ["@1.0.0", "@1.1.0", "@master"]]
+		env = bench_env(work_dir, QDEP_REF_CACHE_TTL="0", QDEP_LOCK_TIMEOUT="120")
+
+		for round_index in range(rounds):
+			# crash some resolvers in the middle of their work to leave partial checkouts and dead lock holders behind
+			killed = [start_resolver(env, *packages) for _i in range(4)]
+			time.sleep(0.1 * (round_index + 1))
+			for proc in killed:
+				proc.send_signal(signal.SIGKILL)
+				proc.wait()
+
+			# move the branches, so the resolvers pull while others read
+			for repo_dir in repos.values():
+				with open(os.path.join(repo_dir, "round.txt"), "w") as round_file:
+					round_file.write(str(round_index))
+				git("add", "-A", cwd=repo_dir)
+				git("commit", "-q", "-m", "round {}".format(round_index), cwd=repo_dir)
+
+			start = time.perf_counter()
+			procs = [start_resolver(env, *(packages[i % len(packages):] + packages[:i % len(packages)])) for i in range(processes)]
+			outputs = [proc.communicate() + (proc.returncode,) for proc in procs]
+			duration = time.perf_counter() - start
+
+			results = set()
+			for stdout, stderr, code in outputs:
+				if code != 0:
+					failures.append(stderr.strip())
+				else:
+					lines = stdout.splitlines()
+					results.add(frozenset(tuple(lines[i:i + 5]) for i in range(0, len(lines), 5)))
+			if len(results) > 1:
+				failures.append("round {}: resolvers returned different results".format(round_index))
+			print("round {}: {} resolvers in {:.2f} s, {} failed".format(round_index, processes, duration, sum(1 for output in outputs if output[2] != 0)))
+
+			# every branch checkout must have the latest commit
+			for stdout, _e, code in outputs[:1]:
+				lines = stdout.splitlines()
+				for index in range(0, len(lines), 5):
+					if lines[index + 1] == "master":
+						with open(os.path.join(lines[index + 2], "round.txt"), "r") as round_file:
+							if round_file.read() != str(round_index):
+								failures.append("round {}: {} was not updated".format(round_index, lines[index + 2]))
+
+	if len(failures) > 0:
+		print("\n".join(failures), file=sys.stderr)
+		sys.exit(1)
+	print("All resolvers succeeded")
+
+
+if __name__ == '__main__':
+	main()
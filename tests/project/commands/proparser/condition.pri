@@ -0,0 +1,2 @@
+QDEP_DEPENDS += org/first@1.0.0/first.pri
+!unknown_config: QDEP_DEPENDS += org/second@1.0.0/second.pri
@@ -0,0 +1 @@
+QDEP_DEPENDS += $$PWD/../first@1.0.0/first.pri
@@ -0,0 +1 @@
+include(plain.pri)
@@ -0,0 +1,2 @@
+qdep_var = QDEP_PROJECT
+$${qdep_var}_DEPENDS += org/project@1.0.0/project.pro
@@ -0,0 +1,19 @@
+TEMPLATE = aux
+QDEP_DEPENDS = org/first@1.0.0/first.pri  # a comment
+# QDEP_DEPENDS += org/commented@1.0.0/commented.pri
+QDEP_DEPENDS += org/second@1.0.0/second.pri \
+	org/third@1.0.0/third.pri \
+	org/fourth@1.0.0/fourth.pri
+QDEP_DEPENDS *= org/first@1.0.0/first.pri org/fifth@1.0.0/fifth.pri
+QDEP_DEPENDS -= org/third@1.0.0/third.pri
+QDEP_PROJECT_SUBDIRS += org/project@1.0.0/project.pro
+QDEP_PROJECT_SUBDIRS = org/replaced@1.0.0/replaced.pro
+
+# scopes and expansions that do not touch qdep variables can be skipped
+win32 {
+	CONFIG += windows_only
+	unix: DEFINES += $${TARGET}_NESTED
+}
+else: DEFINES += NOT_WINDOWS
+
+!load(qdep):error("Failed to load qdep feature")
@@ -0,0 +1,4 @@
+QDEP_DEPENDS += org/first@1.0.0/first.pri
+win32 {
+	QDEP_DEPENDS += org/windows@1.0.0/windows.pri
+}
@@ -2,6 +2,7 @@
 
 import sys
 import os
+import json
 import shutil
 import subprocess
 import xml.etree.ElementTree as ET
@@ -87,22 +88,31 @@ def test_versions():
 			return vs_sout.strip().split(" ")
 
 	v_res = v_fetch()
-	assert v_res[0:5] == ["Tags:", "1.0.0", "1.0.1", "1.0.10", "1.0.11"]
+	assert v_res[0:3] == ["Tags:", "1.0.0", "1.0.1"]
 	assert v_res[-1] == "1.2.0"
 
 	v_res = v_fetch("-b", "--no-tags")
 	assert v_res == ["Branches:", "master"]
 
 	v_res = v_fetch("-b")
-	assert v_res[0:8] == ["Branches:", "master", "", "Tags:", "1.0.0", "1.0.1", "1.0.10", "1.0.11"]
+	assert v_res[0:6] == ["Branches:", "master", "", "Tags:", "1.0.0", "1.0.1"]
 	assert v_res[-1] == "1.2.0"
 
 	v_res = v_fetch("-b", "-s", strip=False)
-	assert v_res[0:5] == ["master", "1.0.0", "1.0.1", "1.0.10", "1.0.11"]
+	assert v_res[0:3] == ["master", "1.0.0", "1.0.1"]
 	assert v_res[-1] == "1.2.0"
 
-	v_res = v_fetch("-s", "--limit", "5", strip=False)
-	assert v_res == ["1.0.7", "1.0.8", "1.0.9", "1.1.0", "1.2.0"]
+	v_res = v_fetch("-s", strip=False)
+	assert v_res.index("1.0.9") < v_res.index("1.0.10")
+	v_limit = v_fetch("-s", "--limit", "5", strip=False)
+	assert v_limit == v_res[-5:]
+	assert v_limit[-2:] == ["1.1.0", "1.2.0"]
+
+	vs_sout, _e = exec_qdep("versions", "--json", "-b", "Skycoder42/qpmx-sample-package", "Skycoder42/qdep", keep_stdout=True)
+	v_json = {entry["package"]: entry for entry in map(json.loads, vs_sout.strip().split("\n"))}
+	assert v_json["Skycoder42/qpmx-sample-package"]["tags"] == v_res
+	assert v_json["Skycoder42/qpmx-sample-package"]["branches"] == ["master"]
+	assert "master" in v_json["Skycoder42/qdep"]["branches"]
 
 
 def test_query():
@@ -124,6 +134,12 @@ def test_query():
 	q_res = q_fetch("--expand")
 	assert q_res == ["https://github.com/Skycoder42/qpmx-sample-package.git@1.2.0/qpmx-sample-package.pri"]
 
+	qry_sout, _e = exec_qdep("query", "--json", "Skycoder42/qpmx-sample-package", "Skycoder42/qpmx-sample-package@1.0.0", "Skycoder42/qpmx-sample-package@0.0.0", keep_stdout=True)
+	q_json = {entry["input"]: entry for entry in map(json.loads, qry_sout.strip().split("\n"))}
+	assert q_json["Skycoder42/qpmx-sample-package"]["version"] == "1.2.0"
+	assert q_json["Skycoder42/qpmx-sample-package@1.0.0"]["exists"]
+	assert not q_json["Skycoder42/qpmx-sample-package@0.0.0"]["exists"]
+
 	q_res = q_fetch("--no-check")
 	assert q_res == [
 		"Input: Skycoder42/qpmx-sample-package",
@@ -195,7 +211,7 @@ def test_get():
 
 	sout, serr = g_fetch("Skycoder42/qdep@master/tests/packages/basic/package1/package1.pri")
 	assert len(sout) == 5
-	assert len(serr) == 1
+	assert len(serr) == 0  # clones are quiet
 
 	sout, serr = g_fetch("--no-recurse", "Skycoder42/qdep@master/tests/packages/basic/package2/package2.pri")
 	assert len(sout) == 3
@@ -225,6 +241,402 @@ def test_get():
 	assert len(sout) == 3
 
 
+def test_extract():
+	depends_vars = ["QDEP_DEPENDS", "QDEP_PROJECT_SUBDIRS", "QDEP_PROJECT_LINK_DEPENDS", "QDEP_PROJECT_DEPENDS"]
+
+	def e_qmake(pro_file):
+		# what qmake itself reads from the file, via qmake -E on a project that only loads the variables
+		with open("extract_dump.pro", "w") as dump_file:
+			for var in depends_vars:
+				dump_file.write("qdep_extract_{} = $$fromfile($$quote({}), {})\n".format(var, pro_file, var))
+		sout, _e = exec_qmake("-E", "extract_dump.pro", keep_stdout=True)
+		values = {}
+		for line in sout.split("\n"):
+			if line.startswith("qdep_extract_") and " = " in line:
+				var, value = line[len("qdep_extract_"):].split(" = ", 1)
+				values[var] = value.split()
+		return [value for var in depends_vars for value in values.get(var, [])]
+
+	def e_qdep(pro_file):
+		# the packages qdep extracted, and whether it needed qmake for that
+		os.environ["QDEP_TRACE"] = os.path.abspath("extract.jsonl")
+		try:
+			if os.path.exists("extract.jsonl"):
+				os.remove("extract.jsonl")
+			sout, _e = exec_qdep("get", "--extract", "--no-recurse", "--qmake", qmake_path, "--dir", os.path.abspath("extract_cache"), pro_file, keep_stdout=True)
+		finally:
+			os.environ.pop("QDEP_TRACE")
+		with open("extract.jsonl", "r") as trace_file:
+			spans = [json.loads(line) for line in trace_file]
+		used_qmake = any(span["cat"] == "subprocess" and span["name"] == os.path.splitext(os.path.basename(qmake_path))[0] for span in spans)
+		lines = [line.strip() for line in sout.split("\n")]
+		found = [int(line.split()[1]) for line in lines if line.startswith("Found ") and line.endswith(" initial packages")]
+		downloaded = [line[len("Downloading sources for "):-len("...")] for line in lines if line.startswith("Downloading sources for ")]
+		return found[0], downloaded, used_qmake
+
+	with open("native.pri", "w") as pro_file:
+		pro_file.write("QDEP_DEPENDS = Skycoder42/qdep@master/tests/packages/basic/package1/package1.pri  # comment\n")
+		pro_file.write("# QDEP_DEPENDS += Skycoder42/qdep@master/tests/packages/basic/package2/package2.pri\n")
+		pro_file.write("QDEP_DEPENDS *= Skycoder42/qdep@master/tests/packages/basic/package1/package1.pri \\\n")
+		pro_file.write("\tSkycoder42/qdep@master/tests/packages/basic/package3/package3.pri \\\n")
+		pro_file.write("\tSkycoder42/qdep@master/tests/packages/basic/package4/package4.pri\n")
+		pro_file.write("QDEP_DEPENDS -= Skycoder42/qdep@master/tests/packages/basic/package3/package3.pri\n")
+		pro_file.write("QDEP_PROJECT_DEPENDS += Skycoder42/qdep@master/tests/packages/libs/project3/project3.pro\n")
+		pro_file.write("QDEP_PROJECT_SUBDIRS += Skycoder42/qdep@master/tests/packages/libs/project1/project1.pro\n")
+		pro_file.write("win32 {\n\tCONFIG += windows_only\n}\n")
+	with open("scoped.pri", "w") as pro_file:
+		pro_file.write("QDEP_DEPENDS += Skycoder42/qdep@master/tests/packages/basic/package1/package1.pri\n")
+		pro_file.write("!unknown_config: QDEP_DEPENDS += Skycoder42/qdep@master/tests/packages/basic/package2/package2.pri\n")
+	with open("included.pri", "w") as pro_file:
+		pro_file.write("include(native.pri)\n")
+		pro_file.write("QDEP_DEPENDS += $$QDEP_PROJECT_DEPENDS\n")
+
+	pkg_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "packages"))
+	pro_files = [os.path.join(root, file) for root, _d, files in os.walk(pkg_dir) for file in files if file.endswith(".pri") or file.endswith(".pro")]
+	pro_files += [os.path.abspath("native.pri"), os.path.abspath("scoped.pri"), os.path.abspath("included.pri")]
+	native_count = 0
+	for pro_file in sorted(pro_files):
+		qmake_res = e_qmake(pro_file)
+		found_count, downloaded, used_qmake = e_qdep(pro_file)
+		print("Comparing", pro_file, qmake_res)
+		assert found_count == len(qmake_res)
+		assert sorted(downloaded) == sorted(set(qmake_res))
+		if used_qmake:
+			print("Fell back to qmake for", pro_file)
+			assert os.path.basename(pro_file) in ["scoped.pri", "included.pri"]
+		else:
+			native_count += 1
+	assert native_count == len(pro_files) - 2
+
+
+def test_proparser():
+	# the native reader must either return what qmake would, or refuse the file so qmake is used instead
+	from qdep.internal.proparser import UnsupportedSyntaxError, read_variables
+
+	fixture_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "proparser"))
+	depends_vars = ["QDEP_DEPENDS", "QDEP_PROJECT_SUBDIRS", "QDEP_PROJECT_LINK_DEPENDS", "QDEP_PROJECT_DEPENDS"]
+	values = read_variables(os.path.join(fixture_dir, "plain.pri"), depends_vars)
+	assert values == {
+		"QDEP_DEPENDS": ["org/first@1.0.0/first.pri", "org/second@1.0.0/second.pri", "org/fourth@1.0.0/fourth.pri", "org/fifth@1.0.0/fifth.pri"],
+		"QDEP_PROJECT_SUBDIRS": ["org/replaced@1.0.0/replaced.pro"],
+		"QDEP_PROJECT_LINK_DEPENDS": [],
+		"QDEP_PROJECT_DEPENDS": []
+	}
+
+	# scopes, conditions, includes and expansions that touch the variables need qmake
+	for name, line_nr in [("scoped", 3), ("condition", 2), ("included", 1), ("expanded", 1), ("indirect", 2)]:
+		try:
+			read_variables(os.path.join(fixture_dir, name + ".pri"), depends_vars)
+			assert False, "{}.pri was evaluated without qmake".format(name)
+		except UnsupportedSyntaxError as error:
+			assert str(error).startswith("{}:{}: ".format(os.path.join(fixture_dir, name + ".pri"), line_nr))
+
+
+def create_local_package(name, tags, depends=None, payload_size=0):
+	# a package repository on disk, so the resolver can be tested without network access
+	repo_dir = os.path.abspath(os.path.join("repos", name))
+	os.makedirs(repo_dir)
+	git_env = dict(os.environ, GIT_AUTHOR_NAME="qdep", GIT_AUTHOR_EMAIL="qdep@test", GIT_COMMITTER_NAME="qdep", GIT_COMMITTER_EMAIL="qdep@test")
+	with open(os.path.join(repo_dir, name + ".pri"), "w") as pri_file:
+		for dep in (depends if depends is not None else []):
+			pri_file.write("QDEP_DEPENDS += {}\n".format(dep))
+	subprocess.run(["git", "init", "--quiet"], cwd=repo_dir, check=True)
+	subprocess.run(["git", "add", "-A"], cwd=repo_dir, check=True)
+	subprocess.run(["git", "commit", "--quiet", "-m", "initial"], cwd=repo_dir, env=git_env, check=True)
+	for tag in tags:
+		if payload_size > 0:
+			# every tag gets its own commit with incompressible content, so versions take up distinct space in the cache
+			with open(os.path.join(repo_dir, "payload.bin"), "wb") as payload_file:
+				payload_file.write(os.urandom(payload_size))
+			subprocess.run(["git", "add", "-A"], cwd=repo_dir, check=True)
+			subprocess.run(["git", "commit", "--quiet", "-m", tag], cwd=repo_dir, env=git_env, check=True)
+		subprocess.run(["git", "tag", tag], cwd=repo_dir, check=True)
+	return "file://" + repo_dir + "/.git"
+
+
+def test_resolvetree():
+	liba_url = create_local_package("liba", ["1.0.0", "1.9.0"])
+	libc_url = create_local_package("libc", ["1.0.0"], depends=[liba_url + "@1.0.0/liba.pri"])
+	os.environ["QDEP_CACHE_DIR"] = os.path.abspath("cache")
+	try:
+		exec_qdep("pkgresolve", libc_url + "@1.0.0/libc.pri")
+		exec_qdep("pkgresolve", liba_url + "@1.0.0/liba.pri")
+
+		# liba@1.9.0 is shadowed by the liba@1.0.0 of libc, so it is never resolved - even though it cannot be cloned
+		exec_qdep("resolve-tree", "--no-clone", "--qmake", qmake_path, "tree.pri", libc_url + "@1.0.0/libc.pri", liba_url + "@1.9.0/liba.pri")
+		with open("tree.pri", "r") as tree_file:
+			tree = tree_file.read()
+		assert ".version = $$quote(1.0.0)" in tree and "$$quote(1.9.0)" not in tree
+		assert "and package \\\"{}@1.9.0/liba.pri\\\" was detected".format(liba_url) in tree
+
+		# known versions of packages without version identifier are used instead of the latest one
+		liba_hash, _e = exec_qdep("dephash", liba_url, keep_stdout=True)
+		exec_qdep("resolve-tree", "--known", liba_hash.strip() + "=1.0.0", "--qmake", qmake_path, "known.pri", liba_url)
+		with open("known.pri", "r") as tree_file:
+			assert "{}.version = $$quote(1.0.0)\n".format(liba_hash.strip()) in tree_file.read()
+
+		with open("project.pro", "w") as pro_file:
+			pro_file.write("QDEP_DEPENDS += {}@1.0.0/libc.pri {}@1.9.0/liba.pri\n".format(libc_url, liba_url))
+		exec_qdep("lock", "--qmake", qmake_path, "project.pro")
+		with open("qdep.lock", "r") as lock_file:
+			assert [entry["requested"] for entry in json.load(lock_file)["packages"]] == ["1.0.0", "1.0.0"]
+	finally:
+		os.environ.pop("QDEP_CACHE_DIR")
+
+
+def test_knownversion():
+	# a version set in the pro file is used for a package without version identifier, not the latest one
+	liba_url = create_local_package("liba", ["1.0.0", "1.9.0"])
+	liba_hash, _e = exec_qdep("dephash", liba_url, keep_stdout=True)
+	with open("test.pro", "w") as pro_file:
+		pro_file.write("TEMPLATE = aux\n")
+		pro_file.write("QDEP_DEPENDS += {}\n".format(liba_url))
+		pro_file.write("{}.version = 1.0.0\n".format(liba_hash.strip()))
+		pro_file.write("!load(qdep):error(\"Failed to load qdep feature\")\n")
+		pro_file.write("!equals({}.version, 1.0.0):error(\"The version from the pro file was not used\")\n".format(liba_hash.strip()))
+	exec_qmake()
+
+
+def test_gc():
+	def cache_size():
+		return sum(os.path.getsize(os.path.join(root, file)) for root, _d, files in os.walk("cache") for file in files)
+
+	liba_url = create_local_package("liba", ["1.0.0", "1.1.0", "1.2.0"], payload_size=1024 * 1024)
+	os.environ["QDEP_CACHE_DIR"] = os.path.abspath("cache")
+	try:
+		for version in ["1.0.0", "1.1.0", "1.2.0"]:
+			exec_qdep("pkgresolve", liba_url + "@" + version + "/liba.pri")
+		size_before = cache_size()
+
+		# the objects of evicted versions are pruned from the mirror, so the latest version still fits
+		exec_qdep("cache", "gc", "--max-size", str(size_before // 2))
+		assert cache_size() <= size_before // 2
+		versions, _e = exec_qdep("cache", "list", keep_stdout=True)
+		assert "1.2.0" in versions and "1.0.0" not in versions
+	finally:
+		os.environ.pop("QDEP_CACHE_DIR")
+
+
+def test_frozen():
+	# file urls stand in for remotes here, so git must be allowed to clone submodules from them
+	git_env = {"GIT_CONFIG_COUNT": "1", "GIT_CONFIG_KEY_0": "protocol.file.allow", "GIT_CONFIG_VALUE_0": "always"}
+	liba_url = create_local_package("liba", ["1.0.0"])
+	libs_url = create_local_package("libs", [])
+	libs_dir = os.path.join("repos", "libs")
+	subprocess.run(["git", "submodule", "add", "--quiet", liba_url, "liba"], cwd=libs_dir, env=dict(os.environ, **git_env), check=True)
+	subprocess.run(["git", "commit", "--quiet", "-m", "submodule"], cwd=libs_dir, env=dict(os.environ, GIT_AUTHOR_NAME="qdep", GIT_AUTHOR_EMAIL="qdep@test", GIT_COMMITTER_NAME="qdep", GIT_COMMITTER_EMAIL="qdep@test"), check=True)
+	subprocess.run(["git", "tag", "1.0.0"], cwd=libs_dir, check=True)
+
+	os.environ.update(git_env, QDEP_CACHE_DIR=os.path.abspath("cache"))
+	try:
+		with open("project.pro", "w") as pro_file:
+			pro_file.write("QDEP_DEPENDS += {}@1.0.0/liba.pri {}@1.0.0/libs.pri\n".format(liba_url, libs_url))
+		exec_qdep("lock", "--qmake", qmake_path, "project.pro")
+
+		# the locked commits are in the mirrors, but the submodule of libs is not, so only liba can be checked out
+		exec_qdep("pkgresolve", "--frozen", "--lock-file", "qdep.lock", liba_url + "@1.0.0/liba.pri")
+		try:
+			exec_qdep("pkgresolve", "--frozen", "--lock-file", "qdep.lock", libs_url + "@1.0.0/libs.pri", keep_stderr=True)
+			assert False, "frozen mode cloned the submodules of libs"
+		except subprocess.CalledProcessError as error:
+			assert "The submodules of package {} at commit".format(libs_url) in error.stderr
+	finally:
+		for key in list(git_env.keys()) + ["QDEP_CACHE_DIR"]:
+			os.environ.pop(key)
+
+
+def test_archive():
+	import http.server
+	import threading
+
+	def git(*args, cwd="archive"):
+		subprocess.run(["git"] + list(args), cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+
+	# fixture repository with a tag, served as bare repo (for the refs) and as archive via http
+	os.makedirs("archive")
+	git("init", "-q")
+	git("symbolic-ref", "HEAD", "refs/heads/master")
+	with open("archive/archive.pri", "w") as pri_file:
+		pri_file.write("HEADERS += $$PWD/archive.h\n")
+	with open("archive/archive.h", "w") as hdr_file:
+		hdr_file.write("#pragma once\n")
+	git("add", "-A")
+	git("-c", "user.name=qdep", "-c", "user.email=qdep@test", "commit", "-q", "-m", "initial")
+	git("tag", "1.0.0")
+	git("clone", "-q", "--bare", "archive", "archive.git", cwd=".")
+	os.makedirs("www")
+	git("archive", "--format=tar.gz", "--prefix=archive-1.0.0/", "-o", os.path.abspath("www/archive-1.0.0.tar.gz"), "1.0.0")
+
+	requests = []
+
+	class FixtureHandler(http.server.SimpleHTTPRequestHandler):
+		def __init__(self, *args, **kwargs):
+			super().__init__(*args, directory=os.path.abspath("www"), **kwargs)
+
+		def log_message(self, format, *args):
+			requests.append(self.path)
+
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	old_env = os.environ.copy()
+	os.environ["QDEP_FETCH_BACKEND"] = "archive"
+	os.environ["QDEP_ARCHIVE_URL_FN"] = "http://127.0.0.1:{}/{{name}}-{{tag}}.tar.gz".format(server.server_address[1])
+	os.environ["QDEP_CACHE_DIR"] = os.path.abspath("cache")
+	try:
+		pkg_url = "file://" + os.path.abspath("archive.git")
+		sout, _e = exec_qdep("pkgresolve", pkg_url + "@1.0.0", keep_stdout=True)
+		tag_dir = sout.strip().split("\n")[2]
+		assert requests == ["/archive-1.0.0.tar.gz"]
+		assert os.path.exists(os.path.join(tag_dir, "archive.h"))
+		assert os.path.exists(os.path.join(tag_dir, ".qdep_static_branch"))
+		assert not os.path.exists(os.path.join(tag_dir, ".git"))
+
+		# branches are always fetched via git
+		sout, _e = exec_qdep("pkgresolve", pkg_url + "@master", keep_stdout=True)
+		branch_dir = sout.strip().split("\n")[2]
+		assert requests == ["/archive-1.0.0.tar.gz"]
+		assert os.path.exists(os.path.join(branch_dir, ".git"))
+	finally:
+		os.environ.clear()
+		os.environ.update(old_env)
+		server.shutdown()
+
+
+def test_hooks():
+	def h_run(*hooks, resources=("res2.qrc", "res1.qrc")):
+		exec_qdep("hookgen", "--hooks", *hooks, "--", "hooks", "qdep_hooks_hooks.h", "hooks.pro", *resources)
+		exec_qdep("hookimp", "--hooks", *hooks, "--", "qdep_imported_hooks.cpp", "hooks.pro", "qdep_hooks_hooks.h")
+
+	def h_read(file_name):
+		with open(file_name, "rb") as in_file:
+			return in_file.read()
+
+	h_run("hook_a", "ns::hook_b", "hook_a")
+	header_data = h_read("qdep_hooks_hooks.h")
+	assert header_data.count(b"::hook_a();") == 1
+	assert header_data.index(b"Q_INIT_RESOURCE(res1)") < header_data.index(b"Q_INIT_RESOURCE(res2)")
+	assert header_data.index(b"::hook_a();") < header_data.index(b"::ns::hook_b();")
+	assert b"\r\n" not in header_data
+	source_data = h_read("qdep_imported_hooks.cpp")
+	assert b"qdep_hooks_init();" in source_data
+
+	# unchanged input must not touch the generated files, so nothing that includes them is rebuilt
+	os.utime("qdep_hooks_hooks.h", (1000000000, 1000000000))
+	os.utime("qdep_imported_hooks.cpp", (1000000000, 1000000000))
+	h_run("hook_a", "ns::hook_b", resources=("res1.qrc", "res2.qrc"))
+	assert os.path.getmtime("qdep_hooks_hooks.h") == 1000000000
+	assert os.path.getmtime("qdep_imported_hooks.cpp") == 1000000000
+	assert h_read("qdep_hooks_hooks.h") == header_data
+	assert h_read("qdep_imported_hooks.cpp") == source_data
+
+	h_run("hook_a", "ns::hook_b", "hook_c")
+	assert os.path.getmtime("qdep_hooks_hooks.h") != 1000000000
+	assert os.path.getmtime("qdep_imported_hooks.cpp") != 1000000000
+	assert b"::hook_c();" in h_read("qdep_hooks_hooks.h")
+
+
+def test_lconvert():
+	# a fake lconvert, that concatenates the inputs and logs every call
+	with open("fake_lconvert.py", "w") as tool_file:
+		tool_file.write("import sys\n")
+		tool_file.write("open('calls.log', 'a').write(' '.join(sys.argv[1:]) + '\\n')\n")
+		tool_file.write("inputs = sys.argv[sys.argv.index('-i') + 1:sys.argv.index('-of')]\n")
+		tool_file.write("open(sys.argv[-1], 'w').write(''.join(open(in_file).read() for in_file in inputs))\n")
+	for ts_name in ["app_de.ts", "app_en.ts", "app_de_AT.ts", "pkg_de.ts", "pkg_en.ts"]:
+		with open(ts_name, "w") as ts_file:
+			ts_file.write(ts_name + "\n")
+
+	def l_run():
+		exec_qdep("lconvert", "--combine", "pkg_de.ts", "pkg_en.ts", "--outdir", "out", "--stamp", "out/stamp", "--ts-files", "app_de.ts", "app_en.ts", "app_de_AT.ts", "--", sys.executable, "fake_lconvert.py")
+		with open("calls.log", "r") as log_file:
+			return len(log_file.readlines())
+
+	assert l_run() == 3
+	with open("out/app_de.ts", "r") as out_file:
+		assert out_file.read() == "pkg_de.ts\napp_de.ts\n"
+	assert l_run() == 3
+
+	# only outputs with changed inputs are generated again
+	with open("pkg_en.ts", "w") as ts_file:
+		ts_file.write("changed\n")
+	assert l_run() == 4
+	exec_qdep("lconvert", "--combine", "pkg_de.ts", "pkg_en.ts", "--", "app_en.ts", "out/app_en.ts", sys.executable, "fake_lconvert.py")
+	assert l_run() == 4
+
+
+def test_tsmerge():
+	with open("pkg_de.ts", "w", encoding="UTF-8") as ts_file:
+		ts_file.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE TS>\n<TS version=\"2.1\" language=\"de_DE\">\n")
+		ts_file.write("<context>\n    <name>Pkg</name>\n")
+		ts_file.write("    <message>\n        <location filename=\"../src/pkg.cpp\" line=\"+12\"/>\n        <source>Hello &amp; &quot;World&quot;</source>\n        <translation>Hallo &amp; &quot;Welt&quot;</translation>\n    </message>\n")
+		ts_file.write("    <message numerus=\"yes\">\n        <location line=\"+3\"/>\n        <source>%n file(s)</source>\n        <comment>files</comment>\n        <translation type=\"unfinished\">\n            <numerusform>%n Datei</numerusform>\n        </translation>\n    </message>\n")
+		ts_file.write("    <message>\n        <location filename=\"../src/pkg.h\" line=\"+4\"/>\n        <source>Bell<byte value=\"x7\"/></source>\n        <translation variants=\"yes\">\n            <lengthvariant>Lang</lengthvariant>\n            <lengthvariant>Kurz</lengthvariant>\n        </translation>\n        <extra-po-flags>c-format</extra-po-flags>\n    </message>\n")
+		ts_file.write("    <message>\n        <source>Old</source>\n        <translation type=\"obsolete\"></translation>\n    </message>\n")
+		ts_file.write("</context>\n</TS>\n")
+	with open("app_de.ts", "w", encoding="UTF-8") as ts_file:
+		ts_file.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE TS>\n<TS version=\"2.1\" language=\"de\">\n")
+		ts_file.write("<context>\n    <name>MainWindow</name>\n")
+		ts_file.write("    <message>\n        <location filename=\"main.cpp\" line=\"+5\"/>\n        <location line=\"+2\"/>\n        <source>Quit</source>\n        <translation>Beenden</translation>\n    </message>\n")
+		ts_file.write("</context>\n<context>\n    <name>Pkg</name>\n")
+		ts_file.write("    <message>\n        <location filename=\"../src/pkg.cpp\" line=\"+12\"/>\n        <source>Hello &amp; &quot;World&quot;</source>\n        <translation>Servus</translation>\n    </message>\n")
+		ts_file.write("</context>\n<context>\n    <name>About</name>\n")
+		ts_file.write("    <message id=\"about_text\">\n        <location filename=\"about.cpp\" line=\"+1\"/>\n        <source>About</source>\n        <translation type=\"vanished\">Info</translation>\n    </message>\n")
+		ts_file.write("</context>\n</TS>\n")
+
+	# lconvert stays the default - the fake only writes a marker
+	exec_qdep("lconvert", "--combine", "pkg_de.ts", "--", "app_de.ts", "merged_de.ts", sys.executable, "-c", "import sys; open(sys.argv[-1], 'w').write('lconvert')", "-sort-contexts")
+	with open("merged_de.ts", "r", encoding="UTF-8") as out_file:
+		assert out_file.read() == "lconvert"
+
+	exec_qdep("lconvert", "--builtin", "--combine", "pkg_de.ts", "--", "app_de.ts", "merged_de.ts", "lconvert", "-sort-contexts")
+	with open("merged_de.ts", "r", encoding="UTF-8") as out_file:
+		merged = out_file.read()
+	assert merged.startswith("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<!DOCTYPE TS>\n<TS version=\"2.1\" language=\"de_DE\">\n<context>\n    <name>About</name>\n")
+	assert merged.index("<name>About</name>") < merged.index("<name>MainWindow</name>") < merged.index("<name>Pkg</name>")
+	assert "<translation>Servus</translation>" in merged and "Hallo" not in merged
+	assert "<source>Old</source>" not in merged
+	assert "            <numerusform>%n Datei</numerusform>\n            <numerusform></numerusform>\n        </translation>" in merged
+	assert "<source>Bell<byte value=\"x7\"/></source>" in merged
+	assert "        <extra-po-flags>c-format</extra-po-flags>\n" in merged
+	tree = ET.parse("merged_de.ts")
+	assert len(tree.findall("context/message")) == 5
+
+	# compare with the real lconvert, if qmake and lconvert are available
+	lconvert_tool = None
+	if shutil.which(qmake_path) is not None:
+		try:
+			qt_bins, _e = exec_qmake("-query", "QT_INSTALL_BINS", keep_stdout=True)
+			lconvert_tool = shutil.which("lconvert", path=qt_bins.strip())
+		except subprocess.CalledProcessError:
+			pass
+	if lconvert_tool is None:
+		print("lconvert not found - skipping the comparison with the builtin merge")
+	else:
+		exec_qdep("lconvert", "--combine", "pkg_de.ts", "--", "app_de.ts", "external_de.ts", lconvert_tool, "-sort-contexts")
+		with open("external_de.ts", "r", encoding="UTF-8") as out_file:
+			assert out_file.read() == merged
+
+
+def test_trace():
+	os.environ["QDEP_TRACE"] = "trace.jsonl"
+	try:
+		exec_qdep("dephash", "Skycoder42/qdep")
+		open("in.ts", "w").close()
+		exec_qdep("lconvert", "--combine", "--", "in.ts", "out.ts", sys.executable, "-c", "import sys; open(sys.argv[-1], 'w').close()")
+	finally:
+		os.environ.pop("QDEP_TRACE")
+	with open("trace.jsonl", "r") as trace_file:
+		spans = [json.loads(line) for line in trace_file]
+	assert [span["name"] for span in spans if span["cat"] == "command"] == ["dephash", "lconvert"]
+	assert any(span["cat"] == "subprocess" and span["args"]["code"] == 0 for span in spans)
+
+	sout, _e = exec_qdep("trace", "report", "--chrome", "chrome.json", "trace.jsonl", keep_stdout=True)
+	assert "dephash" in sout and "lconvert" in sout
+	with open("chrome.json", "r") as chrome_file:
+		events = json.load(chrome_file)["traceEvents"]
+	assert len(events) == len(spans) and all(event["ph"] == "X" for event in events)
+
+
 def test_update():
 	def u_run(*args, strip_eval=False):
 		sout, _e = exec_qdep("update", "--qmake", qmake_path, "--make", make_path, *args, keep_stdout=strip_eval)
@@ -343,5 +755,16 @@ if __name__ == '__main__':
 	test_run("versions", test_versions)
 	test_run("query", test_query)
 	test_run("get", test_get)
+	test_run("extract", test_extract)
+	test_run("proparser", test_proparser)
+	test_run("resolvetree", test_resolvetree)
+	test_run("knownversion", test_knownversion)
+	test_run("gc", test_gc)
+	test_run("frozen", test_frozen)
+	test_run("archive", test_archive)
+	test_run("hooks", test_hooks)
+	test_run("lconvert", test_lconvert)
+	test_run("tsmerge", test_tsmerge)
+	test_run("trace", test_trace)
 	test_run("update", test_update)
 	test_run("clear", test_clear)
@@ -1,7 +1,7 @@
 @echo off
 
 :: install dependencies
-C:\Python37-x64\Scripts\pip.exe install appdirs lockfile argcomplete setuptools || exit /B 1
+C:\Python37-x64\Scripts\pip.exe install appdirs argcomplete setuptools || exit /B 1
 C:\Python37-x64\Scripts\pip.exe uninstall -y qdep || exit /B 1
 
 :: install/prepare qdep
@@ -2,7 +2,7 @@
 set -e
 
 # install dependencies
-$SUDO pip3 install appdirs lockfile argcomplete setuptools
+$SUDO pip3 install appdirs argcomplete setuptools
 $SUDO pip3 uninstall -y qdep
 
 # install/prepare qdep